@@ -60,6 +60,7 @@ setup_args = dict(
     # Optional requirements
     extras_require={
         'test': ['nose', 'coverage', 'pytest', 'pytest-asyncio'],
+        'simulate': ['numpy'],
     },
 
 
@@ -4,6 +4,7 @@ Python package for asyncio task throttling
 __license__ = "MIT"
 __version__ = "0.1.1"
 
-from .async_throttler import AsyncThrottler, RateAsyncThrottler, ConcurrencyAsyncThrottler  # noqa: F401
-from .timer import Timer  # noqa: F401
-from .util import TaskSpacer, DummySpacer  # noqa: F401
+from .async_throttler import AsyncThrottler, RateAsyncThrottler, ConcurrencyAsyncThrottler, CompositeAsyncThrottler, KeyedThrottler, simulate  # noqa: F401
+from .sync_throttler import RateThrottler, ConcurrencyThrottler  # noqa: F401
+from .timer import Timer, TaskTimer  # noqa: F401
+from .util import TaskSpacer, DummySpacer, TimerScheduler, Clock, VirtualClock  # noqa: F401
@@ -10,6 +10,7 @@ from ..util.dummy_spacer import DummySpacer
 from ..util.task_spacer import TaskSpacer
 from .throttler_rate import RateAsyncThrottler
 from .throttler_concurrency import ConcurrencyAsyncThrottler
+from .throttler_composite import CompositeAsyncThrottler
 
 
 class AsyncThrottler:
@@ -30,7 +31,16 @@ class AsyncThrottler:
         c = concurrency_limit is not None
         s = task_space is not None
         if r + c + s > 1:
-            raise ThrottlerInvArg("rate/concurrency/space are not compatible")
+
+            if align is not None:
+                raise ThrottlerInvArg("align not supported for CompositeThrottler")
+            return CompositeAsyncThrottler(rate_limit, period=period,
+                                           max_queue=max_queue, max_wait=max_wait,
+                                           burst=burst,
+                                           concurrency_limit=concurrency_limit,
+                                           timeout=timeout, task_space=task_space,
+                                           **kwargs)
+
         elif r + c + s == 0:
             raise ThrottlerInvArg("need one of rate or concurrency or space")
         elif r:
@@ -66,3 +76,7 @@ class AsyncThrottler:
                                                  timeout=timeout, **kwargs)
             else:
                 return TaskSpacer(task_space, align=align, **kwargs)
+
+
+from .throttler_keyed import KeyedThrottler  # noqa: E402
+from .simulator import simulate  # noqa: E402,F401
@@ -0,0 +1,167 @@
+"""
+Algorithms to adapt a concurrency limit to the observed latency of tasks.
+
+All algorithms share the same interface: `update(latency, in_flight, drop)`
+is called when a task finishes, and returns the new concurrency limit.
+ * `latency` is the execution time of the task (seconds)
+ * `in_flight` is the number of tasks being executed when it finished
+ * `drop` tells if the task was a timeout (a sign of overload)
+
+Available algorithms:
+ * aimd: additive increase, multiplicative decrease. The limit grows by one
+   for each task that finishes below a latency threshold while the limit is
+   being used, and is multiplied by a backoff factor when a task goes over
+   the threshold or is dropped
+ * gradient: the limit follows the ratio between a long-term average latency
+   and the short-term latency (a gradient-style algorithm similar to TCP
+   Vegas): when latency rises over the baseline the limit shrinks, and when
+   it is at or below the baseline the limit grows by a queue allowance. A
+   drop halves the limit
+"""
+
+from math import sqrt
+
+from typing import Union
+
+from ..util.exception import ThrottlerInvArg
+
+
+class AdaptiveLimit:
+    """
+    Base class for adaptive concurrency limits
+    """
+    __slots__ = ('min_limit', 'max_limit', '_limit')
+
+    def __init__(self, min_limit: int = 1, max_limit: int = 1000,
+                 initial: int = None):
+        """
+          :param min_limit: minimum value of the limit
+          :param max_limit: maximum value of the limit
+          :param initial: initial value of the limit
+        """
+        if not (isinstance(min_limit, int) and isinstance(max_limit, int)
+                and 0 < min_limit <= max_limit):
+            raise ThrottlerInvArg('limits must be positive integers with `min_limit` <= `max_limit`')
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self._limit = float(self._clamp(initial or max_limit))
+
+
+    def _clamp(self, value: float) -> float:
+        return min(max(value, self.min_limit), self.max_limit)
+
+
+    @property
+    def limit(self) -> int:
+        """
+        Current value of the limit
+        """
+        return int(self._limit)
+
+
+    def update(self, latency: float, in_flight: int, drop: bool = False) -> int:
+        raise NotImplementedError
+
+
+class AIMDLimit(AdaptiveLimit):
+    """
+    Additive increase, multiplicative decrease
+    """
+    __slots__ = ('threshold', 'backoff')
+
+    def __init__(self, min_limit: int = 1, max_limit: int = 1000,
+                 initial: int = None, threshold: float = 1.0,
+                 backoff: float = 0.9):
+        """
+          :param threshold: latency (seconds) above which the limit is reduced
+          :param backoff: factor to apply to the limit when reducing it
+        """
+        super().__init__(min_limit, max_limit, initial)
+        if not 0 < backoff < 1:
+            raise ThrottlerInvArg('`backoff` must be between 0 and 1')
+        self.threshold = threshold
+        self.backoff = backoff
+
+
+    def update(self, latency: float, in_flight: int, drop: bool = False) -> int:
+        if drop or latency > self.threshold:
+            self._limit = self._clamp(self._limit*self.backoff)
+        elif 2*in_flight >= self._limit:
+            # Grow only if the limit is actually being used
+            self._limit = self._clamp(self._limit + 1)
+        return int(self._limit)
+
+
+class GradientLimit(AdaptiveLimit):
+    """
+    Gradient-based limit: compare the short-term latency with a long-term
+    baseline, and move the limit in proportion to their ratio
+    """
+    __slots__ = ('tolerance', 'smoothing', '_alpha', '_long')
+
+    def __init__(self, min_limit: int = 1, max_limit: int = 1000,
+                 initial: int = None, tolerance: float = 1.5,
+                 smoothing: float = 0.2, window: int = 600):
+        """
+          :param tolerance: latency increase over the baseline that is
+            tolerated before reducing the limit
+          :param smoothing: weight of each new limit estimation
+          :param window: number of samples in the long-term latency average
+        """
+        super().__init__(min_limit, max_limit, initial)
+        self.tolerance = tolerance
+        self.smoothing = smoothing
+        self._alpha = 2.0/(window + 1)
+        self._long = None
+
+
+    def update(self, latency: float, in_flight: int, drop: bool = False) -> int:
+        # A drop halves the limit right away (its latency is not meaningful)
+        if drop:
+            self._limit = self._clamp(self._limit/2)
+            return int(self._limit)
+
+        if self._long is None:
+            self._long = latency
+        else:
+            self._long += self._alpha*(latency - self._long)
+            # If the baseline is well above current latency (we are recovering
+            # from overload), let it decay faster
+            if self._long > 2*latency:
+                self._long *= 0.95
+
+        # Don't grow the limit if it is not being used
+        if 2*in_flight < self._limit:
+            return int(self._limit)
+
+        if latency > 0:
+            gradient = max(0.5, min(1.0, self.tolerance*self._long/latency))
+        else:
+            gradient = 1.0
+        new = self._limit*gradient + sqrt(self._limit)
+        self._limit = self._clamp(self._limit*(1 - self.smoothing) + new*self.smoothing)
+        return int(self._limit)
+
+
+# ----------------------------------------------------------------------
+
+
+ADAPTIVE = {
+    'aimd': AIMDLimit,
+    'gradient': GradientLimit
+}
+
+
+def adaptive_limit(spec: Union[str, AdaptiveLimit],
+                   concurrency_limit: int) -> AdaptiveLimit:
+    """
+    Create an adaptive limit from a name (which will use `concurrency_limit` as
+    its initial and maximum values), or check an already created object
+    """
+    if isinstance(spec, AdaptiveLimit):
+        return spec
+    cls = ADAPTIVE.get(spec)
+    if cls is None:
+        raise ThrottlerInvArg('`adaptive` must be one of: ' + ', '.join(ADAPTIVE) +
+                              ', or an AdaptiveLimit object')
+    return cls(1, concurrency_limit)
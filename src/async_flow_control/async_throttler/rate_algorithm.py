@@ -0,0 +1,446 @@
+"""
+Algorithms deciding when a process can be granted access in a rate throttler.
+
+All algorithms share the same interface:
+ * `next_grant(now, cost)` computes the earliest timestamp at which a process
+   consuming `cost` rate units can be granted access. It does not modify the
+   algorithm state
+ * `commit(ts, cost)` records a grant at timestamp `ts`
+ * `try_grant(now, cost)` commits a grant at `now` if it is allowed
+ * `shift(delta)` moves the algorithm state forward in time, so that pending
+   grants are delayed by `delta`
+ * `set_rate_factor(factor)` scales the rate by a factor (relative to the
+   configured rate), by scaling the period
+ * `settled(now)` tells if the state is equivalent to that of a new object,
+   i.e. if past grants no longer have any effect
+
+Grants are expected to be committed in non-decreasing timestamp order. In
+reservation mode the committed timestamps can be in the future.
+
+Several algorithms (one per rate tier) can be combined with
+`MultiRateAlgorithm`, which grants access only when all of them allow it.
+
+An algorithm can be wrapped in `LockedAlgorithm` to make it thread-safe.
+
+Available algorithms:
+ * spacing: processes are evenly spaced, with an optional burst capacity
+ * fixed_window: up to `rate_limit` units are granted in each `period`, with
+   windows anchored at the first grant
+ * sliding_window: sliding-window counter, which estimates the number of
+   units in the last `period` by weighting the count of the previous fixed
+   window
+ * sliding_log: exact sliding window, keeping a log of the last `rate_limit`
+   grant timestamps in an array-backed ring buffer
+"""
+
+import threading
+from array import array
+from math import ceil, floor
+
+from typing import List, Sequence, Tuple, Union
+
+from ..util.exception import ThrottlerInvArg
+
+
+class RateAlgorithm:
+    """
+    Base class for rate algorithms
+    """
+    __slots__ = ('_limit', '_period', '_base')
+
+    def __init__(self, rate_limit: int, period: float):
+        self._limit = rate_limit
+        self._period = self._base = period
+
+    def next_grant(self, now: float, cost: float = 1) -> float:
+        raise NotImplementedError
+
+    def commit(self, ts: float, cost: float = 1):
+        raise NotImplementedError
+
+    def shift(self, delta: float):
+        raise NotImplementedError
+
+    def settled(self, now: float) -> bool:
+        raise NotImplementedError
+
+    def set_rate_factor(self, factor: float):
+        """
+        Set the effective rate to `factor` times the configured rate
+        """
+        self._period = self._base/factor
+
+    def reserve(self, now: float, cost: float = 1) -> float:
+        """
+        Compute the next grant timestamp and commit it
+        """
+        ts = self.next_grant(now, cost)
+        self.commit(ts, cost)
+        return ts
+
+    def try_grant(self, now: float, cost: float = 1) -> bool:
+        """
+        Commit a grant now, if it is allowed
+        """
+        if self.next_grant(now, cost) > now:
+            return False
+        self.commit(now, cost)
+        return True
+
+
+class SpacingAlgorithm(RateAlgorithm):
+    """
+    Even spacing of processes, with burst capacity that is recovered by
+    unused time slots
+    """
+    __slots__ = ('_wait', '_max_burst', '_curr', '_burst', '_margin')
+
+    def __init__(self, rate_limit: int, period: float, burst: int = None):
+        super().__init__(rate_limit, period)
+        self._wait = period/rate_limit
+        self._max_burst = burst or 0
+        self._init_state()
+
+
+    def _init_state(self):
+        # Timestamp at which the next time slot is available, i.e. the last
+        # granted access plus the time it has consumed
+        self._curr = 0.0
+        # Allowed burst capacity
+        self._burst = self._max_burst
+        # Accumulated margin to be used for bursts
+        self._margin = 0.0
+
+
+    def next_grant(self, now: float, cost: float = 1) -> float:
+        # Is the next time slot already available?
+        if self._curr <= now:
+            return now
+        # No room. See if we can get an option from the burst capacity, as
+        # long as the booked slots do not go beyond it
+        if self._burst >= cost and self._curr - now <= self._burst*self._wait:
+            return now
+        # We'll have to wait
+        return self._curr
+
+
+    def commit(self, ts: float, cost: float = 1):
+        gap = ts - self._curr
+        if gap >= 0:
+            # Unused time: see if we can recover some lost burst capacity
+            if self._max_burst and self._burst < self._max_burst:
+                self._margin += gap
+                extra = int(self._margin/self._wait)
+                if extra:
+                    self._burst = min(self._burst + extra, self._max_burst)
+                    self._margin = max(self._margin - extra*self._wait, 0)
+            self._curr = ts + cost*self._wait
+        else:
+            # Granted before the time slot: it used burst capacity. The next
+            # slot never moves back, since it may have been reserved already
+            self._burst -= cost
+            self._curr = max(self._curr, ts + cost*self._wait)
+
+
+    def shift(self, delta: float):
+        self._curr += delta
+
+
+    def settled(self, now: float) -> bool:
+        # The next slot is free, and the next grant would recover all burst
+        return (now - self._curr >=
+                (self._max_burst - self._burst)*self._wait - self._margin)
+
+
+    def set_rate_factor(self, factor: float):
+        super().set_rate_factor(factor)
+        self._wait = self._period/self._limit
+
+
+class FixedWindowAlgorithm(RateAlgorithm):
+    """
+    Fixed window counter. Windows are anchored at the first grant.
+    A cost above the rate limit is clamped to the rate limit.
+    """
+    __slots__ = ('_win', '_count')
+
+    def __init__(self, rate_limit: int, period: float):
+        super().__init__(rate_limit, period)
+        # Start of the current window, and units granted in it
+        self._win = None
+        self._count = 0
+
+
+    def next_grant(self, now: float, cost: float = 1) -> float:
+        if self._win is None or now >= self._win + self._period:
+            return now
+        if self._count + min(cost, self._limit) <= self._limit:
+            return max(now, self._win)
+        return self._win + self._period
+
+
+    def commit(self, ts: float, cost: float = 1):
+        if self._win is None:
+            self._win = ts
+            self._count = 0
+        elif ts >= self._win + self._period:
+            self._win += floor((ts - self._win)/self._period)*self._period
+            self._count = 0
+        self._count += min(cost, self._limit)
+
+
+    def shift(self, delta: float):
+        if self._win is not None:
+            self._win += delta
+
+
+    def settled(self, now: float) -> bool:
+        return self._win is None or now >= self._win + self._period
+
+
+class SlidingWindowAlgorithm(RateAlgorithm):
+    """
+    Sliding window counter. The number of units in the sliding window is
+    estimated as the count in the current fixed window plus the count in the
+    previous window weighted by its overlap with the sliding window.
+    A cost above the rate limit is clamped to the rate limit.
+    """
+    __slots__ = ('_win', '_prev', '_count')
+
+    def __init__(self, rate_limit: int, period: float):
+        super().__init__(rate_limit, period)
+        # Start of the current window, and units granted in the previous and
+        # the current windows
+        self._win = None
+        self._prev = 0
+        self._count = 0
+
+
+    def _roll(self, ts: float):
+        """
+        Return the state (start, previous count, current count) of the window
+        containing a timestamp
+        """
+        win, prev, count = self._win, self._prev, self._count
+        if ts >= win + self._period:
+            k = floor((ts - win)/self._period)
+            prev = count if k == 1 else 0
+            count = 0
+            win += k*self._period
+        return win, prev, count
+
+
+    def next_grant(self, now: float, cost: float = 1) -> float:
+        if self._win is None:
+            return now
+        cost = min(cost, self._limit)
+        period = self._period
+        # Grants are never placed before the current window
+        ts = max(now, self._win)
+        win, prev, count = self._roll(ts)
+
+        # Can it fit in this window?
+        if count + cost <= self._limit:
+            if prev:
+                ts = max(ts, win + period*(1 - (self._limit - count - cost)/prev))
+            if ts < win + period:
+                return ts
+
+        # No, go to the next one
+        win += period
+        if not count:
+            return win
+        return win + period*max(1 - (self._limit - cost)/count, 0)
+
+
+    def commit(self, ts: float, cost: float = 1):
+        if self._win is None:
+            self._win = ts
+        self._win, self._prev, self._count = self._roll(ts)
+        self._count += min(cost, self._limit)
+
+
+    def shift(self, delta: float):
+        if self._win is not None:
+            self._win += delta
+
+
+    def settled(self, now: float) -> bool:
+        # The current window also weights in the next one
+        return self._win is None or now >= self._win + 2*self._period
+
+
+class SlidingLogAlgorithm(RateAlgorithm):
+    """
+    Exact sliding window. The timestamps of the last `rate_limit` granted units
+    are kept in a ring buffer, so memory is bounded by `rate_limit` (8 bytes
+    per unit). Costs are rounded up to an integer number of units, and a cost
+    above the rate limit is clamped to the rate limit.
+    """
+    __slots__ = ('_log', '_idx', '_size')
+
+    def __init__(self, rate_limit: int, period: float):
+        super().__init__(rate_limit, period)
+        # The ring buffer, its next write position and its used size
+        self._log = array('d', bytes(8*rate_limit))
+        self._idx = 0
+        self._size = 0
+
+
+    def next_grant(self, now: float, cost: float = 1) -> float:
+        # After granting `cost` units, at most `rate_limit` units can be in
+        # the window. So the k-th most recent unit must be out of the window
+        k = self._limit - min(ceil(cost), self._limit) + 1
+        if self._size < k:
+            return now
+        return max(now, self._log[(self._idx - k) % self._limit] + self._period)
+
+
+    def commit(self, ts: float, cost: float = 1):
+        n = min(ceil(cost), self._limit)
+        log, idx, limit = self._log, self._idx, self._limit
+        for _ in range(n):
+            log[idx] = ts
+            idx += 1
+            if idx == limit:
+                idx = 0
+        self._idx = idx
+        self._size = min(self._size + n, limit)
+
+
+    def shift(self, delta: float):
+        # Used positions are always the first `size` ones
+        log = self._log
+        for n in range(self._size):
+            log[n] += delta
+
+
+    def settled(self, now: float) -> bool:
+        return (not self._size or
+                now >= self._log[(self._idx - 1) % self._limit] + self._period)
+
+
+class MultiRateAlgorithm(RateAlgorithm):
+    """
+    Combination of several rate tiers, each one with its own algorithm. The
+    grant time is the latest of the grant times for all tiers, computed in
+    one pass. The `binding` attribute holds the index of the tier that
+    determined the last computed grant time (None if no tier delayed it)
+    """
+    __slots__ = ('_tiers', 'binding')
+
+    def __init__(self, tiers: List[RateAlgorithm]):
+        self._tiers = tiers
+        self.binding = None
+
+
+    def next_grant(self, now: float, cost: float = 1) -> float:
+        ts, binding = now, None
+        for n, tier in enumerate(self._tiers):
+            t = tier.next_grant(now, cost)
+            if t > ts:
+                ts, binding = t, n
+        self.binding = binding
+        return ts
+
+
+    def commit(self, ts: float, cost: float = 1):
+        for tier in self._tiers:
+            tier.commit(ts, cost)
+
+
+    def shift(self, delta: float):
+        for tier in self._tiers:
+            tier.shift(delta)
+
+
+    def settled(self, now: float) -> bool:
+        return all(tier.settled(now) for tier in self._tiers)
+
+
+    def set_rate_factor(self, factor: float):
+        for tier in self._tiers:
+            tier.set_rate_factor(factor)
+
+
+    @property
+    def binding_tier(self) -> Tuple[int, float]:
+        """
+        The (rate_limit, period) tier that determined the last grant time
+        """
+        if self.binding is None:
+            return None
+        tier = self._tiers[self.binding]
+        return tier._limit, tier._base
+
+
+class LockedAlgorithm(RateAlgorithm):
+    """
+    Wrapper that serializes the calls to an algorithm with a thread lock, so
+    that it can be used from several threads (e.g. from event loops running
+    in different threads)
+    """
+    __slots__ = ('algo', '_mutex')
+
+    def __init__(self, algo: RateAlgorithm):
+        self.algo = algo
+        self._mutex = threading.Lock()
+
+
+    def next_grant(self, now: float, cost: float = 1) -> float:
+        with self._mutex:
+            return self.algo.next_grant(now, cost)
+
+    def commit(self, ts: float, cost: float = 1):
+        with self._mutex:
+            self.algo.commit(ts, cost)
+
+    def reserve(self, now: float, cost: float = 1) -> float:
+        with self._mutex:
+            return self.algo.reserve(now, cost)
+
+    def try_grant(self, now: float, cost: float = 1) -> bool:
+        with self._mutex:
+            return self.algo.try_grant(now, cost)
+
+    def shift(self, delta: float):
+        with self._mutex:
+            self.algo.shift(delta)
+
+    def settled(self, now: float) -> bool:
+        with self._mutex:
+            return self.algo.settled(now)
+
+    def set_rate_factor(self, factor: float):
+        with self._mutex:
+            self.algo.set_rate_factor(factor)
+
+
+# ----------------------------------------------------------------------
+
+
+ALGORITHMS = {
+    'spacing': SpacingAlgorithm,
+    'fixed_window': FixedWindowAlgorithm,
+    'sliding_window': SlidingWindowAlgorithm,
+    'sliding_log': SlidingLogAlgorithm
+}
+
+
+def rate_algorithm(name: str, rate_limit: Union[int, Sequence[Tuple[int, float]]],
+                   period: float, burst: int = None) -> RateAlgorithm:
+    """
+    Instantiate a rate algorithm by name. If `rate_limit` is a list of
+    (rate, period) tiers, a combined algorithm is returned
+    """
+    if not isinstance(rate_limit, int):
+        tiers = [rate_algorithm(name, r, float(p), burst) for r, p in rate_limit]
+        return tiers[0] if len(tiers) == 1 else MultiRateAlgorithm(tiers)
+    cls = ALGORITHMS.get(name)
+    if cls is None:
+        raise ThrottlerInvArg('`algorithm` must be one of: ' + ', '.join(ALGORITHMS))
+    if cls is SpacingAlgorithm:
+        return cls(rate_limit, period, burst)
+    if burst is not None:
+        raise ThrottlerInvArg('`burst` is only supported by the spacing algorithm')
+    return cls(rate_limit, period)
@@ -0,0 +1,81 @@
+"""
+Adaptation of the rate of a throttler to the outcomes reported by the
+processes it lets through.
+
+The rate is expressed as a factor over the configured rate, in the range
+[min_factor, 1]:
+ * a "throttled" outcome (e.g. an HTTP 429 response) multiplies the factor
+   by `decrease`
+ * an "error" outcome (e.g. a 503 response or a connection error) multiplies
+   it by `error_decrease`
+ * a "success" outcome makes it grow additively, in proportion to the time
+   the process consumes at the configured rate. A stream of successful
+   processes using all the available rate increases it by a `probe` fraction
+   per second
+
+Processes that were already in flight when the upstream service started to
+complain will report the same outcome, so decreases are applied at most once
+per `cooldown` seconds.
+"""
+
+from ..util.exception import ThrottlerInvArg
+
+
+OUTCOMES = ('success', 'throttled', 'error')
+
+
+class RateFeedback:
+    """
+    Multiplicative decrease, additive increase of a rate factor
+    """
+    __slots__ = ('decrease', 'error_decrease', 'probe', 'min_factor',
+                 'cooldown', 'factor', '_last')
+
+    def __init__(self, decrease: float = 0.5, error_decrease: float = 0.9,
+                 probe: float = 0.1, min_factor: float = 0.01,
+                 cooldown: float = 1.0):
+        """
+          :param decrease: factor to apply to the rate on a throttled outcome
+          :param error_decrease: factor to apply to the rate on an error outcome
+          :param probe: relative rate increase per second of successful
+            processes
+          :param min_factor: minimum rate, as a fraction of the configured rate
+          :param cooldown: minimum time (seconds) between two decreases
+        """
+        for name, value in (('decrease', decrease), ('error_decrease', error_decrease),
+                            ('min_factor', min_factor)):
+            if not (isinstance(value, (int, float)) and 0 < value < 1):
+                raise ThrottlerInvArg(f'`{name}` must be between 0 and 1')
+        if not (isinstance(probe, (int, float)) and probe > 0):
+            raise ThrottlerInvArg('`probe` must be a positive value')
+        if not (isinstance(cooldown, (int, float)) and cooldown >= 0):
+            raise ThrottlerInvArg('`cooldown` must be a non-negative value')
+        self.decrease = decrease
+        self.error_decrease = error_decrease
+        self.probe = probe
+        self.min_factor = min_factor
+        self.cooldown = cooldown
+        # Current rate factor, and timestamp of the last decrease
+        self.factor = 1.0
+        self._last = None
+
+
+    def update(self, outcome: str, now: float, wait: float) -> float:
+        """
+        Update the rate factor with an outcome
+          :param outcome: one of "success", "throttled" or "error"
+          :param now: current timestamp
+          :param wait: time consumed by the process at the configured rate
+          :return: the new rate factor
+        """
+        if outcome == 'success':
+            if self.factor < 1.0:
+                self.factor = min(self.factor + self.probe*wait, 1.0)
+        elif outcome in OUTCOMES:
+            if self._last is None or now - self._last >= self.cooldown:
+                self._last = now
+                decrease = self.decrease if outcome == 'throttled' else self.error_decrease
+                self.factor = max(self.factor*decrease, self.min_factor)
+        else:
+            raise ThrottlerInvArg('`outcome` must be one of: ' + ', '.join(OUTCOMES))
+        return self.factor
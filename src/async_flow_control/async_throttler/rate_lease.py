@@ -0,0 +1,155 @@
+"""
+Leasing of rate tokens from a central store (see the `rate_store` module), to
+enforce a rate limit across several nodes.
+
+Instead of doing a round trip to the store for each process, a `TokenLease`
+takes blocks of `size` tokens from the store and spends them locally, one per
+rate unit consumed. A new block is requested only when the local tokens run
+out, so the number of round trips is the number of processes divided by the
+lease size. Only one request to the store is in flight at any time; processes
+arriving while it is pending wait for it.
+
+Leased tokens not spent within `ttl` seconds are returned to the store, so
+that other nodes can use them (a node going idle does not hold on to its
+part of the quota). They are also returned when the lease is closed.
+"""
+
+import asyncio
+import math
+import time
+
+from typing import Hashable
+
+from ..util.exception import ThrottlerInvArg
+from ..util.semaphore import AdjustableSemaphore
+from .rate_store import RateStore
+
+
+class TokenLease:
+    """
+    Local pool of tokens leased from a rate store
+    """
+    __slots__ = ('store', 'key', 'size', 'ttl', '_wait', '_capacity',
+                 '_tokens', '_expires', '_handle', '_lock', '_returns')
+
+    def __init__(self, store: RateStore, key: Hashable, size: int = 10,
+                 ttl: float = 1.0):
+        """
+          :param store: the store holding the global quota
+          :param key: key of the quota in the store
+          :param size: number of tokens requested in each lease
+          :param ttl: time (seconds) after which unused leased tokens are
+            returned to the store
+        """
+        if not isinstance(store, RateStore):
+            raise ThrottlerInvArg('`store` must be a RateStore object')
+        if not (isinstance(size, int) and size > 0):
+            raise ThrottlerInvArg('`size` must be a positive integer')
+        if not (isinstance(ttl, (int, float)) and ttl > 0):
+            raise ThrottlerInvArg('`ttl` must be a positive value')
+        self.store = store
+        self.key = key
+        self.size = size
+        self.ttl = ttl
+        # Bucket parameters, set by the throttler through `bind()`
+        self._wait = None
+        self._capacity = None
+        # Local tokens, and expiration time of the current lease
+        self._tokens = 0.0
+        self._expires = 0.0
+        self._handle = None
+        self._lock = AdjustableSemaphore(1)
+        # Pending tasks returning tokens to the store
+        self._returns = set()
+
+
+    def bind(self, wait: float, burst: int = None):
+        """
+        Set the rate of the global quota
+          :param wait: refill time for one token (seconds)
+          :param burst: number of processes that can be granted access over
+            the rate limit
+        """
+        self._wait = wait
+        # The bucket must be able to hold a full lease
+        self._capacity = max(self.size, 1 + (burst or 0))
+
+
+    @property
+    def tokens(self) -> float:
+        """
+        Number of leased tokens available locally
+        """
+        return self._tokens
+
+
+    def try_take(self, cost: float) -> bool:
+        """
+        Spend local tokens, if there are enough
+        """
+        if self._tokens < cost:
+            return False
+        self._tokens -= cost
+        return True
+
+
+    async def take(self, cost: float):
+        """
+        Spend local tokens, leasing more from the store if needed
+        """
+        while self._tokens < cost:
+            async with self._lock:
+                # Another process may have renewed the lease meanwhile
+                if self._tokens >= cost:
+                    break
+                count = max(self.size, math.ceil(cost - self._tokens))
+                granted, retry = await self.store.lease(self.key, count,
+                                                        self._wait, self._capacity)
+                if granted:
+                    self._add(granted)
+                else:
+                    await asyncio.sleep(retry)
+        self._tokens -= cost
+
+
+    def _add(self, granted: int):
+        """
+        Add leased tokens, and (re)schedule their return to the store
+        """
+        self._tokens += granted
+        self._expires = time.monotonic() + self.ttl
+        if self._handle is None:
+            self._handle = asyncio.get_running_loop().call_later(self.ttl, self._expire)
+
+
+    def _expire(self):
+        """
+        Timer callback: return the unused tokens of an expired lease
+        """
+        self._handle = None
+        left = self._expires - time.monotonic()
+        if left > 0:
+            # The lease was renewed: check again when it expires
+            self._handle = asyncio.get_running_loop().call_later(left, self._expire)
+            return
+        count = int(self._tokens)
+        if count > 0:
+            self._tokens -= count
+            task = asyncio.ensure_future(self.store.release(self.key, count))
+            self._returns.add(task)
+            task.add_done_callback(self._returns.discard)
+
+
+    async def close(self):
+        """
+        Return all unused tokens to the store
+        """
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        if self._returns:
+            await asyncio.gather(*self._returns, return_exceptions=True)
+        count = int(self._tokens)
+        if count > 0:
+            self._tokens -= count
+            await self.store.release(self.key, count)
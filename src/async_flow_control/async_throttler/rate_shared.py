@@ -0,0 +1,115 @@
+"""
+Spacing algorithm whose state is kept in a shared memory segment, so that
+all processes in a host using the same segment name share a single rate
+quota.
+
+The state of the algorithm (next free slot, burst capacity and burst margin)
+is stored in the segment, together with the configuration (slot time and
+maximum burst) of the process that created it; processes attaching to the
+segment must use the same configuration. Every operation is done while
+holding the inter-process lock of the segment, so grants are atomic across
+processes. Since the state is shared, grants must be computed and committed
+in one operation: the throttler uses reservation mode and the
+`try_grant()`/`reserve()` methods.
+
+Timestamps are `time.monotonic()` values, which are system-wide.
+"""
+
+from ..util.exception import ThrottlerInvArg
+from ..util.shared import SharedSegment
+from .rate_algorithm import SpacingAlgorithm
+
+
+# Positions in the segment
+_WAIT, _MAX_BURST, _CURR, _BURST, _MARGIN = range(5)
+
+
+class SharedSpacingAlgorithm(SpacingAlgorithm):
+    """
+    Spacing algorithm with state in shared memory
+    """
+    __slots__ = ('_seg', '_val')
+
+    def __init__(self, rate_limit: int, period: float, burst: int = None,
+                 name: str = None):
+        """
+          :param name: name of the shared segment
+        """
+        self._seg = SharedSegment(name, 5)
+        self._val = self._seg.values
+        try:
+            super().__init__(rate_limit, period, burst)
+        except BaseException:
+            self.close()
+            raise
+
+
+    def _init_state(self):
+        # The first process initializes the segment; the rest check it
+        with self._seg:
+            val = self._val
+            if not val[_WAIT]:
+                val[_WAIT] = self._wait
+                val[_MAX_BURST] = self._max_burst
+                val[_BURST] = self._max_burst
+            elif val[_WAIT] != self._wait or val[_MAX_BURST] != self._max_burst:
+                raise ThrottlerInvArg(f'shared segment `{self._seg.name}` has a different rate configuration')
+
+
+    # The algorithm state is read from and written to the segment
+    @property
+    def _curr(self) -> float:
+        return self._val[_CURR]
+
+    @_curr.setter
+    def _curr(self, value: float):
+        self._val[_CURR] = value
+
+    @property
+    def _burst(self) -> float:
+        return self._val[_BURST]
+
+    @_burst.setter
+    def _burst(self, value: float):
+        self._val[_BURST] = value
+
+    @property
+    def _margin(self) -> float:
+        return self._val[_MARGIN]
+
+    @_margin.setter
+    def _margin(self, value: float):
+        self._val[_MARGIN] = value
+
+
+    def next_grant(self, now: float, cost: float = 1) -> float:
+        with self._seg:
+            return super().next_grant(now, cost)
+
+    def commit(self, ts: float, cost: float = 1):
+        with self._seg:
+            super().commit(ts, cost)
+
+    def reserve(self, now: float, cost: float = 1) -> float:
+        with self._seg:
+            return super().reserve(now, cost)
+
+    def try_grant(self, now: float, cost: float = 1) -> bool:
+        with self._seg:
+            return super().try_grant(now, cost)
+
+    def shift(self, delta: float):
+        with self._seg:
+            super().shift(delta)
+
+    def settled(self, now: float) -> bool:
+        with self._seg:
+            return super().settled(now)
+
+
+    def close(self):
+        """
+        Detach from the shared segment
+        """
+        self._val = None
+        self._seg.close()
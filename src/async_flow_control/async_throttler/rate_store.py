@@ -0,0 +1,262 @@
+"""
+Central stores holding rate quotas shared by several nodes, from which
+throttlers lease blocks of tokens (see the `rate_lease` module).
+
+A store keeps one token bucket per key, with Redis-like semantics: the bucket
+parameters are sent by the clients in every request, and the bucket is created
+full on first use. Two operations are available:
+ * `lease(key, count, wait, capacity)`: take up to `count` tokens from the
+   bucket, refilled at one token per `wait` seconds up to `capacity` tokens.
+   It returns the number of tokens granted (which can be lower than requested,
+   or zero) and, if none was granted, the time until the next token is
+   available
+ * `release(key, count)`: give back unused tokens
+
+Timestamps are taken by the store, so clients do not need synchronized
+clocks.
+
+Available stores:
+ * `LocalRateStore`: an in-process store (also used by the server)
+ * `RemoteRateStore`: a client for a `RateStoreServer`, an asyncio TCP server
+   speaking a line-based JSON protocol. It is a stand-in for an external
+   store, e.g. to test and benchmark the leasing without external services
+"""
+
+import asyncio
+import json
+import time
+
+from typing import Dict, Hashable, Tuple
+
+from ..util.exception import ThrottlerInvArg, ThrottlerException
+from ..util.semaphore import AdjustableSemaphore
+
+
+class RateStore:
+    """
+    Base class for rate stores
+    """
+    __slots__ = ()
+
+    async def lease(self, key: Hashable, count: int, wait: float,
+                    capacity: int) -> Tuple[int, float]:
+        """
+        Take tokens from the bucket for a key
+          :param key: bucket key
+          :param count: number of tokens requested
+          :param wait: refill time for one token (seconds)
+          :param capacity: maximum number of tokens in the bucket
+          :return: a tuple (tokens granted, time until the next token)
+        """
+        raise NotImplementedError
+
+    async def release(self, key: Hashable, count: int):
+        """
+        Give back unused tokens to the bucket for a key
+        """
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class LocalRateStore(RateStore):
+    """
+    A store keeping the buckets in memory
+    """
+    __slots__ = ('_buckets', 'requests')
+
+    def __init__(self):
+        # key -> [tokens, timestamp of the last update, capacity]
+        self._buckets = {}
+        # Number of requests served
+        self.requests = 0
+
+
+    def _refill(self, key: Hashable, wait: float, capacity: int,
+                now: float) -> list:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [float(capacity), now, capacity]
+        else:
+            bucket[0] = min(bucket[0] + (now - bucket[1])/wait, capacity)
+            bucket[1] = now
+            bucket[2] = capacity
+        return bucket
+
+
+    def lease_now(self, key: Hashable, count: int, wait: float,
+                  capacity: int) -> Tuple[int, float]:
+        """
+        Synchronous version of `lease()`
+        """
+        self.requests += 1
+        bucket = self._refill(key, wait, capacity, time.monotonic())
+        granted = min(count, int(bucket[0]))
+        if granted:
+            bucket[0] -= granted
+            return granted, 0.0
+        return 0, (1 - bucket[0])*wait
+
+
+    def release_now(self, key: Hashable, count: int):
+        """
+        Synchronous version of `release()`
+        """
+        self.requests += 1
+        bucket = self._buckets.get(key)
+        if bucket is not None:
+            bucket[0] = min(bucket[0] + count, bucket[2])
+
+
+    async def lease(self, key: Hashable, count: int, wait: float,
+                    capacity: int) -> Tuple[int, float]:
+        return self.lease_now(key, count, wait, capacity)
+
+    async def release(self, key: Hashable, count: int):
+        self.release_now(key, count)
+
+
+# ----------------------------------------------------------------------
+
+
+class RateStoreServer:
+    """
+    An asyncio TCP server for a `LocalRateStore`.
+
+    Each request and response is a JSON object in one line:
+     * `{"op": "lease", "key": k, "count": n, "wait": w, "capacity": c}` ->
+       `{"granted": n, "retry": t}`
+     * `{"op": "release", "key": k, "count": n}` -> `{}`
+     * errors -> `{"error": message}`
+    """
+    __slots__ = ('store', 'host', 'port', '_server')
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0,
+                 store: LocalRateStore = None):
+        """
+          :param host: address to listen on
+          :param port: port to listen on (0 to use any free port)
+          :param store: the store to serve (a new one by default)
+        """
+        self.store = store or LocalRateStore()
+        self.host = host
+        self.port = port
+        self._server = None
+
+
+    async def start(self) -> 'RateStoreServer':
+        """
+        Start listening. The `port` attribute is updated with the actual port
+        """
+        self._server = await asyncio.start_server(self._serve, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+
+    def _process(self, req: Dict) -> Dict:
+        op = req.get('op')
+        if op == 'lease':
+            granted, retry = self.store.lease_now(req['key'], int(req['count']),
+                                                  float(req['wait']),
+                                                  int(req['capacity']))
+            return {'granted': granted, 'retry': retry}
+        elif op == 'release':
+            self.store.release_now(req['key'], int(req['count']))
+            return {}
+        raise ValueError(f'unknown operation: {op}')
+
+
+    async def _serve(self, reader: asyncio.StreamReader,
+                     writer: asyncio.StreamWriter):
+        try:
+            while line := await reader.readline():
+                try:
+                    resp = self._process(json.loads(line))
+                except Exception as e:
+                    resp = {'error': str(e)}
+                writer.write(json.dumps(resp).encode() + b'\n')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+class RemoteRateStore(RateStore):
+    """
+    A client for a `RateStoreServer`. It uses a single connection (opened on
+    first use, and reopened after a failure), with requests serialized.
+    Keys must be JSON-serializable
+    """
+    __slots__ = ('host', 'port', 'requests', '_conn', '_lock')
+
+    def __init__(self, host: str = '127.0.0.1', port: int = None):
+        """
+          :param host: address of the server
+          :param port: port of the server
+        """
+        if not (isinstance(port, int) and port > 0):
+            raise ThrottlerInvArg('`port` must be a positive integer')
+        self.host = host
+        self.port = port
+        # Number of requests (round trips) sent
+        self.requests = 0
+        self._conn = None
+        self._lock = AdjustableSemaphore(1)
+
+
+    async def _request(self, req: Dict) -> Dict:
+        async with self._lock:
+            if self._conn is None:
+                self._conn = await asyncio.open_connection(self.host, self.port)
+            reader, writer = self._conn
+            self.requests += 1
+            try:
+                writer.write(json.dumps(req).encode() + b'\n')
+                await writer.drain()
+                line = await reader.readline()
+                if not line:
+                    raise ConnectionResetError('connection closed by the rate store')
+            except BaseException:
+                # The connection state is unknown: drop it
+                self._conn = None
+                writer.close()
+                raise
+        resp = json.loads(line)
+        if 'error' in resp:
+            raise ThrottlerException('rate store error: ' + resp['error'])
+        return resp
+
+
+    async def lease(self, key: Hashable, count: int, wait: float,
+                    capacity: int) -> Tuple[int, float]:
+        resp = await self._request({'op': 'lease', 'key': key, 'count': count,
+                                    'wait': wait, 'capacity': capacity})
+        return resp['granted'], resp['retry']
+
+
+    async def release(self, key: Hashable, count: int):
+        await self._request({'op': 'release', 'key': key, 'count': count})
+
+
+    async def close(self):
+        if self._conn is not None:
+            writer = self._conn[1]
+            self._conn = None
+            writer.close()
+            await writer.wait_closed()
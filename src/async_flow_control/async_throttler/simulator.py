@@ -0,0 +1,282 @@
+"""
+Offline simulation of a throttler configuration over a recorded trace of
+arrivals (and service durations), without an event loop.
+
+The simulation replays the trace through the same objects the throttlers use
+to take decisions: the rate algorithms created by `rate_setup()`, the queue
+limits of `check_limits()`, and a FIFO concurrency policy. For each process
+it computes the grant time (or the rejection reason) as:
+ * processes are served in arrival order: a process is not considered before
+   the previous one has been granted access
+ * with a concurrency limit, a process waits until a slot is free; a slot is
+   held for the service duration of the process (cut by `exec_timeout`)
+ * the rate algorithms then give the grant time, which is committed
+ * a process is rejected if, when it has to wait, the queue limits are
+   exceeded (`max_queue`, `max_wait`), or if its wait would be longer than
+   the queue timeout. Rejected processes do not consume any rate or slot
+
+This is a sequential scan in Python, at about 0.4 to 1.4 million events per
+second depending on the configuration (rate tiers are the slowest), as
+measured by the `simulation` metrics of the benchmark suite. When NumPy is
+available, inputs and results are NumPy arrays, statistics are vectorized,
+and configurations with a single spacing rate (no burst, no queue limits and
+no concurrency limit) are computed entirely in vectorized form, as a
+cumulative maximum, at tens of millions of events per second.
+"""
+
+from array import array
+from heapq import heappush, heapreplace, heappop
+from itertools import repeat
+from math import isnan
+
+from typing import Dict, Sequence
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+from ..util.exception import ThrottlerInvArg, LimitExceeded
+from ..util.metrics import REJECTIONS
+from .rate_algorithm import SpacingAlgorithm, MultiRateAlgorithm
+from .throttler_rate import rate_setup, check_limits
+
+
+# Accepted keys in a simulation config
+CONFIG_KEYS = ('rate_limit', 'period', 'max_queue', 'max_wait', 'burst',
+               'algorithm', 'concurrency_limit', 'timeout', 'queue_timeout',
+               'exec_timeout', 'task_space')
+
+# Status of a simulated process: 0 if granted, else 1 + index in REJECTIONS
+GRANTED = 0
+
+NAN = float('nan')
+
+
+def _positive(config: Dict, name: str) -> float:
+    value = config.get(name)
+    if value is not None and not (isinstance(value, (int, float)) and value > 0):
+        raise ThrottlerInvArg(f'`{name}` must be a positive value')
+    return value
+
+
+class SimulationResult:
+    """
+    Grant times, delays and status of the processes of a simulated trace
+    (NumPy arrays if NumPy is available, else arrays/lists)
+    """
+    __slots__ = ('arrivals', 'grants', 'delays', 'status')
+
+    def __init__(self, arrivals, grants, status):
+        self.arrivals = arrivals
+        self.grants = grants
+        self.status = status
+        if np is not None:
+            self.delays = grants - arrivals
+        else:
+            self.delays = array('d', (g - a for g, a in zip(grants, arrivals)))
+
+
+    @property
+    def rejections(self) -> Dict[str, int]:
+        """
+        Number of rejected processes, per reason
+        """
+        if np is not None:
+            counts = np.bincount(self.status, minlength=len(REJECTIONS) + 1)
+        else:
+            counts = [0]*(len(REJECTIONS) + 1)
+            for s in self.status:
+                counts[s] += 1
+        return {name: int(counts[n + 1]) for n, name in enumerate(REJECTIONS)}
+
+
+    def summary(self, quantiles: Sequence[float] = (0.5, 0.9, 0.99, 0.999)) -> Dict:
+        """
+        Return the number of processes, grants and rejections, the achieved
+        rate, and the mean, max and quantiles of the delays of granted
+        processes
+        """
+        if np is not None:
+            ok = self.status == GRANTED
+            delays = np.sort(self.delays[ok])
+            grants = self.grants[ok]
+            first, last = (grants.min(), grants.max()) if len(grants) else (0, 0)
+            total = delays.sum()
+        else:
+            delays = sorted(d for d in self.delays if not isnan(d))
+            grants = [g for g in self.grants if not isnan(g)]
+            first, last = (min(grants), max(grants)) if grants else (0, 0)
+            total = sum(delays)
+        n = len(delays)
+        summary = {'count': len(self.status), 'granted': n,
+                   'rejections': self.rejections,
+                   'rate': float((n - 1)/(last - first)) if last > first else None}
+        if n:
+            summary['delay'] = {'mean': float(total/n), 'max': float(delays[-1]),
+                                'quantiles': {q: float(delays[min(int(q*n), n - 1)])
+                                              for q in quantiles}}
+        return summary
+
+
+def _spacing_vectorized(arrivals, costs, wait: float):
+    """
+    Grant times of a single spacing rate with no burst: each grant is the
+    arrival time, or the previous grant plus the time consumed by the
+    previous process, whichever is later. Unrolled, this is a cumulative
+    maximum
+    """
+    if costs is None:
+        used = wait*np.arange(len(arrivals), dtype=float)
+    else:
+        used = np.zeros(len(arrivals))
+        np.cumsum(wait*costs[:-1], out=used[1:])
+    return used + np.maximum.accumulate(arrivals - used)
+
+
+def _scan(arrivals, durations, costs, cfg, algo, limit: int,
+          qtimeout: float, xtimeout: float):
+    """
+    Replay the trace sequentially, and return the grant times and status
+    """
+    n = len(arrivals)
+    grants = array('d', repeat(NAN, n))
+    status = array('b', bytes(n))
+    # Processes still in the queue: (leaving time, cost)
+    waiting = []
+    qcost = 0.0
+    # End times of the processes holding a concurrency slot
+    slots = []
+    last = float('-inf')
+    for i, a in enumerate(arrivals):
+        cost = costs[i] if costs is not None else 1
+        while waiting and waiting[0][0] <= a:
+            qcost -= heappop(waiting)[1]
+
+        # Wait for the previous process, and for a free slot
+        t = a if a > last else last
+        if limit:
+            while slots and slots[0] <= t:
+                heappop(slots)
+            if len(slots) >= limit:
+                t = slots[0]
+        # Wait until the rate algorithms allow the grant
+        if algo is not None:
+            g = algo.next_grant(t, cost)
+            while g > t:
+                t = g
+                g = algo.next_grant(t, cost)
+
+        if t > a:
+            if cfg is not None:
+                try:
+                    check_limits(cfg, len(waiting), qcost)
+                except LimitExceeded as e:
+                    status[i] = 1 + REJECTIONS.index(type(e).__name__)
+                    continue
+            qcost += cost
+            if qtimeout and t - a > qtimeout:
+                # It stays in the queue until the timeout
+                heappush(waiting, (a + qtimeout, cost))
+                status[i] = 1 + REJECTIONS.index('ThrottlerTimeout')
+                continue
+            heappush(waiting, (t, cost))
+
+        # Granted
+        if algo is not None:
+            algo.commit(t, cost)
+        if limit:
+            d = durations[i]
+            end = t + (min(d, xtimeout) if xtimeout else d)
+            if len(slots) >= limit:
+                heapreplace(slots, end)
+            else:
+                heappush(slots, end)
+        grants[i] = last = t
+    return grants, status
+
+
+def simulate(config: Dict, arrivals: Sequence[float],
+             durations: Sequence[float] = None,
+             costs: Sequence[float] = None) -> SimulationResult:
+    """
+    Simulate a throttler configuration over a trace
+      :param config: throttler arguments, as for `AsyncThrottler`:
+        `rate_limit`, `period`, `max_queue`, `max_wait`, `burst`,
+        `algorithm`, `concurrency_limit`, `timeout` (or `queue_timeout`),
+        `exec_timeout` and `task_space`
+      :param arrivals: arrival times (seconds) of the processes, in
+        non-decreasing order
+      :param durations: service durations (seconds) of the processes (needed
+        with a concurrency limit)
+      :param costs: rate units consumed by each process (1 if not given)
+    """
+    unknown = set(config) - set(CONFIG_KEYS)
+    if unknown:
+        raise ThrottlerInvArg(f'unknown simulation config: {", ".join(sorted(unknown))}')
+    limit = config.get('concurrency_limit')
+    if limit is not None and not (isinstance(limit, int) and limit > 0):
+        raise ThrottlerInvArg('`concurrency_limit` must be a positive integer')
+    timeout = _positive(config, 'timeout')
+    qtimeout = _positive(config, 'queue_timeout')
+    xtimeout = _positive(config, 'exec_timeout')
+    space = _positive(config, 'task_space')
+    if timeout and qtimeout:
+        raise ThrottlerInvArg('`timeout` cannot be combined with `queue_timeout`')
+    qtimeout = timeout or qtimeout
+
+    # The same rate configuration and algorithms as the throttlers
+    cfg = algo = None
+    algos = []
+    if config.get('rate_limit') is not None:
+        cfg, rate_algo = rate_setup(config['rate_limit'], config.get('period'),
+                                    config.get('max_queue'), config.get('max_wait'),
+                                    config.get('burst'),
+                                    config.get('algorithm') or 'spacing')
+        algos.append(rate_algo)
+    elif any(config.get(k) is not None for k in ('period', 'burst', 'max_queue', 'max_wait')):
+        raise ThrottlerInvArg('period/burst/max_queue/max_wait need a `rate_limit`')
+    if space:
+        algos.append(SpacingAlgorithm(1, float(space)))
+    if algos:
+        algo = algos[0] if len(algos) == 1 else MultiRateAlgorithm(algos)
+    elif not limit:
+        raise ThrottlerInvArg("need one of rate or concurrency or space")
+
+    n = len(arrivals)
+    if durations is not None and len(durations) != n:
+        raise ThrottlerInvArg('`durations` must have the same length as `arrivals`')
+    if costs is not None and len(costs) != n:
+        raise ThrottlerInvArg('`costs` must have the same length as `arrivals`')
+    if limit and durations is None:
+        raise ThrottlerInvArg('`durations` are needed with a `concurrency_limit`')
+
+    if np is not None:
+        arrivals = np.asarray(arrivals, dtype=float)
+        if n and np.any(arrivals[1:] < arrivals[:-1]):
+            raise ThrottlerInvArg('`arrivals` must be in non-decreasing order')
+        if costs is not None:
+            costs = np.asarray(costs, dtype=float)
+        if (not limit and type(algo) is SpacingAlgorithm and not algo._max_burst
+                and cfg is not None and not cfg.max_q and not cfg.max_w
+                and not qtimeout):
+            grants = _spacing_vectorized(arrivals, costs, algo._wait)
+            return SimulationResult(arrivals, grants, np.zeros(n, dtype=np.int8))
+    elif any(b < a for a, b in zip(arrivals, arrivals[1:])):
+        raise ThrottlerInvArg('`arrivals` must be in non-decreasing order')
+
+    # Timestamps relative to the first arrival, as seen by new algorithms
+    origin = float(arrivals[0]) if n else 0.0
+    if np is not None:
+        # Plain lists are much faster to index one element at a time
+        grants, status = _scan((arrivals - origin).tolist(),
+                               None if durations is None else np.asarray(durations).tolist(),
+                               None if costs is None else costs.tolist(),
+                               cfg, algo, limit, qtimeout, xtimeout)
+        grants = np.frombuffer(grants, dtype=float) + origin
+        status = np.frombuffer(status, dtype=np.int8)
+    else:
+        grants, status = _scan([a - origin for a in arrivals], durations, costs,
+                               cfg, algo, limit, qtimeout, xtimeout)
+        grants = array('d', (g + origin for g in grants))
+    return SimulationResult(arrivals, grants, status)
@@ -0,0 +1,246 @@
+"""
+Object to enforce at the same time a maximum rate, a maximum concurrency and/or
+a minimum spacing of asynchronous tasks.
+
+The general mechanics are:
+ * processes are granted access in arrival order
+ * a process is granted access only when all constraints are satisfied at
+   the same time: there is a free concurrency slot and the rate (and
+   spacing) algorithms allow a grant now. No resource is taken while waiting
+   for another one
+ * waiting processes are kept in a queue, driven by a single event loop
+   timer (for rate constraints) and by slot releases (for the concurrency
+   constraint). A released slot is handed over directly to the next process
+"""
+
+import asyncio
+from collections import deque
+
+from typing import Union, Callable, Sequence, Tuple
+
+from ..util.exception import ThrottlerInvArg, ThrottlerTimeout, LimitExceeded
+from ..util.metrics import ThrottlerMetrics
+from ..util.base import BaseAsyncThrottler, AcquireContext
+from ..util.clock import Clock, check_clock
+from .rate_algorithm import SpacingAlgorithm, MultiRateAlgorithm
+from .throttler_rate import ThrottleCfg, rate_setup, check_limits
+
+
+class CompositeAsyncThrottler(BaseAsyncThrottler):
+    """
+    Context manager combining rate, concurrency and spacing limits
+    """
+    __slots__ = ('_cfg', '_algo', '_limit', '_timeout', '_active', '_queue',
+                 '_qcost', '_waiters', '_handle', '_metrics', '_clock', '_now')
+
+    def __init__(self, rate_limit: Union[int, Sequence[Tuple[int, float]]] = None,
+                 period: Union[int, float] = None, max_queue: int = None,
+                 max_wait: float = None, burst: int = None,
+                 concurrency_limit: int = None, timeout: float = None,
+                 task_space: float = None,
+                 logger: Callable = None, log_msg: str = None,
+                 algorithm: str = 'spacing', clock: Clock = None):
+        """
+          :param rate_limit: maximum number of processes allowed per period (or
+             a list of (rate_limit, period) tiers)
+          :param period: time interval (seconds) to count the rate limit
+          :param max_queue: maximum number of processes allowed to stay in the
+             queue
+          :param max_wait: maximum expected waiting time in the queue
+          :param burst: number of processes that can be granted access over the
+             rate limit
+          :param concurrency_limit: maximum number of simultaneous processes
+          :param timeout: maximum time a process can wait in the queue
+          :param task_space: minimum time (seconds) between process starts
+          :param logger: a callable that will be used to log waiting times
+          :param log_msg: logging message to send to the callable
+          :param algorithm: rate algorithm to use for `rate_limit`
+          :param clock: source of time (e.g. a `VirtualClock`); by default,
+             the system clocks
+        """
+        if concurrency_limit is not None and not (isinstance(concurrency_limit, int)
+                                                  and concurrency_limit > 0):
+            raise ThrottlerInvArg('`concurrency_limit` must be a positive integer')
+        if timeout is not None and not (isinstance(timeout, (int, float)) and timeout > 0.0):
+            raise ThrottlerInvArg('`timeout` must be a positive value')
+        if task_space is not None and not (isinstance(task_space, (int, float))
+                                           and task_space > 0):
+            raise ThrottlerInvArg("`task_space` must be a positive value")
+
+        self._clock = check_clock(clock)
+        self._now = self._clock.monotonic
+
+        # Rate algorithms: rate limit and task spacing
+        algos = []
+        if rate_limit is not None:
+            self._cfg, algo = rate_setup(rate_limit, period, max_queue, max_wait,
+                                         burst, algorithm)
+            algos.append(algo)
+        else:
+            if period is not None or burst is not None:
+                raise ThrottlerInvArg('period/burst need a `rate_limit`')
+            self._cfg = ThrottleCfg(float(task_space or 0), max_queue,
+                                    float(max_wait) if max_wait else None)
+        if task_space is not None:
+            algos.append(SpacingAlgorithm(1, float(task_space)))
+        self._algo = (None if not algos else algos[0] if len(algos) == 1
+                      else MultiRateAlgorithm(algos))
+
+        # Concurrency limit (None if unlimited) and currently active processes
+        self._limit = concurrency_limit
+        self._active = 0
+        self._timeout = float(timeout) if timeout else None
+
+        # Number of processes in the queue, their total cost, and the queue
+        self._queue = 0
+        self._qcost = 0
+        self._waiters = deque()
+        # The timer handle for the next rate grant
+        self._handle = None
+
+        self._metrics = ThrottlerMetrics()
+        # Logging stuff
+        self._log = logger
+        self._log_msg = log_msg or "CompositeThrottler: wait %.3f"
+
+
+    def _gauges(self) -> Tuple[int, int]:
+        return self._queue, self._active
+
+
+    def _admit(self, now: float, cost: float) -> bool:
+        """
+        Check if a process can be granted access now, and take the resources
+        if so. If not, and the rate is the blocking constraint, arm the timer
+        """
+        if self._limit and self._active >= self._limit:
+            return False    # we'll be woken up by a slot release
+        if self._algo:
+            ts = self._algo.next_grant(now, cost)
+            if ts > now:
+                self._arm(ts - now)
+                return False
+            self._algo.commit(now, cost)
+        self._active += 1
+        return True
+
+
+    def _arm(self, delay: float):
+        """
+        Set the timer to dispatch waiters after a delay
+        """
+        if self._handle:
+            self._handle.cancel()
+        self._handle = asyncio.get_running_loop().call_later(delay, self._on_timer)
+
+
+    def _on_timer(self):
+        self._handle = None
+        self._dispatch()
+
+
+    def _dispatch(self):
+        """
+        Grant access to the waiters at the head of the queue, as long as
+        possible
+        """
+        waiters = self._waiters
+        now = self._now()
+        while waiters:
+            fut, cost = waiters[0]
+            if fut.done():      # cancelled or timed out
+                waiters.popleft()
+                continue
+            if not self._admit(now, cost):
+                return
+            waiters.popleft()
+            fut.set_result(None)
+        # No waiters left: the timer is not needed
+        if self._handle:
+            self._handle.cancel()
+            self._handle = None
+
+
+    def _expire(self, fut: asyncio.Future):
+        """
+        Queue timeout for a waiter
+        """
+        if not fut.done():
+            fut.set_exception(ThrottlerTimeout(f"timeout exceeded: {self._timeout}"))
+
+
+    def _release(self):
+        self._active -= 1
+        if self._waiters:
+            self._dispatch()
+
+
+    async def acquire(self, cost: float = 1):
+        """
+        Wait until all constraints allow the process to go ahead
+          :param cost: number of rate units consumed by the process
+        """
+        if cost != 1 and not (isinstance(cost, (int, float)) and cost > 0):
+            raise ThrottlerInvArg('`cost` must be a positive number')
+
+        # Immediate grant if nobody is waiting and constraints allow it
+        if not self._waiters and self._admit(self._now(), cost):
+            self._metrics.grants += 1
+            return self
+
+        try:
+            check_limits(self._cfg, self._queue, self._qcost)
+        except LimitExceeded as e:
+            self._metrics.reject(e)
+            raise
+
+        # Queue the process
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self._waiters.append((fut, cost))
+        self._queue += 1
+        self._qcost += cost
+        expire = loop.call_later(self._timeout, self._expire, fut) if self._timeout else None
+        start = self._clock.perf_counter()
+        try:
+            await fut
+        except asyncio.CancelledError:
+            # If access was granted before cancellation, give it back (but
+            # not if the queue timeout expired just before)
+            if fut.done() and not fut.cancelled() and fut.exception() is None:
+                self._release()
+            raise
+        except ThrottlerTimeout as e:
+            self._metrics.reject(e)
+            raise
+        finally:
+            self._queue -= 1
+            self._qcost -= cost
+            if expire:
+                expire.cancel()
+            wait = self._clock.perf_counter() - start
+            if self._log:
+                self._log(self._log_msg, wait)
+        self._metrics.observe(wait)
+        return self
+
+
+    def __call__(self, cost: float = 1) -> AcquireContext:
+        """
+        Return an async context manager that enters the throttler with a given
+        cost
+        """
+        return AcquireContext(self, cost=cost)
+
+
+    async def __aenter__(self):
+        # Fast path: grant synchronously
+        if not self._waiters and self._admit(self._now(), 1):
+            self._metrics.grants += 1
+            return self
+        await self.acquire()
+        return self
+
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self._release()
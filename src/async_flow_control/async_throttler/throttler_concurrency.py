@@ -1,26 +1,73 @@
-from time import perf_counter
 import asyncio
 from collections.abc import Awaitable
 
-from typing import Callable, Dict
+from typing import Callable, Dict, Union, Hashable, Tuple
 
 from ..util.exception import ThrottlerInvArg, ThrottlerTimeout
-from ..util.base import BaseAsyncThrottler
+from ..util.base import BaseAsyncThrottler, AcquireContext
+from ..util.clock import Clock, check_clock
+from ..util.deadline import Deadline
+from ..util.metrics import ThrottlerMetrics
+from ..util.semaphore import AdjustableSemaphore, SharedSemaphore
+from .adaptive_limit import AdaptiveLimit, adaptive_limit
+from .throttler_rate import check_weights
 
 
+def _check_timeout(name: str, value: float) -> float:
+    if value is not None and not (isinstance(value, (int, float)) and value > 0.0):
+        raise ThrottlerInvArg(f'`{name}` must be a positive value')
+    return float(value) if value else None
+
+
+def _push(table: Dict, value):
+    """
+    Push a value on the stack of the current task (a task can enter the
+    throttler more than once)
+    """
+    table.setdefault(asyncio.current_task(), []).append(value)
+
+
+def _pop(table: Dict):
+    """
+    Pop the last value pushed by the current task (None if there is none)
+    """
+    task = asyncio.current_task()
+    stack = table.get(task)
+    if not stack:
+        return None
+    value = stack.pop()
+    if not stack:
+        del table[task]
+    return value
+
 
 class ConcurrencyAsyncThrottler(BaseAsyncThrottler):
     """
     Object for limiting the simultaneous number of coroutines accessing a context
-    block, with the possibility to define a timeout
+    block, with the possibility to define timeouts
+
+    Timeouts are implemented with deadlines: a single event loop timer handle
+    that cancels the task when fired, and that is cancelled when no longer
+    needed. No additional task is created.
+
+    The concurrency limit can be made adaptive: it is then adjusted after each
+    task from the measured task latency, between 1 and `concurrency_limit`.
+
+    Waiting tasks can have priorities and tenants: they are served by
+    priority, and with fair sharing among tenants within the same priority.
 
     Should be created inside of async loop.
     """
 
-    __slots__ = ('_semaphore', '_timeout')
+    __slots__ = ('_sem', '_timeout', '_qtimeout', '_xtimeout', '_deadlines',
+                 '_adapt', '_starts', '_metrics', '_perf')
 
     def __init__(self, concurrency_limit: int, timeout: float = None,
-                 logger: Callable = None, log_msg: str = None):
+                 logger: Callable = None, log_msg: str = None,
+                 queue_timeout: float = None, exec_timeout: float = None,
+                 adaptive: Union[str, AdaptiveLimit] = None,
+                 aging: float = None, weights: Dict[Hashable, float] = None,
+                 shared: str = None, clock: Clock = None):
         """
           :param concurrency_limit: maximum number of simultaneous coroutines
           :param timeout: define a timeout to cancel a task, either because
@@ -28,59 +75,203 @@ class ConcurrencyAsyncThrottler(BaseAsyncThrottler):
             time
           :param logger: a callable that will be used to log waiting times
           :param log_msg: logging message to send to the callable
+          :param queue_timeout: maximum waiting time in the queue
+          :param exec_timeout: maximum execution time of the context block (or
+            of the coroutine, if the callable is used)
+          :param adaptive: adapt the concurrency limit to task latency, using
+            an algorithm name ("aimd" or "gradient") or an `AdaptiveLimit`
+            object
+          :param aging: time (seconds) after which a waiting task goes ahead
+            of the newer tasks in the next priority level
+          :param weights: weights of tenants for the fair sharing of slots
+            among waiting tasks (tenants not in the dict have weight 1)
+          :param shared: name of a shared memory segment to keep the slots,
+            so that the concurrency limit applies to all processes in the host
+            using the same name
+          :param clock: source of time (e.g. a `VirtualClock`) to measure
+            waits and latencies; by default, the system clocks
         """
         if not isinstance(concurrency_limit, int) or concurrency_limit <= 0:
             raise ThrottlerInvArg('`concurrency_limit` must be a positive integer')
-        if timeout is not None and not (isinstance(timeout, (int, float)) and timeout > 0.0):
-            raise ThrottlerInvArg('`timeout` must be a positive value')
+        self._timeout = _check_timeout('timeout', timeout)
+        self._qtimeout = _check_timeout('queue_timeout', queue_timeout)
+        self._xtimeout = _check_timeout('exec_timeout', exec_timeout)
+        if self._timeout and (self._qtimeout or self._xtimeout):
+            raise ThrottlerInvArg('`timeout` cannot be combined with `queue_timeout` or `exec_timeout`')
+        aging = _check_timeout('aging', aging)
+        self._perf = check_clock(clock).perf_counter
 
-        self._sem = asyncio.Semaphore(concurrency_limit)
-        self._timeout = float(timeout) if timeout else None
+        # Adaptive limit, and stacks of start times of tasks inside the
+        # context block
+        self._adapt = adaptive_limit(adaptive, concurrency_limit) if adaptive else None
+        self._starts = {}
+        limit = self._adapt.limit if self._adapt else concurrency_limit
+        if shared is not None:
+            self._sem = SharedSemaphore(shared, limit, aging, check_weights(weights))
+        else:
+            self._sem = AdjustableSemaphore(limit, aging, check_weights(weights))
+        # Stacks of execution deadlines for tasks inside the context block
+        self._deadlines = {}
+        self._metrics = ThrottlerMetrics()
         self._log = logger
         self._log_msg = log_msg or "ConcurrencyThrottler: wait %.3f"
 
 
-    async def __aenter__(self):
+    def _gauges(self) -> Tuple[int, int]:
+        return self._sem.waiting, self._sem.active
+
+
+    @property
+    def limit(self) -> int:
         """
-        Main entry point
+        Current concurrency limit
         """
-        # Log waiting time
-        if self._log:
-            start = perf_counter()
+        return self._sem.limit
+
+
+    def _update(self, start: float, drop: bool):
+        """
+        Feed the latency of a finished task to the adaptive limit
+        """
+        self._sem.limit = self._adapt.update(self._perf() - start,
+                                             self._sem.active, drop)
 
-        # Wait
+
+    async def _acquire(self, timeout: float = None, msg: str = None,
+                       priority: int = 0, tenant: Hashable = None):
+        """
+        Wait for a free slot, within a timeout
+        """
+        start = self._perf()
         try:
-            await asyncio.wait_for(self._sem.acquire(), timeout=self._timeout)
-        except asyncio.TimeoutError as e:
-            raise ThrottlerTimeout(f"timeout exceeded: {self._timeout}") from e
-        finally:
+            if timeout:
+                with Deadline(timeout, msg or "timeout exceeded: {}"):
+                    await self._sem.acquire(priority, tenant)
+            else:
+                await self._sem.acquire(priority, tenant)
+        except ThrottlerTimeout as e:
+            self._metrics.reject(e)
+            raise
+        self._metrics.observe(self._perf() - start)
+
+
+    async def acquire(self, priority: int = 0, tenant: Hashable = None):
+        """
+        Main entry point (also used as the context manager entry)
+          :param priority: priority of the task if it has to wait (lower
+            values go first)
+          :param tenant: tenant of the task, to share slots fairly among
+            tenants with waiting tasks
+        """
+        # Fast path: a free slot can be taken without waiting
+        if not self._sem.locked():
+            await self._sem.acquire()
+            self._metrics.grants += 1
+            if self._log:
+                self._log(self._log_msg, 0.0)
+        else:
+            # Log waiting time
             if self._log:
-                self._log(self._log_msg, perf_counter() - start)
+                start = self._perf()
+            # Wait
+            try:
+                if self._timeout:
+                    await self._acquire(self._timeout, None, priority, tenant)
+                else:
+                    await self._acquire(self._qtimeout, "queue timeout exceeded: {}",
+                                        priority, tenant)
+            finally:
+                if self._log:
+                    self._log(self._log_msg, self._perf() - start)
+
+        if self._xtimeout:
+            deadline = Deadline(self._xtimeout, "execution timeout exceeded: {}")
+            _push(self._deadlines, deadline.__enter__())
+        if self._adapt:
+            _push(self._starts, self._perf())
+        return self
+
+    __aenter__ = acquire
+
+
+    def __call__(self, priority: int = 0, tenant: Hashable = None) -> AcquireContext:
+        """
+        Return an async context manager that enters the throttler with a given
+        priority and tenant
+        """
+        return AcquireContext(self, priority=priority, tenant=tenant)
 
 
     async def __aexit__(self, exc_type, exc, tb):
+        deadline = None
+        if self._xtimeout:
+            deadline = _pop(self._deadlines)
+        if self._adapt:
+            start = _pop(self._starts)
+            if start is not None:
+                drop = ((deadline is not None and deadline.fired)
+                        or (exc_type is not None and issubclass(exc_type, asyncio.TimeoutError)))
+                self._update(start, drop)
         self._sem.release()
+        if deadline:
+            deadline.__exit__(exc_type, exc, tb)
 
 
     # ---------------------------------------------------------------------
 
 
-    async def _run(self, coro: Awaitable):
-        async with self._sem:
+    async def _run(self, coro: Awaitable, outer: Deadline = None,
+                   priority: int = 0, tenant: Hashable = None):
+        try:
+            await self._acquire(self._qtimeout, "queue timeout exceeded: {}",
+                                priority, tenant)
+        except BaseException:
+            # The coroutine will not be executed
+            if hasattr(coro, 'close'):
+                coro.close()
+            raise
+        if self._adapt:
+            start = self._perf()
+            drop = False
+        try:
+            if self._xtimeout:
+                with Deadline(self._xtimeout, "execution timeout exceeded: {}"):
+                    return await coro
             return await coro
+        except (ThrottlerTimeout, asyncio.TimeoutError):
+            if self._adapt:
+                drop = True
+            raise
+        finally:
+            if self._adapt:
+                self._update(start, drop or (outer is not None and outer.fired))
+            self._sem.release()
 
 
-    async def run(self, coro: Awaitable, log_args: Dict = None):
+    async def run(self, coro: Awaitable, log_args: Dict = None,
+                  priority: int = 0, tenant: Hashable = None):
         """
         Alternative API: execute a coroutine within the concurrency limit
-        In this case, the timeout includes both wait time and execution time
+        In this case, the `timeout` argument includes both wait time and
+        execution time (`queue_timeout` and `exec_timeout` apply separately)
         """
+        if self._timeout is None and not self._log:
+            return await self._run(coro, None, priority, tenant)
         if self._log:
-            start = perf_counter()
+            start = self._perf()
         try:
-            return await asyncio.wait_for(self._run(coro), timeout=self._timeout)
-        except asyncio.TimeoutError as e:
-            raise ThrottlerTimeout(f"timeout exceeded: {self._timeout}") from e
+            if self._timeout:
+                deadline = Deadline(self._timeout)
+                try:
+                    with deadline:
+                        return await self._run(coro, deadline, priority, tenant)
+                except ThrottlerTimeout as e:
+                    # `_acquire()` only records the timeouts of its own
+                    # deadline, not those of this one
+                    if deadline.fired:
+                        self._metrics.reject(e)
+                    raise
+            return await self._run(coro, None, priority, tenant)
         finally:
             if self._log:
-                self._log(self._log_msg, perf_counter() - start)
+                self._log(self._log_msg, self._perf() - start)
@@ -0,0 +1,246 @@
+"""
+A registry of throttlers, one per key (e.g. one per API key or per remote
+host), with bounded memory.
+
+The general mechanics are:
+ * throttlers are created lazily, on the first use of a key, with the same
+   arguments as the `AsyncThrottler` dispatcher
+ * live throttlers are kept in LRU order. When there are more than `max_keys`
+   live throttlers, or when a throttler has not been used for `ttl` seconds,
+   it is evicted, provided it is idle (no process is waiting or active in it)
+ * if the state of an evicted throttler is equivalent to that of a new one
+   (past grants do not have any effect anymore), it is simply dropped.
+   Otherwise, for rate throttlers using the spacing algorithm, its state is
+   stored compactly in parallel arrays, and restored in a new throttler if
+   the key is used again. Compact entries are dropped once they settle.
+   Other throttlers are kept alive until they settle
+
+Eviction is done incrementally, checking a few entries on each access.
+"""
+
+import sys
+from array import array
+from collections import OrderedDict
+from types import FunctionType, MethodType, BuiltinFunctionType, ModuleType
+
+from typing import Dict, Hashable
+
+from ..util.exception import ThrottlerInvArg
+from ..util.base import BaseAsyncThrottler
+from ..util.clock import check_clock
+from ..util.task_spacer import TaskSpacer
+from .rate_algorithm import SpacingAlgorithm
+from .throttler_rate import RateAsyncThrottler
+from .throttler_concurrency import ConcurrencyAsyncThrottler
+from .throttler_composite import CompositeAsyncThrottler
+
+
+# Maximum number of entries checked for eviction on each access
+_SWEEP = 4
+
+
+def _idle(thr: BaseAsyncThrottler) -> bool:
+    """
+    Check if no process is waiting or active in a throttler
+    """
+    if isinstance(thr, RateAsyncThrottler):
+        return not thr._queue and not thr._lock.locked()
+    elif isinstance(thr, ConcurrencyAsyncThrottler):
+        return not thr._sem.active and not thr._sem.waiting
+    elif isinstance(thr, CompositeAsyncThrottler):
+        return not thr._active and not thr._waiters
+    return True
+
+
+def _settled(thr: BaseAsyncThrottler, now: float) -> bool:
+    """
+    Check if the state of an idle throttler is equivalent to a new one
+    """
+    if isinstance(thr, RateAsyncThrottler):
+        return (thr._fb.factor == 1.0 and thr._paused <= now
+                and thr._algo.settled(now))
+    elif isinstance(thr, CompositeAsyncThrottler):
+        return thr._algo is None or thr._algo.settled(now)
+    elif isinstance(thr, TaskSpacer):
+        return max(thr._next_time, thr._start_time + thr._period) <= now
+    return True
+
+
+_NOT_STATE = (type, FunctionType, MethodType, BuiltinFunctionType, ModuleType)
+
+def _sizeof(obj, seen: set) -> int:
+    """
+    Approximate memory used by an object and the objects it holds
+    """
+    if id(obj) in seen or isinstance(obj, _NOT_STATE):
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(_sizeof(k, seen) + _sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set)):
+        size += sum(_sizeof(v, seen) for v in obj)
+    else:
+        for cls in type(obj).__mro__:
+            for name in getattr(cls, '__slots__', ()):
+                size += _sizeof(getattr(obj, name, None), seen)
+        if hasattr(obj, '__dict__'):
+            size += _sizeof(vars(obj), seen)
+    return size
+
+
+class KeyedThrottler:
+    """
+    A set of throttlers, created lazily for each key
+    """
+    __slots__ = ('_new', '_args', '_max_keys', '_ttl', '_live', '_idle', '_free',
+                 '_curr', '_burst', '_margin', '_compact', '_spacing', '_thr_size',
+                 '_now')
+
+    def __init__(self, max_keys: int = 10000, ttl: float = None, **kwargs):
+        """
+          :param max_keys: maximum number of live throttlers
+          :param ttl: time (seconds) after which an unused throttler is evicted
+          :param kwargs: arguments to create each throttler, as for
+            `AsyncThrottler`. A `clock` argument is also used for the ttl
+        """
+        if not (isinstance(max_keys, int) and max_keys > 0):
+            raise ThrottlerInvArg('`max_keys` must be a positive integer')
+        if ttl is not None and not (isinstance(ttl, (int, float)) and ttl > 0):
+            raise ThrottlerInvArg('`ttl` must be a positive value')
+        self._max_keys = max_keys
+        self._ttl = ttl
+        self._now = check_clock(kwargs.get('clock')).monotonic
+
+        # Check the arguments with a prototype throttler
+        from . import AsyncThrottler
+        self._new = AsyncThrottler
+        proto = AsyncThrottler(**kwargs)
+        self._args = kwargs
+        self._thr_size = _sizeof(proto, set()) + sys.getsizeof([None, 0.0]) + 24
+        # Rate throttlers using the spacing algorithm can be stored compactly
+        self._compact = (isinstance(proto, RateAsyncThrottler)
+                         and type(proto._algo) is SpacingAlgorithm)
+        self._spacing = (proto._algo._wait, proto._algo._max_burst) if self._compact else None
+
+        # Live throttlers: key -> [throttler, last use], in LRU order
+        self._live = OrderedDict()
+        # Compact state of evicted throttlers: key -> index in the arrays
+        self._idle = {}
+        self._free = []
+        self._curr = array('d')
+        self._burst = array('d')
+        self._margin = array('d')
+
+
+    def get(self, key: Hashable) -> BaseAsyncThrottler:
+        """
+        Get the throttler for a key
+        """
+        now = self._now()
+        entry = self._live.get(key)
+        if entry is not None:
+            self._live.move_to_end(key)
+            entry[1] = now
+            self._evict(now, key)
+            return entry[0]
+
+        # Create a new throttler, restoring its state if it was stored
+        thr = self._new(**self._args)
+        idx = self._idle.pop(key, None)
+        if idx is not None:
+            algo = thr._algo
+            algo._curr = self._curr[idx]
+            algo._burst = self._burst[idx]
+            algo._margin = self._margin[idx]
+            self._free.append(idx)
+        self._live[key] = [thr, now]
+        self._evict(now, key)
+        return thr
+
+
+    def __call__(self, key: Hashable, **kwargs):
+        """
+        Return the throttler for a key, as an async context manager. Keyword
+        arguments (e.g. `cost`) are passed to the throttler
+        """
+        thr = self.get(key)
+        return thr(**kwargs) if kwargs else thr
+
+
+    def _store(self, key: Hashable, algo: SpacingAlgorithm):
+        """
+        Store the state of a spacing algorithm in the arrays
+        """
+        if self._free:
+            idx = self._free.pop()
+            self._curr[idx] = algo._curr
+            self._burst[idx] = algo._burst
+            self._margin[idx] = algo._margin
+        else:
+            idx = len(self._curr)
+            self._curr.append(algo._curr)
+            self._burst.append(algo._burst)
+            self._margin.append(algo._margin)
+        self._idle[key] = idx
+
+
+    def _evict(self, now: float, current: Hashable):
+        """
+        Evict a few live throttlers that are over the limits (except the one
+        for the current key), and drop a few compact entries that have settled
+        """
+        live = self._live
+        oldest = now - self._ttl if self._ttl else None
+        for _ in range(_SWEEP):
+            key, entry = next(iter(live.items()))
+            thr, used = entry
+            if key == current or (len(live) <= self._max_keys and
+                                  (oldest is None or used > oldest)):
+                break
+            if _idle(thr):
+                if _settled(thr, now):
+                    del live[key]
+                    continue
+                if (self._compact and thr._fb.factor == 1.0
+                        and thr._paused <= now):
+                    self._store(key, thr._algo)
+                    del live[key]
+                    continue
+            # Busy or not settled: keep it for now
+            live.move_to_end(key)
+            entry[1] = now
+
+        idle = self._idle
+        if idle:
+            wait, max_burst = self._spacing
+            for _ in range(_SWEEP):
+                key = next(iter(idle), None)
+                if key is None:
+                    break
+                idx = idle[key]
+                if (now - self._curr[idx] <
+                        (max_burst - self._burst[idx])*wait - self._margin[idx]):
+                    break
+                del idle[key]
+                self._free.append(idx)
+
+
+    def __len__(self) -> int:
+        """
+        Number of keys with state (live or compact)
+        """
+        return len(self._live) + len(self._idle)
+
+
+    def stats(self) -> Dict:
+        """
+        Number of keys and approximate memory use (bytes)
+        """
+        arrays = (self._curr, self._burst, self._margin)
+        memory = (sys.getsizeof(self._live) + sys.getsizeof(self._idle) +
+                  sum(sys.getsizeof(a) for a in arrays) +
+                  len(self._live)*self._thr_size +
+                  len(self._idle)*24)
+        return {'keys': len(self), 'live': len(self._live),
+                'compact': len(self._idle), 'memory': memory}
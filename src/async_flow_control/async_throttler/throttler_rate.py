@@ -9,19 +9,65 @@ The general mechanics are:
    it can start
  * additional options can impose a limit on waiting time or number of waiting
    processes, or allow short bursts of out-of-band processes
+
+The even spacing can be replaced by other algorithms (fixed window, sliding
+window), see the `rate_algorithm` module.
+
+Two scheduling modes are available:
+ * lock mode (default): waiting processes are serialized through a lock, and the
+   process holding the lock sleeps until its time slot arrives. The lock
+   serves waiting processes by priority, and shares the rate fairly among
+   tenants
+ * reservation mode: each process computes (without awaiting) its own grant
+   time as soon as it arrives, reserves that slot and then sleeps on its own.
+   This is the "virtual scheduling" variant of the Generic Cell Rate Algorithm
+
+The limit can also be enforced across several nodes by leasing blocks of
+tokens from a central store (see the `rate_lease` module): processes are
+granted access by the local algorithm and then spend one leased token per
+rate unit.
+
+The rate can be adapted at runtime from the outcomes reported by processes
+(see the `rate_feedback` module), and all grants can be pushed back until a
+given time (e.g. when the upstream service sends a Retry-After header). A
+pause shifts the algorithm state and increments a shift counter; sleeping
+processes check the counter when they wake up and extend their sleep.
+
+A throttler can be made loop-safe, to enforce a single rate for coroutines
+running in several event loops (each one in its own thread): the algorithm
+is wrapped in a thread lock, and the lock mode uses a semaphore that hands
+the lock over to waiters in other loops through `call_soon_threadsafe()`.
 """
 
-import asyncio
-import time
+import threading
 from dataclasses import dataclass
 
-from typing import Union, Callable
+from typing import Union, Callable, Sequence, Tuple, Dict, Hashable
 
-from ..util.exception import ThrottlerInvArg, QueueSizeExceeded, WaitTimeExceeded
-from ..util.base import BaseAsyncThrottler
+from ..util.exception import (ThrottlerInvArg, QueueSizeExceeded, WaitTimeExceeded,
+                              LimitExceeded)
+from ..util.metrics import ThrottlerMetrics
+from ..util.base import BaseAsyncThrottler, AcquireContext
+from ..util.clock import Clock, check_clock
+from ..util.scheduler import TimerScheduler, get_sleep
+from ..util.semaphore import AdjustableSemaphore, LoopSafeSemaphore
+from .rate_algorithm import (rate_algorithm, RateAlgorithm, MultiRateAlgorithm,
+                             LockedAlgorithm)
+from .rate_feedback import RateFeedback
+from .rate_shared import SharedSpacingAlgorithm
+from .rate_lease import TokenLease
 
 
 
+def _valid_tier(tier) -> bool:
+    """
+    Check a (rate_limit, period) tier
+    """
+    return (isinstance(tier, (list, tuple)) and len(tier) == 2 and
+            isinstance(tier[0], int) and tier[0] > 0 and
+            isinstance(tier[1], (int, float)) and tier[1] > 0)
+
+
 @dataclass(frozen=True)
 class ThrottleCfg:
     wait: float
@@ -30,17 +76,89 @@ class ThrottleCfg:
     burst: int = None
 
 
+def rate_setup(rate_limit: Union[int, Sequence[Tuple[int, float]]],
+               period: Union[int, float] = 1.0, max_queue: int = None,
+               max_wait: float = None, burst: int = None,
+               algorithm: str = 'spacing') -> Tuple[ThrottleCfg, RateAlgorithm]:
+    """
+    Check the rate throttling arguments, and create the throttle config and
+    the rate algorithm
+    """
+    if period is None:
+        period = 1.0
+
+    if isinstance(rate_limit, (list, tuple)):
+        tiers = rate_limit
+        if not tiers or not all(_valid_tier(t) for t in tiers):
+            raise ThrottlerInvArg('rate tiers must be (positive integer, positive float) pairs')
+        # The average spacing is given by the most restrictive tier
+        period, rate_limit = max((float(p)/r, p, r) for r, p in tiers)[1:]
+    else:
+        tiers = None
+        if not (isinstance(rate_limit, int) and rate_limit > 0):
+            raise ThrottlerInvArg('`rate_limit` must be a positive integer')
+        if not (isinstance(period, (int, float)) and period > 0.):
+            raise ThrottlerInvArg('`period` must be a positive float')
+    if max_queue is not None and not (isinstance(max_queue, int) and max_queue > 0):
+        raise ThrottlerInvArg('`max_queue` must be a positive integer')
+    if max_wait is not None and not (isinstance(max_wait, (int, float)) and max_wait > 0.):
+        raise ThrottlerInvArg('`max_wait` must be a positive float')
+    if burst is not None and not (isinstance(burst, int) and burst > 0):
+        raise ThrottlerInvArg('`burst` must be a positive integer')
+
+    cfg = ThrottleCfg(float(period)/rate_limit, max_queue,
+                      float(max_wait) if max_wait else None, burst)
+    algo = rate_algorithm(algorithm, tiers or rate_limit, float(period), burst)
+    return cfg, algo
+
+
+def check_weights(weights: Dict) -> Dict:
+    """
+    Check a dict of tenant weights
+    """
+    if weights is not None and not (
+            isinstance(weights, dict) and
+            all(isinstance(w, (int, float)) and w > 0 for w in weights.values())):
+        raise ThrottlerInvArg('`weights` must be a dict of positive numbers')
+    return weights
+
+
+def check_limits(cfg: ThrottleCfg, queue: int, qcost: float, delay: float = 0.0):
+    """
+    Check that a new request is not above the queue limits
+      :param cfg: the throttle config
+      :param queue: number of processes in the queue
+      :param qcost: total cost of the processes in the queue
+      :param delay: additional expected wait time
+    """
+    if cfg.max_q and queue > cfg.max_q:
+        raise QueueSizeExceeded("too many tasks in the queue")
+    if cfg.max_w and (w := cfg.wait*qcost + delay) > cfg.max_w:
+        raise WaitTimeExceeded(f"expected wait time is too long: {w:.2f}")
+
+
 class RateAsyncThrottler(BaseAsyncThrottler):
     """
     Context manager for limiting rate of accessing to context block.
     """
-    __slots__ = ('_cfg', '_queue', '_curr', '_burst', '_margin', '_lock')
+    __slots__ = ('_cfg', '_algo', '_queue', '_qcost', '_lock', '_reserve',
+                 '_sleep', '_fb', '_paused', '_shift', '_lease', '_mutex',
+                 '_loop_safe', '_metrics', '_now')
 
-    def __init__(self, rate_limit: int, period: Union[int, float] = 1.0,
+    def __init__(self, rate_limit: Union[int, Sequence[Tuple[int, float]]],
+                 period: Union[int, float] = 1.0,
                  max_queue: int = None, max_wait: float = None, burst: int = None,
-                 logger: Callable = None, log_msg: str = None):
+                 logger: Callable = None, log_msg: str = None,
+                 reserve: bool = False,
+                 scheduler: Union[bool, TimerScheduler] = None,
+                 algorithm: str = 'spacing', feedback: RateFeedback = None,
+                 aging: float = None, weights: Dict[Hashable, float] = None,
+                 shared: str = None, lease: TokenLease = None,
+                 loop_safe: bool = False, clock: Clock = None):
         """
-          :param rate_limit: maximum number of processes allowed
+          :param rate_limit: maximum number of processes allowed. It can also
+             be a list of (rate_limit, period) tiers that must all be
+             respected; in that case `period` is not used
           :param period: time interval (seconds) to count the rate limit
           :param max_queue: maximum number of processes allowed to stay in the
              queue
@@ -49,103 +167,294 @@ class RateAsyncThrottler(BaseAsyncThrottler):
              rate limit
           :param logger: a callable that will be used to log waiting times
           :param log_msg: logging message to send to the callable
+          :param reserve: use reservation-based scheduling instead of
+             serializing waiting processes through a lock
+          :param scheduler: make waiting processes sleep in a timer heap instead
+             of using one event loop timer each. Either a `TimerScheduler`
+             object, or `True` to use the scheduler shared by the event loop
+          :param algorithm: rate algorithm: `spacing` (the default),
+             `fixed_window`, `sliding_window` or `sliding_log`
+          :param feedback: a `RateFeedback` object with the parameters to
+             adapt the rate to the outcomes reported through `feedback()`
+          :param aging: time (seconds) after which a waiting process goes ahead
+             of the newer processes in the next priority level
+          :param weights: weights of tenants for the fair sharing of the rate
+             among waiting processes (tenants not in the dict have weight 1)
+          :param shared: name of a shared memory segment to keep the rate
+             state, so that all processes in the host using the same name
+             share the rate limit. It implies reservation mode
+          :param lease: a `TokenLease` object, to enforce the rate limit also
+             across several nodes by leasing tokens from a central store
+          :param loop_safe: allow the throttler to be used from several event
+             loops, running in different threads
+          :param clock: source of time (e.g. a `VirtualClock`); by default,
+             the system monotonic clock
         """
-        if period is None:
-            period = 1.0
+        # Create config and algorithm
+        self._cfg, self._algo = rate_setup(rate_limit, period, max_queue,
+                                           max_wait, burst, algorithm)
+        if clock is not None and (shared is not None or lease is not None):
+            raise ThrottlerInvArg('`clock` cannot be combined with `shared` or `lease`')
+        self._now = check_clock(clock).monotonic
+        if shared is not None:
+            if algorithm != 'spacing' or not isinstance(rate_limit, int):
+                raise ThrottlerInvArg('`shared` is only supported by the spacing algorithm with a single rate')
+            self._algo = SharedSpacingAlgorithm(rate_limit, self._cfg.wait*rate_limit,
+                                                burst, shared)
+            reserve = True
+        if lease is not None:
+            if not isinstance(lease, TokenLease):
+                raise ThrottlerInvArg('`lease` must be a TokenLease object')
+            lease.bind(self._cfg.wait, burst)
+        self._lease = lease
+        if loop_safe:
+            if lease is not None or isinstance(scheduler, TimerScheduler):
+                raise ThrottlerInvArg('`loop_safe` cannot be combined with `lease` or a TimerScheduler object')
+            self._algo = LockedAlgorithm(self._algo)
+        self._loop_safe = bool(loop_safe)
+        # Protects the queue counters and the pause state
+        self._mutex = threading.Lock()
+        if feedback is not None and not isinstance(feedback, RateFeedback):
+            raise ThrottlerInvArg('`feedback` must be a RateFeedback object')
+        self._fb = feedback or RateFeedback()
+        # Pause end timestamp, and total time shift caused by pauses
+        self._paused = 0.0
+        self._shift = 0.0
 
-        if not (isinstance(rate_limit, int) and rate_limit > 0):
-            raise ThrottlerInvArg('`rate_limit` must be a positive integer')
-        if not (isinstance(period, (int, float)) and period > 0.):
-            raise ThrottlerInvArg('`period` must be a positive float')
-        if max_queue is not None and not (isinstance(max_queue, int) and max_queue > 0):
-            raise ThrottlerInvArg('`max_queue` must be a positive integer')
-        if max_wait is not None and not (isinstance(max_wait, (int, float)) and max_wait > 0.):
-            raise ThrottlerInvArg('`max_wait` must be a positive float')
-        if burst is not None and not (isinstance(burst, int) and burst > 0):
-            raise ThrottlerInvArg('`burst` must be a positive integer')
-
-        # Create config
-        self._cfg = ThrottleCfg(float(period)/rate_limit, max_queue,
-                                float(max_wait) if max_wait else None, burst)
-        #print(self._cfg)
-
-        # Number of processes in the queue
+        # Number of processes in the queue, and their total cost
         self._queue = 0
-        # Timestamp of the last granted access
-        self._curr = 0.0
-        # Allowed burst capacity
-        self._burst = burst or 0
-        # Accumulated margin to be used for bursts
-        self._margin = 0.0
-        # The lock to be used to serialize task wait time
-        self._lock = asyncio.Lock()
+        self._qcost = 0
+        if aging is not None and not (isinstance(aging, (int, float)) and aging > 0):
+            raise ThrottlerInvArg('`aging` must be a positive value')
+        # The lock to be used to serialize task wait time, served by priority
+        semaphore = LoopSafeSemaphore if loop_safe else AdjustableSemaphore
+        self._lock = semaphore(1, aging, check_weights(weights))
+        # Scheduling mode
+        self._reserve = bool(reserve)
+        self._sleep = get_sleep(scheduler)
+        self._metrics = ThrottlerMetrics()
         # Logging stuff
         self._log = logger
         self._log_msg = log_msg or "RateThrottler: wait %.3f"
 
 
-    def _compute_wait(self) -> float:
+    def _gauges(self) -> Tuple[int, int]:
+        return self._queue, None
+
+
+    async def _wait_lock(self, cost: float, priority: int = 0,
+                         tenant: Hashable = None):
         """
-        Compute the waiting time for a process before it is granted access
+        Wait for the time slot while holding the lock
         """
-        # When does the next time slot come?
-        next_ts = self._curr + self._cfg.wait
-        wait = next_ts - time.monotonic()
-        #print(f" Q{self._queue:2} B{self._burst:2}  W {wait:+.4f} ", end="")
+        # Serialize access to the object behaviour
+        with self._mutex:
+            self._queue += 1
+            self._qcost += cost
+        try:
+            await self._lock.acquire(priority, tenant, cost)
+            try:
+                # How much do we need to wait
+                now = self._now()
+                wait = self._algo.next_grant(max(now, self._paused), cost) - now
+                # Wait if needed
+                if wait > 0:
+                    if self._log:
+                        self._log(self._log_msg, wait)
+                    while wait > 0:
+                        shift = self._shift
+                        await self._sleep(wait)
+                        now = self._now()
+                        # If there was a pause while sleeping, wait again
+                        if shift == self._shift:
+                            break
+                        wait = self._algo.next_grant(max(now, self._paused), cost) - now
+                # Access is granted. Update state
+                self._algo.commit(now, cost)
+            finally:
+                self._lock.release()
+        finally:
+            with self._mutex:
+                self._queue -= 1
+                self._qcost -= cost
+
 
-        # If we don't have to wait, return now
-        if wait <= 0.0:
+    async def _wait_reserve(self, cost: float):
+        """
+        Reserve a time slot and wait for it. The reservation is computed
+        synchronously, so no lock is needed
+        """
+        # Reserve the slot. A cancelled waiter does not give its slot back
+        now = self._now()
+        ts = self._algo.reserve(max(now, self._paused), cost)
+        wait = ts - now
+        if wait > 0:
+            if self._log:
+                self._log(self._log_msg, wait)
+            with self._mutex:
+                self._queue += 1
+                self._qcost += cost
+            try:
+                while wait > 0:
+                    shift = self._shift
+                    await self._sleep(wait)
+                    # If there was a pause while sleeping, the reserved slot
+                    # was pushed back
+                    ts += self._shift - shift
+                    wait = ts - self._now() if shift != self._shift else 0
+            finally:
+                with self._mutex:
+                    self._queue -= 1
+                    self._qcost -= cost
 
-            # Before returning, see if we can recover some lost burst capacity
-            if self._cfg.burst and self._burst < self._cfg.burst:
-                self._margin -= wait
-                extra = int(self._margin/self._cfg.wait)
-                if extra:
-                    self._burst = min(self._burst + extra, self._cfg.burst)
-                    self._margin = max(self._margin - extra*self._cfg.wait, 0)
 
-            #  return ok (no wait)
-            return 0.0
+    def _grant_now(self, cost: float) -> bool:
+        """
+        Fast path: if nobody is waiting and no wait is needed, grant access
+        synchronously, without going through the lock
+        """
+        if self._queue:
+            return False
+        if self._loop_safe:
+            # Waiters in other threads join the queue under the mutex before
+            # computing their slot, so the check and the grant must be done
+            # under it too, or both could take the same slot
+            with self._mutex:
+                return not self._queue and self._try_grant(cost)
+        return self._try_grant(cost)
 
-        # No room. See if we can get an option from the burst capacity
-        if self._burst:
-            self._burst -= 1
-            return 0.0   # no wait
 
-        # We'll have to wait
-        return wait
+    def _try_grant(self, cost: float) -> bool:
+        """
+        Grant access if no wait is needed
+        """
+        now = self._now()
+        if self._paused > now:
+            return False
+        if self._lease is None:
+            granted = self._algo.try_grant(now, cost)
+        else:
+            # Check the leased tokens first, since a grant can't be undone
+            granted = (self._lease.tokens >= cost and self._algo.try_grant(now, cost)
+                       and self._lease.try_take(cost))
+        if granted:
+            self._metrics.grants += 1
+        return granted
 
 
-    async def wait(self):
+    async def wait(self, cost: float = 1, priority: int = 0,
+                   tenant: Hashable = None):
         """
         Wait the time needed to abide with the rate policy
+          :param cost: number of rate units consumed by the process (it can be
+            fractional)
+          :param priority: priority of the process if it has to wait (lower
+            values go first). Not available in reservation mode
+          :param tenant: tenant of the process, to share the rate fairly among
+            tenants with waiting processes. Not available in reservation mode
         """
-        # Check that this request is not above the limits
-        if self._cfg.max_q and self._queue > self._cfg.max_q:
-            raise QueueSizeExceeded("too many tasks in the queue")
-        if self._cfg.max_w and (w := self._cfg.wait*self._queue > self._cfg.max_w):
-            raise WaitTimeExceeded(f"expected wait time is too long: {w:.2f}")
+        if cost != 1 and not (isinstance(cost, (int, float)) and cost > 0):
+            raise ThrottlerInvArg('`cost` must be a positive number')
+        if priority and self._reserve:
+            raise ThrottlerInvArg('`priority` is not supported in reservation mode')
+        if tenant is not None and self._reserve:
+            raise ThrottlerInvArg('`tenant` is not supported in reservation mode')
 
-        # Serialize access to the object behaviour
-        self._queue += 1
-        async with self._lock:
-            # How much do we need to wait
-            wait = self._compute_wait()
-            #print(f"   W {wait:+.4f}")
-            # Wait if needed
-            if wait > 0:
-                if self._log:
-                    self._log(self._log_msg, wait)
-                await asyncio.sleep(wait)
-            # Access is granted. Update state
-            self._curr = time.monotonic()
-            self._queue -= 1
+        if self._grant_now(cost):
+            return self
+
+        start = self._now()
+        try:
+            # Check that this request is not above the limits
+            check_limits(self._cfg, self._queue, self._qcost/self._fb.factor,
+                         max(self._paused - start, 0.0))
+
+            if self._reserve:
+                await self._wait_reserve(cost)
+            else:
+                await self._wait_lock(cost, priority, tenant)
+            if self._lease is not None:
+                await self._lease.take(cost)
+        except LimitExceeded as e:
+            self._metrics.reject(e)
+            raise
+        self._metrics.observe(self._now() - start)
 
         return self
 
+    # Alias, for symmetry with the context manager call
+    acquire = wait
+
+
+    def __call__(self, cost: float = 1, priority: int = 0,
+                 tenant: Hashable = None) -> AcquireContext:
+        """
+        Return an async context manager that enters the throttler with a given
+        cost, priority and tenant
+        """
+        return AcquireContext(self, cost=cost, priority=priority, tenant=tenant)
+
+
+    def feedback(self, outcome: str = 'success', retry_after: float = None,
+                 cost: float = 1):
+        """
+        Report the outcome of a process, to adapt the rate
+          :param outcome: "success", "throttled" (the upstream service rejected
+            the process because of its rate) or "error"
+          :param retry_after: time (seconds) to pause all grants, e.g. as
+            given by a Retry-After header
+          :param cost: number of rate units consumed by the process
+        """
+        now = self._now()
+        with self._mutex:
+            factor = self._fb.factor
+            if self._fb.update(outcome, now, cost*self._cfg.wait) != factor:
+                self._algo.set_rate_factor(self._fb.factor)
+        if retry_after:
+            self.pause_until(now + retry_after)
+
+
+    def pause_until(self, ts: float):
+        """
+        Push back all grants (including those of already waiting processes)
+        so that no process is granted access before a given time
+          :param ts: end of the pause, as a timestamp of the throttler clock
+            (by default, `time.monotonic()`)
+        """
+        with self._mutex:
+            start = max(self._now(), self._paused)
+            if ts <= start:
+                return
+            delta = ts - start
+            self._algo.shift(delta)
+            self._shift += delta
+            self._paused = ts
+
+
+    @property
+    def rate_factor(self) -> float:
+        """
+        The current rate, as a fraction of the configured rate
+        """
+        return self._fb.factor
+
+
+    @property
+    def binding_tier(self) -> Tuple[int, float]:
+        """
+        For a throttler with several rate tiers, the (rate_limit, period) tier
+        that determined the grant time of the last process that had to wait
+        (None if it was not delayed)
+        """
+        algo = self._algo.algo if isinstance(self._algo, LockedAlgorithm) else self._algo
+        if not isinstance(algo, MultiRateAlgorithm):
+            return None
+        return algo.binding_tier
+
 
     async def __aenter__(self):
-        await self.wait()
+        if not self._grant_now(1):
+            await self.wait()
         return self
 
 
@@ -1,3 +1,3 @@
 from .decorator_throttler import throttle  # noqa: F401
-from .decorator_timer import timer, timer_async  # noqa: F401
+from .decorator_timer import timer, timer_async, task_timer  # noqa: F401
 from .decorator_spacer import task_spacer, task_spacer_async  # noqa: F401
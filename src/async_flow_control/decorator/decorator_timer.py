@@ -1,33 +1,59 @@
 from functools import wraps
 from typing import Callable
 
-from ..timer import Timer
+from ..timer import Timer, TaskTimer
 
 
 
-def timer(name: str = None, verbose: bool = False, print_func: Callable = None):
+def timer(name: str = None, verbose: bool = False, print_func: Callable = None,
+          **kwargs):
     def decorator(func):
-        t = Timer(name, verbose, print_func)
+        t = Timer(name, verbose, print_func, **kwargs)
 
         @wraps(func)
         def wrapper(*args, **kwargs):
-            with t:
+            start = t._begin()
+            try:
                 return func(*args, **kwargs)
+            finally:
+                t._end(start)
 
+        wrapper.timer = t
         return wrapper
 
     return decorator
 
 
-def timer_async(name: str = None, verbose: bool = False, print_func: Callable = None):
+def timer_async(name: str = None, verbose: bool = False, print_func: Callable = None,
+                **kwargs):
     def decorator(func):
-        t = Timer(name, verbose, print_func)
+        t = Timer(name, verbose, print_func, **kwargs)
 
+        # The start time is kept in the wrapper, so that concurrent calls
+        # are measured separately
         @wraps(func)
         async def wrapper(*args, **kwargs):
-            with t:
+            start = t._begin()
+            try:
                 return await func(*args, **kwargs)
+            finally:
+                t._end(start)
 
+        wrapper.timer = t
+        return wrapper
+
+    return decorator
+
+
+def task_timer(name: str = None, print_func: Callable = None, **kwargs):
+    def decorator(func):
+        t = TaskTimer(name, print_func, **kwargs)
+
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            return await t.measure(func(*args, **kwargs))
+
+        wrapper.timer = t
         return wrapper
 
     return decorator
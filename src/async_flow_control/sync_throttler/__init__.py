@@ -0,0 +1,6 @@
+"""
+Thread-safe throttlers, usable from threads and from event loops
+"""
+
+from .throttler_rate import RateThrottler  # noqa: F401
+from .throttler_concurrency import ConcurrencyThrottler  # noqa: F401
@@ -0,0 +1,123 @@
+"""
+Thread-safe object to limit the number of simultaneous processes, usable both
+from threads (synchronous context manager) and from coroutines in any event
+loop (asynchronous context manager) at the same time.
+
+Threads and coroutines wait in a single queue, served in arrival order.
+"""
+
+import threading
+
+from typing import Callable, Tuple
+
+from ..util.exception import ThrottlerInvArg, ThrottlerTimeout
+from ..util.base import BaseAsyncThrottler
+from ..util.clock import Clock, check_clock
+from ..util.deadline import Deadline
+from ..util.metrics import ThrottlerMetrics
+from ..util.semaphore import ThreadSemaphore
+
+
+class ConcurrencyThrottler(BaseAsyncThrottler):
+    """
+    Thread-safe context manager for limiting the simultaneous number of
+    processes accessing a context block
+    """
+    __slots__ = ('_sem', '_timeout', '_metrics', '_mlock', '_perf')
+
+    def __init__(self, concurrency_limit: int, timeout: float = None,
+                 logger: Callable = None, log_msg: str = None,
+                 clock: Clock = None):
+        """
+          :param concurrency_limit: maximum number of simultaneous processes
+          :param timeout: maximum waiting time in the queue
+          :param logger: a callable that will be used to log waiting times
+          :param log_msg: logging message to send to the callable
+          :param clock: source of time to measure waits (e.g. a
+            `VirtualClock`); by default, the system clock. Threads always
+            wait in real time
+        """
+        if not isinstance(concurrency_limit, int) or concurrency_limit <= 0:
+            raise ThrottlerInvArg('`concurrency_limit` must be a positive integer')
+        if timeout is not None and not (isinstance(timeout, (int, float)) and timeout > 0):
+            raise ThrottlerInvArg('`timeout` must be a positive value')
+        self._sem = ThreadSemaphore(concurrency_limit)
+        self._timeout = float(timeout) if timeout else None
+        # Metrics are updated from several threads
+        self._metrics = ThrottlerMetrics()
+        self._mlock = threading.Lock()
+        self._perf = check_clock(clock).perf_counter
+        self._log = logger
+        self._log_msg = log_msg or "ConcurrencyThrottler: wait %.3f"
+
+
+    @property
+    def active(self) -> int:
+        """
+        Number of processes inside the context block
+        """
+        return self._sem.active
+
+
+    def _gauges(self) -> Tuple[int, int]:
+        return self._sem.waiting, self._sem.active
+
+
+    def _record(self, start: float, exc: Exception = None):
+        wait = self._perf() - start
+        with self._mlock:
+            if exc is not None:
+                self._metrics.reject(exc)
+            else:
+                self._metrics.observe(wait)
+        if self._log:
+            self._log(self._log_msg, wait)
+
+
+    def acquire(self):
+        """
+        Block the thread until there is a free slot
+        """
+        start = self._perf()
+        if not self._sem.acquire(self._timeout):
+            exc = ThrottlerTimeout(f"queue timeout exceeded: {self._timeout}")
+            self._record(start, exc)
+            raise exc
+        self._record(start)
+        return self
+
+
+    async def acquire_async(self):
+        """
+        Wait asynchronously until there is a free slot
+        """
+        start = self._perf()
+        try:
+            if self._timeout:
+                with Deadline(self._timeout, "queue timeout exceeded: {}"):
+                    await self._sem.acquire_async()
+            else:
+                await self._sem.acquire_async()
+        except ThrottlerTimeout as e:
+            self._record(start, e)
+            raise
+        self._record(start)
+        return self
+
+
+    def release(self):
+        self._sem.release()
+
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, exc_type, exc, tb):
+        self._sem.release()
+
+
+    async def __aenter__(self):
+        return await self.acquire_async()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._sem.release()
@@ -0,0 +1,144 @@
+"""
+Thread-safe object to enforce a maximum rate, usable both from threads
+(synchronous context manager) and from coroutines in any event loop
+(asynchronous context manager) at the same time.
+
+It uses reservation-based scheduling: each process computes its grant time
+while holding a short-lived mutex, reserves that slot and then sleeps on its
+own (`time.sleep()` in threads, `asyncio.sleep()` in coroutines). Threads
+therefore never wait on each other beyond the grant computation.
+"""
+
+import asyncio
+import threading
+
+from typing import Union, Callable, Sequence, Tuple
+
+from ..util.exception import ThrottlerInvArg, LimitExceeded
+from ..util.metrics import ThrottlerMetrics
+from ..util.base import BaseAsyncThrottler
+from ..util.clock import Clock, check_clock
+from ..async_throttler.throttler_rate import rate_setup, check_limits
+
+
+class RateThrottler(BaseAsyncThrottler):
+    """
+    Thread-safe context manager for limiting the rate of access to a context
+    block
+    """
+    __slots__ = ('_cfg', '_algo', '_queue', '_qcost', '_mutex', '_metrics', '_clock')
+
+    def __init__(self, rate_limit: Union[int, Sequence[Tuple[int, float]]],
+                 period: Union[int, float] = 1.0,
+                 max_queue: int = None, max_wait: float = None, burst: int = None,
+                 logger: Callable = None, log_msg: str = None,
+                 algorithm: str = 'spacing', clock: Clock = None):
+        """
+          :param rate_limit: maximum number of processes allowed. It can also
+             be a list of (rate_limit, period) tiers that must all be
+             respected; in that case `period` is not used
+          :param period: time interval (seconds) to count the rate limit
+          :param max_queue: maximum number of processes allowed to stay in the
+             queue
+          :param max_wait: maximum waiting time in the queue for a process
+          :param burst: number of processes that can be granted access over the
+             rate limit
+          :param logger: a callable that will be used to log waiting times
+          :param log_msg: logging message to send to the callable
+          :param algorithm: rate algorithm: `spacing` (the default),
+             `fixed_window`, `sliding_window` or `sliding_log`
+          :param clock: source of time and thread sleeps (e.g. a
+             `VirtualClock`); by default, the system clock
+        """
+        self._cfg, self._algo = rate_setup(rate_limit, period, max_queue,
+                                           max_wait, burst, algorithm)
+        # Number of processes in the queue, and their total cost
+        self._queue = 0
+        self._qcost = 0
+        # Protects the algorithm state and the queue counters
+        self._mutex = threading.Lock()
+        self._metrics = ThrottlerMetrics()
+        self._clock = check_clock(clock)
+        self._log = logger
+        self._log_msg = log_msg or "RateThrottler: wait %.3f"
+
+
+    def _reserve(self, cost: float) -> float:
+        """
+        Reserve a time slot, and return the time to wait for it. If there is
+        a wait, the process is added to the queue
+        """
+        if cost != 1 and not (isinstance(cost, (int, float)) and cost > 0):
+            raise ThrottlerInvArg('`cost` must be a positive number')
+        with self._mutex:
+            now = self._clock.monotonic()
+            if not self._queue and self._algo.try_grant(now, cost):
+                self._metrics.grants += 1
+                return 0.0
+            try:
+                check_limits(self._cfg, self._queue, self._qcost)
+            except LimitExceeded as e:
+                self._metrics.reject(e)
+                raise
+            wait = self._algo.reserve(now, cost) - now
+            if wait > 0:
+                self._queue += 1
+                self._qcost += cost
+                self._metrics.observe(wait)
+            else:
+                self._metrics.grants += 1
+        if wait > 0 and self._log:
+            self._log(self._log_msg, wait)
+        return wait
+
+
+    def _gauges(self) -> Tuple[int, int]:
+        return self._queue, None
+
+
+    def _leave(self, cost: float):
+        with self._mutex:
+            self._queue -= 1
+            self._qcost -= cost
+
+
+    def wait(self, cost: float = 1):
+        """
+        Block the thread the time needed to abide with the rate policy
+          :param cost: number of rate units consumed by the process
+        """
+        wait = self._reserve(cost)
+        if wait > 0:
+            try:
+                self._clock.sleep(wait)
+            finally:
+                self._leave(cost)
+        return self
+
+
+    async def wait_async(self, cost: float = 1):
+        """
+        Wait asynchronously the time needed to abide with the rate policy
+          :param cost: number of rate units consumed by the process
+        """
+        wait = self._reserve(cost)
+        if wait > 0:
+            try:
+                await asyncio.sleep(wait)
+            finally:
+                self._leave(cost)
+        return self
+
+
+    def __enter__(self):
+        return self.wait()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+
+    async def __aenter__(self):
+        return await self.wait_async()
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        pass
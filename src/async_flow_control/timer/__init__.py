@@ -1 +1,2 @@
 from .timer import Timer  # noqa: F401
+from .task_timer import TaskTimer  # noqa: F401
@@ -0,0 +1,139 @@
+"""
+Streaming statistics in constant memory:
+ * count, mean and variance with Welford's algorithm
+ * min and max
+ * quantiles with the P² algorithm (Jain & Chlamtac), which tracks five
+   markers per quantile and adjusts their heights with a piecewise-parabolic
+   interpolation as values arrive
+"""
+
+from bisect import bisect_right, insort
+from math import sqrt
+
+from typing import Dict, Sequence
+
+
+class P2Quantile:
+    """
+    Streaming estimator of a quantile with the P² algorithm
+    """
+    __slots__ = ('p', '_q', '_n', '_np', '_dn')
+
+    def __init__(self, p: float):
+        """
+          :param p: the quantile to estimate, in (0, 1)
+        """
+        self.p = p
+        # Marker heights, actual positions, desired positions and their
+        # increments
+        self._q = []
+        self._n = [0, 1, 2, 3, 4]
+        self._np = [0, 2*p, 4*p, 2 + 2*p, 4]
+        self._dn = [0, p/2, p, (1 + p)/2, 1]
+
+
+    def add(self, x: float):
+        q = self._q
+        if len(q) < 5:
+            insort(q, x)
+            return
+
+        # Find the cell of the new value, extending the extremes if needed
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = bisect_right(q, x) - 1
+        n = self._n
+        for i in range(k + 1, 5):
+            n[i] += 1
+        np = self._np
+        for i, dn in enumerate(self._dn):
+            np[i] += dn
+
+        # Adjust the heights of the middle markers
+        for i in (1, 2, 3):
+            d = np[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                qp = q[i] + d/(n[i + 1] - n[i - 1])*(
+                    (n[i] - n[i - 1] + d)*(q[i + 1] - q[i])/(n[i + 1] - n[i]) +
+                    (n[i + 1] - n[i] - d)*(q[i] - q[i - 1])/(n[i] - n[i - 1]))
+                if not q[i - 1] < qp < q[i + 1]:
+                    # Linear interpolation instead
+                    qp = q[i] + d*(q[i + d] - q[i])/(n[i + d] - n[i])
+                q[i] = qp
+                n[i] += d
+
+
+    @property
+    def value(self) -> float:
+        """
+        Current estimation (exact while there are less than five values)
+        """
+        q = self._q
+        if not q:
+            return None
+        if len(q) < 5:
+            return q[min(int(self.p*len(q)), len(q) - 1)]
+        return q[2]
+
+
+class StreamingStats:
+    """
+    Count, mean, variance, min, max and quantiles of a stream of values
+    """
+    __slots__ = ('count', 'mean', 'min', 'max', '_m2', '_quantiles')
+
+    def __init__(self, quantiles: Sequence[float] = (0.5, 0.95, 0.99)):
+        """
+          :param quantiles: quantiles to estimate
+        """
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.min = None
+        self.max = None
+        self._quantiles = [P2Quantile(p) for p in quantiles]
+
+
+    def add(self, x: float):
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta/self.count
+        self._m2 += delta*(x - self.mean)
+        if self.min is None or x < self.min:
+            self.min = x
+        if self.max is None or x > self.max:
+            self.max = x
+        for q in self._quantiles:
+            q.add(x)
+
+
+    @property
+    def variance(self) -> float:
+        """
+        Sample variance
+        """
+        return self._m2/(self.count - 1) if self.count > 1 else 0.0
+
+
+    @property
+    def stdev(self) -> float:
+        return sqrt(self.variance)
+
+
+    def quantiles(self) -> Dict[float, float]:
+        """
+        Current estimations of the quantiles
+        """
+        return {q.p: q.value for q in self._quantiles}
+
+
+    def summary(self) -> Dict:
+        return {'count': self.count, 'mean': self.mean, 'stdev': self.stdev,
+                'min': self.min, 'max': self.max,
+                'quantiles': self.quantiles()}
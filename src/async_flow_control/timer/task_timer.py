@@ -0,0 +1,164 @@
+"""
+Timer for coroutines that separates the time spent executing on the event
+loop from the time spent suspended (awaiting I/O, sleeps, other tasks).
+
+The wrapped coroutine is driven step by step: each resumption (a `send()` or
+`throw()` into the coroutine, up to its next suspension) is timed, and the
+on-loop time of a call is the sum of its steps. The suspended time is the
+rest of the wall time. Steps longer than a threshold block the loop for
+every other task, and are flagged.
+"""
+
+from typing import Awaitable, Callable, Dict, Sequence
+
+from ..util.exception import ThrottlerInvArg
+from ..util.clock import Clock, check_clock
+from .stats import StreamingStats
+
+
+class _Steps:
+    """
+    Awaitable that drives a coroutine, timing each of its steps
+    """
+    __slots__ = ('_timer', '_coro')
+
+    def __init__(self, timer: 'TaskTimer', coro: Awaitable):
+        self._timer = timer
+        self._coro = coro
+
+
+    def __await__(self):
+        timer = self._timer
+        perf_counter_ns = timer._clock.perf_counter_ns
+        coro = self._coro
+        if not hasattr(coro, 'send'):
+            coro = coro.__await__()
+        start = perf_counter_ns()
+        on_loop = 0
+        value = exc = None
+        try:
+            while True:
+                t0 = perf_counter_ns()
+                try:
+                    if exc is None:
+                        out = coro.send(value)
+                    else:
+                        out = coro.throw(exc)
+                except StopIteration as e:
+                    return e.value
+                finally:
+                    step = perf_counter_ns() - t0
+                    on_loop += step
+                    timer._step(step)
+                try:
+                    value = yield out
+                    exc = None
+                except GeneratorExit:
+                    coro.close()
+                    raise
+                except BaseException as e:
+                    value = None
+                    exc = e
+        finally:
+            timer._end(perf_counter_ns() - start, on_loop)
+
+
+class TaskTimer:
+    """
+    Measure the on-loop and suspended times of coroutines
+    """
+
+    def __init__(self, name: str = None, print_func: Callable = None,
+                 block_threshold: float = 0.1, quiet: bool = False,
+                 report_interval: float = None,
+                 quantiles: Sequence[float] = (0.5, 0.95, 0.99),
+                 clock: Clock = None):
+        """
+          :param name: name to be used in printed lines
+          :param print_func: alternative callable to send output to
+          :param block_threshold: flag steps that hold the loop for longer
+            than this time (seconds); `None` to disable
+          :param quiet: do not print anything per call (blocking steps are
+            still flagged)
+          :param report_interval: print a report of the statistics at the end
+            of the first call after this time (seconds) has elapsed since the
+            last report
+          :param quantiles: quantiles to estimate in the statistics
+          :param clock: source of time (e.g. a `VirtualClock`); by default,
+            the system clocks
+        """
+        if block_threshold is not None and not (
+                isinstance(block_threshold, (int, float)) and block_threshold > 0):
+            raise ThrottlerInvArg('`block_threshold` must be a positive value')
+        self.name = name or "TaskTimer"
+        self.print = print_func or print
+        self.quiet = quiet
+        self.report_interval = report_interval
+        self.block_threshold = block_threshold
+        self._block_ns = block_threshold*1e9 if block_threshold else None
+        self.wall = StreamingStats(quantiles)
+        self.on_loop = StreamingStats(quantiles)
+        self.suspended = StreamingStats(quantiles)
+        self.steps = 0
+        self.blocking = 0
+        self._clock = check_clock(clock)
+        self._last_report = self._clock.monotonic()
+
+
+    def measure(self, coro: Awaitable) -> Awaitable:
+        """
+        Wrap a coroutine (or awaitable), to be awaited instead of it
+        """
+        return _Steps(self, coro)
+
+
+    def _step(self, step: int):
+        self.steps += 1
+        if self._block_ns is not None and step > self._block_ns:
+            self.blocking += 1
+            self.print(f'{self.name} | step blocked the loop: {step/1e9:.3f} s')
+
+
+    def _end(self, wall: int, on_loop: int):
+        wall /= 1e9
+        on_loop /= 1e9
+        suspended = max(wall - on_loop, 0.0)
+        self.wall.add(wall)
+        self.on_loop.add(on_loop)
+        self.suspended.add(suspended)
+
+        if not self.quiet:
+            self.print(f'{self.name} | elapsed: {wall:.3f} s, on loop: {on_loop:.3f} s, '
+                       f'suspended: {suspended:.3f} s')
+
+        if self.report_interval and self._clock.monotonic() - self._last_report >= self.report_interval:
+            self.report()
+
+
+    def summary(self) -> Dict:
+        """
+        Return the statistics of the wall, on-loop and suspended times (in
+        seconds) per call, and the number of steps and blocking steps
+        """
+        return {'wall': self.wall.summary(), 'on_loop': self.on_loop.summary(),
+                'suspended': self.suspended.summary(),
+                'steps': self.steps, 'blocking': self.blocking}
+
+
+    def report(self) -> str:
+        """
+        Print a report of the statistics, and return it
+        """
+        self._last_report = self._clock.monotonic()
+        count = self.wall.count
+        if not count:
+            line = f'{self.name} | count: 0'
+        else:
+            parts = []
+            for label, s in (('on loop', self.on_loop), ('suspended', self.suspended)):
+                p = ''.join(f', p{100*q:g}: {v:.6f} s' for q, v in s.quantiles().items())
+                parts.append(f'{label}: mean: {s.mean:.6f} s, max: {s.max:.6f} s' + p)
+            line = (f'{self.name} | count: {count}, steps: {self.steps}, '
+                    f'blocking: {self.blocking} | ' + ' | '.join(parts))
+        self.print(line)
+        return line
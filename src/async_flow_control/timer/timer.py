@@ -1,19 +1,38 @@
 from datetime import datetime
-from typing import Callable
+from typing import Callable, Dict, Sequence
+
+from ..util.clock import Clock, check_clock
+from .stats import StreamingStats
 
 
 class Timer:
     """
     Context manager for pretty printing start, end, elapsed and average times
+
+    Elapsed times are measured with `perf_counter_ns()` (or with the given
+    clock), and fed to streaming statistics (count, mean, variance, min, max
+    and quantiles) kept in constant memory. In quiet mode nothing is printed
+    per iteration; a report of the statistics can be printed periodically or
+    on demand.
     """
 
     def __init__(self, name: str = None, verbose: bool = False,
-                 print_func: Callable = None):
+                 print_func: Callable = None, quiet: bool = False,
+                 report_interval: float = None,
+                 quantiles: Sequence[float] = (0.5, 0.95, 0.99),
+                 clock: Clock = None):
         """
           :param name: name to be used in printed lines
           :param verbose: add lines both at start and end of processing, and
             show averages
           :param print_func: alternative callable to send output to
+          :param quiet: do not print anything per iteration
+          :param report_interval: print a report of the statistics at the end
+            of the first iteration after this time (seconds) has elapsed
+            since the last report
+          :param quantiles: quantiles to estimate in the statistics
+          :param clock: source of time (e.g. a `VirtualClock`); by default,
+            the system clocks
         """
         self.iteration = 1
         self.start_dt = None
@@ -22,25 +41,73 @@ class Timer:
         self.name = name or "Timer"
         self.verbose = verbose
         self.print = print_func or print
+        self.quiet = quiet
+        self.report_interval = report_interval
+        self.stats = StreamingStats(quantiles)
+        self._start = None
+        self._clock = check_clock(clock)
+        self._last_report = self._clock.monotonic()
 
 
-    def __enter__(self):
-        self.start_dt = datetime.now()
-        if self.verbose:
+    def _begin(self) -> int:
+        """
+        Start an iteration, and return its start time
+        """
+        if self.verbose and not self.quiet:
+            self.start_dt = datetime.now()
             self.print(f'{f"#{self.iteration}":>5} | {self.name} | begin: {self.start_dt}')
+        return self._clock.perf_counter_ns()
 
 
-    def __exit__(self, exc_type, exc_val, exc_tb):
-        curr_dt = datetime.now()
-        elapsed = (curr_dt - self.start_dt).total_seconds()
-
+    def _end(self, start: int):
+        """
+        End an iteration started at `start`
+        """
+        elapsed = (self._clock.perf_counter_ns() - start)/1e9
+        self.stats.add(elapsed)
         self.elapsed_all += elapsed
-        average = self.elapsed_all / self.iteration
 
-        if self.verbose:
-            self.print(f'{f"#{self.iteration}":>5} | {self.name} |   end: {curr_dt}, elapsed: {elapsed:.2f} s, '
-                       f'average: {average:.2f} s\n')
-        else:
-            self.print(f'{self.name} | elapsed: {elapsed:.2f} s')
+        if not self.quiet:
+            if self.verbose:
+                average = self.elapsed_all / self.iteration
+                self.print(f'{f"#{self.iteration}":>5} | {self.name} |   end: {datetime.now()}, '
+                           f'elapsed: {elapsed:.2f} s, average: {average:.2f} s\n')
+            else:
+                self.print(f'{self.name} | elapsed: {elapsed:.2f} s')
 
         self.iteration += 1
+        if self.report_interval and self._clock.monotonic() - self._last_report >= self.report_interval:
+            self.report()
+
+
+    def __enter__(self):
+        self._start = self._begin()
+
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._end(self._start)
+
+
+    def summary(self) -> Dict:
+        """
+        Return the statistics of the elapsed times (in seconds)
+        """
+        return self.stats.summary()
+
+
+    def report(self) -> str:
+        """
+        Print a report of the statistics, and return it
+        """
+        self._last_report = self._clock.monotonic()
+        s = self.stats
+        if not s.count:
+            line = f'{self.name} | count: 0'
+        else:
+            quantiles = ''.join(f', p{100*p:g}: {v:.6f} s'
+                                for p, v in s.quantiles().items())
+            line = (f'{self.name} | count: {s.count}, mean: {s.mean:.6f} s, '
+                    f'stdev: {s.stdev:.6f} s, min: {s.min:.6f} s, max: {s.max:.6f} s'
+                    + quantiles)
+        self.print(line)
+        return line
@@ -1,2 +1,4 @@
 from .task_spacer import TaskSpacer  # noqa: F401
 from .dummy_spacer import DummySpacer  # noqa: F401
+from .scheduler import TimerScheduler  # noqa: F401
+from .clock import Clock, VirtualClock  # noqa: F401
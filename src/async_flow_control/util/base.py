@@ -1,3 +1,40 @@
+from typing import Dict, Tuple
+
 
 class BaseAsyncThrottler:
-    pass
+
+    def _gauges(self) -> Tuple[int, int]:
+        """
+        Current queue depth and number of processes in flight (None if the
+        throttler does not track them)
+        """
+        return None, None
+
+    def snapshot(self) -> Dict:
+        """
+        Return the metrics of the throttler: number of grants, rejections by
+        exception type, queue depth, processes in flight and a wait-time
+        histogram
+        """
+        snap = self._metrics.snapshot()
+        snap['queue'], snap['in_flight'] = self._gauges()
+        return snap
+
+
+class AcquireContext:
+    """
+    Async context manager that enters a throttler by calling its `acquire()`
+    method with additional arguments
+    """
+    __slots__ = ('_thr', '_kwargs')
+
+    def __init__(self, throttler: BaseAsyncThrottler, **kwargs):
+        self._thr = throttler
+        self._kwargs = kwargs
+
+    async def __aenter__(self):
+        await self._thr.acquire(**self._kwargs)
+        return self._thr
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self._thr.__aexit__(exc_type, exc_val, exc_tb)
@@ -0,0 +1,164 @@
+"""
+Clocks: the source of time for throttlers and timers.
+
+By default, throttlers and timers read the system clocks (`time.monotonic()`,
+`time.perf_counter()`) and sleep for real. A `clock` argument replaces them
+with another `Clock` object:
+ * `Clock`: the system clocks (the default)
+ * `VirtualClock`: a virtual time that only advances when everything is
+   waiting. It comes with an event loop whose `time()` is the virtual time,
+   and which jumps straight to the next scheduled timer instead of blocking,
+   so that long periods of throttled traffic are executed in a fraction of
+   the time, with exactly reproducible results
+
+Asynchronous waits are always done through the event loop timers, so a
+virtual clock must be used in its own event loop (see `VirtualClock.run()`).
+"""
+
+import asyncio
+import time
+
+from typing import Awaitable, Any
+
+from .exception import ThrottlerInvArg
+
+
+class Clock:
+    """
+    The system clocks
+    """
+    __slots__ = ()
+
+    monotonic = staticmethod(time.monotonic)
+    perf_counter = staticmethod(time.perf_counter)
+    perf_counter_ns = staticmethod(time.perf_counter_ns)
+    sleep = staticmethod(time.sleep)
+
+
+# The default clock
+SYSTEM_CLOCK = Clock()
+
+
+def check_clock(clock: Clock) -> Clock:
+    if clock is None:
+        return SYSTEM_CLOCK
+    if not isinstance(clock, Clock):
+        raise ThrottlerInvArg('`clock` must be a Clock object')
+    return clock
+
+
+class VirtualClock(Clock):
+    """
+    A virtual clock, advanced by sleeps and by its event loop
+    """
+    __slots__ = ('_now',)
+
+    def __init__(self, start: float = 0.0):
+        """
+          :param start: initial time (seconds)
+        """
+        self._now = float(start)
+
+
+    def monotonic(self) -> float:
+        return self._now
+
+    perf_counter = monotonic
+
+
+    def perf_counter_ns(self) -> int:
+        return round(self._now*1e9)
+
+
+    def advance(self, delay: float):
+        """
+        Move the time forward
+        """
+        if delay < 0:
+            raise ThrottlerInvArg('`delay` must not be negative')
+        self._now += delay
+
+
+    def sleep(self, delay: float):
+        """
+        Synchronous sleep: the time is advanced, without waiting
+        """
+        if delay > 0:
+            self._now += delay
+
+
+    def new_event_loop(self) -> asyncio.AbstractEventLoop:
+        """
+        Create an event loop running on this clock
+        """
+        return VirtualTimeEventLoop(self)
+
+
+    def run(self, main: Awaitable) -> Any:
+        """
+        Run a coroutine in a new event loop running on this clock, and close
+        the loop (like `asyncio.run()`)
+        """
+        loop = self.new_event_loop()
+        try:
+            asyncio.set_event_loop(loop)
+            return loop.run_until_complete(main)
+        finally:
+            try:
+                tasks = asyncio.all_tasks(loop)
+                for task in tasks:
+                    task.cancel()
+                if tasks:
+                    loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+                loop.run_until_complete(loop.shutdown_asyncgens())
+            finally:
+                asyncio.set_event_loop(None)
+                loop.close()
+
+
+class _VirtualSelector:
+    """
+    Selector wrapper that does not block: when the event loop would wait for
+    its next timer, the clock is advanced instead
+    """
+    __slots__ = ('_selector', '_clock')
+
+    def __init__(self, selector, clock: VirtualClock):
+        self._selector = selector
+        self._clock = clock
+
+
+    def select(self, timeout: float = None):
+        # Nothing scheduled: wait for I/O (e.g. a wakeup from another thread)
+        if timeout is None:
+            return self._selector.select(None)
+        events = self._selector.select(0)
+        if not events and timeout > 0:
+            self._clock.advance(timeout)
+        return events
+
+
+    def __getattr__(self, name: str):
+        return getattr(self._selector, name)
+
+
+class VirtualTimeEventLoop(asyncio.SelectorEventLoop):
+    """
+    Event loop whose time is a virtual clock. When there is nothing ready to
+    run, the clock jumps to the next scheduled timer.
+
+    I/O still happens in real time, so it is meant for simulations and tests
+    where waits come from timers (sleeps, timeouts, throttlers)
+    """
+
+    def __init__(self, clock: VirtualClock = None):
+        """
+          :param clock: the virtual clock (a new one if not given)
+        """
+        super().__init__()
+        self.clock = clock or VirtualClock()
+        self._selector = _VirtualSelector(self._selector, self.clock)
+
+
+    def time(self) -> float:
+        return self.clock._now
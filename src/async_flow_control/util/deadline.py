@@ -0,0 +1,55 @@
+import asyncio
+
+from .exception import ThrottlerTimeout
+
+
+class Deadline:
+    """
+    Context manager that cancels the current task if a deadline is reached
+    while inside the block, and translates the cancellation into a
+    `ThrottlerTimeout` exception.
+
+    It uses a single event loop timer handle, which is cancelled when leaving
+    the block; no additional task is created.
+    """
+    __slots__ = ('_timeout', '_msg', '_task', '_handle', '_fired')
+
+    def __init__(self, timeout: float, msg: str = "timeout exceeded: {}"):
+        """
+          :param timeout: time (seconds) from entering the block to the deadline
+          :param msg: message for the exception, formatted with the timeout
+        """
+        self._timeout = timeout
+        self._msg = msg
+        self._task = self._handle = None
+        self._fired = False
+
+
+    @property
+    def fired(self) -> bool:
+        """
+        Check if the deadline has been reached
+        """
+        return self._fired
+
+
+    def _fire(self):
+        self._fired = True
+        self._task.cancel()
+
+
+    def __enter__(self):
+        self._task = asyncio.current_task()
+        self._handle = asyncio.get_running_loop().call_later(self._timeout, self._fire)
+        return self
+
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._handle.cancel()
+        if self._fired and exc_type is not None and issubclass(exc_type, asyncio.CancelledError):
+            # Python 3.11+ keeps a count of cancellation requests
+            uncancel = getattr(self._task, 'uncancel', None)
+            if uncancel:
+                uncancel()
+            raise ThrottlerTimeout(self._msg.format(self._timeout)) from exc_val
+        return False
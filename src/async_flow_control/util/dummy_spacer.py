@@ -1,5 +1,6 @@
 
 from .base import BaseAsyncThrottler
+from .metrics import ThrottlerMetrics
 
 class DummySpacer(BaseAsyncThrottler):
     """
@@ -8,15 +9,17 @@ class DummySpacer(BaseAsyncThrottler):
     """
 
     def __init__(self, *args, **kwargs):
-        pass
+        self._metrics = ThrottlerMetrics()
 
     def __enter__(self):
+        self._metrics.grants += 1
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         pass
 
     async def __aenter__(self):
+        self._metrics.grants += 1
         return self
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
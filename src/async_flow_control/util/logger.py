@@ -0,0 +1,163 @@
+"""
+Wrappers for the `logger` callable of the throttlers, to reduce the volume of
+log messages at high rates.
+
+All wrappers are callables with the same signature as a throttler logger,
+`(msg, wait)`, and forward (some of) the calls to another logger:
+ * `RateSampledLogger`: forwards at most `rate` messages per second
+ * `ProbabilisticLogger`: forwards each message with a given probability
+ * `SummaryLogger`: forwards nothing per wait; instead, it emits a summary of
+   the waits (count, mean, max and p99) once per interval
+
+Formatting stays lazy: dropped messages are never formatted, and the
+forwarded calls use `%`-style arguments, so that e.g. a standard
+`logging.Logger` method only formats messages it actually emits.
+"""
+
+import random
+import threading
+import time
+
+from typing import Callable
+
+from .exception import ThrottlerInvArg
+
+
+def _check_logger(logger: Callable):
+    if not callable(logger):
+        raise ThrottlerInvArg('`logger` must be a callable')
+
+
+class RateSampledLogger:
+    """
+    Forward at most `rate` messages per second (extra messages are dropped)
+    """
+    __slots__ = ('_logger', '_space', '_next')
+
+    def __init__(self, logger: Callable, rate: float = 1.0):
+        """
+          :param logger: the logger to forward messages to
+          :param rate: maximum number of messages per second
+        """
+        _check_logger(logger)
+        if not (isinstance(rate, (int, float)) and rate > 0):
+            raise ThrottlerInvArg('`rate` must be a positive value')
+        self._logger = logger
+        self._space = 1.0/rate
+        self._next = 0.0
+
+
+    def __call__(self, msg: str, wait: float):
+        now = time.monotonic()
+        if now >= self._next:
+            self._next = now + self._space
+            self._logger(msg, wait)
+
+
+class ProbabilisticLogger:
+    """
+    Forward each message with a probability
+    """
+    __slots__ = ('_logger', '_prob', '_random')
+
+    def __init__(self, logger: Callable, probability: float = 0.01):
+        """
+          :param logger: the logger to forward messages to
+          :param probability: probability of forwarding a message
+        """
+        _check_logger(logger)
+        if not (isinstance(probability, (int, float)) and 0 < probability <= 1):
+            raise ThrottlerInvArg('`probability` must be in (0, 1]')
+        self._logger = logger
+        self._prob = probability
+        self._random = random.random
+
+
+    def __call__(self, msg: str, wait: float):
+        if self._random() < self._prob:
+            self._logger(msg, wait)
+
+
+class SummaryLogger:
+    """
+    Aggregate waits, and emit a summary once per interval.
+
+    The summary is emitted by the first call after the interval has elapsed
+    (there is no timer), or by `flush()`. It is sent as a message and four
+    arguments: number of waits, mean, max and p99 wait. The p99 is computed
+    over the waits of the interval, keeping at most `max_samples` of them
+    (with reservoir sampling beyond that).
+    """
+    __slots__ = ('_logger', '_msg', '_interval', '_max_samples', '_start',
+                 '_count', '_sum', '_max', '_samples', '_lock')
+
+    def __init__(self, logger: Callable, interval: float = 60.0,
+                 msg: str = None, max_samples: int = 10000):
+        """
+          :param logger: the logger to send summaries to
+          :param interval: time (seconds) between summaries
+          :param msg: summary message, formatted with the count, mean, max
+            and p99 of the waits
+          :param max_samples: maximum number of waits kept for the p99
+        """
+        _check_logger(logger)
+        if not (isinstance(interval, (int, float)) and interval > 0):
+            raise ThrottlerInvArg('`interval` must be a positive value')
+        if not (isinstance(max_samples, int) and max_samples > 0):
+            raise ThrottlerInvArg('`max_samples` must be a positive integer')
+        self._logger = logger
+        self._msg = msg or "wait summary: %d waits, mean %.3f, max %.3f, p99 %.3f"
+        self._interval = interval
+        self._max_samples = max_samples
+        # Loggers can be shared by threads (e.g. by thread-safe throttlers)
+        self._lock = threading.Lock()
+        self._reset(time.monotonic())
+
+
+    def _reset(self, now: float):
+        self._start = now
+        self._count = 0
+        self._sum = 0.0
+        self._max = 0.0
+        self._samples = []
+
+
+    def __call__(self, msg: str, wait: float):
+        now = time.monotonic()
+        with self._lock:
+            self._count += 1
+            self._sum += wait
+            if wait > self._max:
+                self._max = wait
+            if len(self._samples) < self._max_samples:
+                self._samples.append(wait)
+            else:
+                idx = random.randrange(self._count)
+                if idx < self._max_samples:
+                    self._samples[idx] = wait
+            if now - self._start < self._interval:
+                return
+            summary = self._summary(now)
+        self._logger(self._msg, *summary)
+
+
+    def _summary(self, now: float) -> tuple:
+        """
+        Compute the summary of the current interval, and start a new one
+        """
+        samples = sorted(self._samples)
+        p99 = samples[min(int(0.99*len(samples)), len(samples) - 1)]
+        summary = self._count, self._sum/self._count, self._max, p99
+        self._reset(now)
+        return summary
+
+
+    def flush(self):
+        """
+        Emit the summary of the current interval now (if there were waits)
+        """
+        with self._lock:
+            if not self._count:
+                return
+            summary = self._summary(time.monotonic())
+        self._logger(self._msg, *summary)
@@ -0,0 +1,126 @@
+"""
+Counters and gauges kept by all throttlers, and their export in the Prometheus
+text format.
+
+To keep the overhead low, throttlers only increment plain attributes: the
+number of grants on every acquisition, and a histogram bucket for processes
+that had to wait (immediate grants are added to the first bucket when taking
+a snapshot). Rejections are counted by exception type. Gauges (queue depth
+and processes in flight) are read from the throttler state when taking a
+snapshot.
+"""
+
+from bisect import bisect_left
+
+from typing import Dict
+
+
+# Upper bounds (seconds) of the wait-time histogram buckets (plus +Inf)
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+                5.0, 10.0)
+
+# Exceptions counted as rejections
+REJECTIONS = ('QueueSizeExceeded', 'WaitTimeExceeded', 'ThrottlerTimeout')
+
+
+class ThrottlerMetrics:
+    """
+    Counters of a throttler
+    """
+    __slots__ = ('grants', 'waits', 'wait_sum', 'rejections')
+
+    def __init__(self):
+        # Number of grants, and of grants that had to wait, per bucket
+        self.grants = 0
+        self.waits = [0]*(len(WAIT_BUCKETS) + 1)
+        self.wait_sum = 0.0
+        self.rejections = dict.fromkeys(REJECTIONS, 0)
+
+
+    def observe(self, wait: float):
+        """
+        Record a grant after waiting
+        """
+        self.grants += 1
+        self.waits[bisect_left(WAIT_BUCKETS, wait)] += 1
+        self.wait_sum += wait
+
+
+    def reject(self, exc: Exception):
+        """
+        Record a rejection
+        """
+        name = type(exc).__name__
+        self.rejections[name] = self.rejections.get(name, 0) + 1
+
+
+    def snapshot(self) -> Dict:
+        """
+        Return the counters, with the histogram in cumulative form
+        """
+        waits = list(self.waits)
+        waits[0] += self.grants - sum(waits)
+        buckets = []
+        total = 0
+        for le, n in zip(WAIT_BUCKETS + (float('inf'),), waits):
+            total += n
+            buckets.append((le, total))
+        return {'grants': self.grants,
+                'rejections': dict(self.rejections),
+                'wait': {'buckets': buckets, 'sum': self.wait_sum,
+                         'count': total}}
+
+
+# ----------------------------------------------------------------------
+
+
+def _labels(**labels) -> str:
+    return ','.join('{}="{}"'.format(k, str(v).replace('\\', r'\\')
+                                     .replace('"', r'\"').replace('\n', r'\n'))
+                    for k, v in labels.items())
+
+
+def _le(value: float) -> str:
+    return '+Inf' if value == float('inf') else repr(value)
+
+
+def prometheus_text(throttlers: Dict, prefix: str = 'throttler') -> str:
+    """
+    Export the metrics of several throttlers in the Prometheus text format
+      :param throttlers: a dict of name -> throttler (the name is used as the
+        `throttler` label)
+      :param prefix: prefix for the metric names
+    """
+    snaps = {name: thr.snapshot() for name, thr in throttlers.items()}
+    out = []
+
+    def header(metric: str, kind: str, text: str):
+        out.append(f'# HELP {prefix}_{metric} {text}')
+        out.append(f'# TYPE {prefix}_{metric} {kind}')
+
+    header('grants_total', 'counter', 'Processes granted access')
+    for name, snap in snaps.items():
+        out.append(f'{prefix}_grants_total{{{_labels(throttler=name)}}} {snap["grants"]}')
+
+    header('rejections_total', 'counter', 'Processes rejected, by exception type')
+    for name, snap in snaps.items():
+        for reason, n in snap['rejections'].items():
+            out.append(f'{prefix}_rejections_total{{{_labels(throttler=name, reason=reason)}}} {n}')
+
+    for metric, text in (('queue', 'Processes waiting'),
+                         ('in_flight', 'Processes inside the throttled block')):
+        header(metric, 'gauge', text)
+        for name, snap in snaps.items():
+            if snap[metric] is not None:
+                out.append(f'{prefix}_{metric}{{{_labels(throttler=name)}}} {snap[metric]}')
+
+    header('wait_seconds', 'histogram', 'Waiting time of granted processes')
+    for name, snap in snaps.items():
+        labels = _labels(throttler=name)
+        wait = snap['wait']
+        for le, n in wait['buckets']:
+            out.append(f'{prefix}_wait_seconds_bucket{{{labels},le="{_le(le)}"}} {n}')
+        out.append(f'{prefix}_wait_seconds_sum{{{labels}}} {wait["sum"]}')
+        out.append(f'{prefix}_wait_seconds_count{{{labels}}} {wait["count"]}')
+
+    return '\n'.join(out) + '\n'
@@ -0,0 +1,146 @@
+"""
+A timer heap to drive the waiting of many coroutines with a single event loop
+timer handle.
+
+Instead of each waiting coroutine running its own `asyncio.sleep()` (which
+places one timer handle per waiter in the event loop), waiters park a future
+in the heap of the scheduler. The scheduler keeps a single `loop.call_at()`
+handle for the earliest deadline and, when it fires, releases in one batch all
+the waiters that are due.
+"""
+
+import asyncio
+import heapq
+import itertools
+import weakref
+
+from typing import Union, Callable, Awaitable
+
+from .exception import ThrottlerInvArg
+
+
+# Shared schedulers, one per event loop
+_SHARED = weakref.WeakKeyDictionary()
+
+
+class TimerScheduler:
+    """
+    Timer heap releasing waiting futures at their deadlines.
+
+    It binds to the event loop in which it is first used.
+    """
+    __slots__ = ('_loop', '_heap', '_seq', '_handle', '_when', '__weakref__')
+
+    def __init__(self):
+        # A weak reference to the bound loop, since shared schedulers are
+        # values in a dictionary weakly keyed by the loop
+        self._loop = None
+        # Heap of (deadline, sequence, future) tuples
+        self._heap = []
+        self._seq = itertools.count()
+        # The event loop timer handle, and the time it is scheduled for
+        self._handle = None
+        self._when = None
+
+
+    @classmethod
+    def get(cls, loop: asyncio.AbstractEventLoop = None) -> 'TimerScheduler':
+        """
+        Return the scheduler shared by all users of an event loop (by default,
+        the running loop)
+        """
+        if loop is None:
+            loop = asyncio.get_running_loop()
+        sched = _SHARED.get(loop)
+        if sched is None:
+            sched = _SHARED[loop] = cls()
+        return sched
+
+
+    def __len__(self) -> int:
+        """
+        Number of entries in the heap (it may include cancelled waiters whose
+        deadline has not arrived yet)
+        """
+        return len(self._heap)
+
+
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        loop = asyncio.get_running_loop()
+        if self._loop is None or loop is not self._loop():
+            if self._heap:
+                raise RuntimeError("TimerScheduler is bound to a different event loop")
+            self._loop = weakref.ref(loop)
+            self._handle = self._when = None
+        return loop
+
+
+    def _arm(self, when: float):
+        """
+        Set the timer handle to fire at the given loop time
+        """
+        if self._handle:
+            self._handle.cancel()
+        self._when = when
+        self._handle = self._loop().call_at(when, self._fire)
+
+
+    def _fire(self):
+        """
+        Release all waiters that are due, and re-arm for the next deadline
+        """
+        self._handle = self._when = None
+        heap = self._heap
+        loop = self._loop()
+        limit = loop.time() + getattr(loop, '_clock_resolution', 0)
+        while heap and heap[0][0] <= limit:
+            fut = heapq.heappop(heap)[2]
+            if not fut.done():
+                fut.set_result(None)
+        if heap:
+            self._arm(heap[0][0])
+
+
+    def sleep_until(self, when: float) -> Awaitable:
+        """
+        Return an awaitable that completes at the given event loop time
+        """
+        loop = self._get_loop()
+        fut = loop.create_future()
+        heapq.heappush(self._heap, (when, next(self._seq), fut))
+        if self._when is None or when < self._when:
+            self._arm(when)
+        return fut
+
+
+    def sleep(self, delay: float) -> Awaitable:
+        """
+        Return an awaitable that completes after `delay` seconds
+        """
+        return self.sleep_until(self._get_loop().time() + delay)
+
+
+# ----------------------------------------------------------------------
+
+
+def shared_sleep(delay: float) -> Awaitable:
+    """
+    Sleep using the scheduler shared by the running event loop
+    """
+    return TimerScheduler.get().sleep(delay)
+
+
+def get_sleep(scheduler: Union[bool, TimerScheduler] = None) -> Callable:
+    """
+    Return the sleep function to use for a `scheduler` constructor argument:
+      - None/False: plain `asyncio.sleep`
+      - True: the scheduler shared by the running event loop
+      - a TimerScheduler object: that scheduler
+    """
+    if scheduler is None or scheduler is False:
+        return asyncio.sleep
+    elif scheduler is True:
+        return shared_sleep
+    elif isinstance(scheduler, TimerScheduler):
+        return scheduler.sleep
+    raise ThrottlerInvArg("`scheduler` must be a boolean or a TimerScheduler")
@@ -0,0 +1,494 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from heapq import heappush, heappop
+from itertools import count
+
+from typing import Dict, Hashable
+
+from .shared import SharedSlots
+
+
+class AdjustableSemaphore:
+    """
+    An asyncio semaphore whose limit can be changed while in use, and whose
+    waiters can have priorities.
+
+    When the limit is increased, waiters are woken up immediately. When it is
+    decreased, holders above the new limit are not affected, but no new
+    holders are admitted until the number of holders goes below the limit.
+
+    Waiters are served by priority (lower values first). With `aging`, a waiter
+    is served as if it had arrived `priority*aging` seconds later, so that
+    low-priority waiters eventually go ahead of newer high-priority ones.
+
+    Within the same priority, waiters are served by weighted fair queuing
+    across tenants: each waiter gets a virtual finish tag, computed from the
+    tag of the previous waiter of the same tenant (or the current virtual time,
+    if the tenant has no waiters) plus its cost divided by the tenant weight.
+    The virtual time is the tag of the last served waiter (self-clocked fair
+    queuing). Waiters without a tenant are a tenant on their own, so when no
+    tenants are used waiters are served in arrival order. Only tenants with
+    waiters are tracked.
+
+    Waiters of each priority are kept in their own heap, ordered by tag. The
+    next waiter served is the head of the heap with the lowest priority (or,
+    with aging, the lowest aged arrival time of its head), so enqueue is
+    O(log n) and dequeue is O(log n + p), with p the number of priorities in
+    use.
+    """
+    __slots__ = ('_limit', '_active', '_waiters', '_nwait', '_aging', '_seq',
+                 '_weights', '_tenants', '_vtime')
+
+    def __init__(self, limit: int, aging: float = None, weights: Dict = None):
+        """
+          :param limit: maximum number of holders
+          :param aging: time (seconds) a waiter must wait to go ahead of the
+            waiters of the previous priority level
+          :param weights: a dict of tenant weights (default weight is 1)
+        """
+        self._limit = limit
+        self._aging = aging
+        self._weights = weights or {}
+        # Tenants with waiters: tenant -> [last finish tag, number of waiters]
+        self._tenants = {}
+        # Virtual time
+        self._vtime = 0.0
+        # Number of holders
+        self._active = 0
+        # Waiters, as priority -> heap of (tag, seq, arrival, future, tenant)
+        # (heaps can include cancelled ones), and number of live waiters
+        self._waiters = {}
+        self._nwait = 0
+        self._seq = count()
+
+
+    @property
+    def limit(self) -> int:
+        return self._limit
+
+    @limit.setter
+    def limit(self, value: int):
+        self._limit = value
+        self._wake()
+
+
+    @property
+    def active(self) -> int:
+        """
+        Number of holders
+        """
+        return self._active
+
+
+    @property
+    def waiting(self) -> int:
+        """
+        Number of waiters
+        """
+        return self._nwait
+
+
+    def locked(self) -> bool:
+        """
+        Check if an acquisition would need to wait
+        """
+        return self._active >= self._limit or self._nwait > 0
+
+
+    def _push(self, fut: asyncio.Future, now: float, priority: int,
+              tenant: Hashable, cost: float):
+        """
+        Queue a waiter, with its virtual finish tag
+        """
+        entry = self._tenants.get(tenant)
+        if entry is None:
+            entry = self._tenants[tenant] = [self._vtime, 0]
+        tag = entry[0] = max(entry[0], self._vtime) + cost/self._weights.get(tenant, 1)
+        entry[1] += 1
+        heap = self._waiters.get(priority)
+        if heap is None:
+            heap = self._waiters[priority] = []
+        heappush(heap, (tag, next(self._seq), now, fut, tenant))
+        self._nwait += 1
+
+
+    def _pop(self) -> tuple:
+        """
+        Remove and return the next waiter to serve (None if there is none):
+        the head of each priority heap competes by its priority or, with
+        aging, by its arrival time plus `priority*aging`
+        """
+        best = None
+        for priority in list(self._waiters):
+            heap = self._waiters[priority]
+            while heap and heap[0][3].done():
+                heappop(heap)
+            if not heap:
+                del self._waiters[priority]
+                continue
+            tag, seq, arrival = heap[0][:3]
+            key = (arrival + priority*self._aging if self._aging else priority,
+                   tag, seq)
+            if best is None or key < best[0]:
+                best = key, heap
+        return heappop(best[1]) if best else None
+
+
+    def _wake(self):
+        """
+        Hand over free slots to waiters
+        """
+        while self._active < self._limit:
+            waiter = self._pop()
+            if waiter is None:
+                break
+            tag, _, _, fut, tenant = waiter
+            self._active += 1
+            self._nwait -= 1
+            if tag > self._vtime:
+                self._vtime = tag
+            self._leave(tenant)
+            fut.set_result(True)
+
+
+    def _leave(self, tenant: Hashable):
+        """
+        A waiter of a tenant leaves the queue
+        """
+        entry = self._tenants[tenant]
+        entry[1] -= 1
+        if not entry[1]:
+            del self._tenants[tenant]
+
+
+    async def acquire(self, priority: int = 0, tenant: Hashable = None,
+                      cost: float = 1) -> bool:
+        """
+        Acquire a slot
+          :param priority: priority of the waiter (lower values go first)
+          :param tenant: tenant of the waiter, for fair queuing
+          :param cost: cost of the waiter, for fair queuing
+        """
+        if not self.locked():
+            self._active += 1
+            return True
+
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        # Aging uses the loop time, which follows the loop clock
+        self._push(fut, loop.time(), priority, tenant, cost)
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.cancelled():
+                self._nwait -= 1
+                self._leave(tenant)
+            else:
+                # The slot was granted before cancellation: pass it on
+                self.release()
+            raise
+        return True
+
+
+    def release(self):
+        self._active -= 1
+        self._wake()
+
+
+    async def __aenter__(self):
+        await self.acquire()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.release()
+
+
+class LoopSafeSemaphore(AdjustableSemaphore):
+    """
+    An `AdjustableSemaphore` that can be used from coroutines running in
+    different event loops (each one in its own thread).
+
+    The state is protected by a thread lock. A slot is handed over to a
+    waiter directly if it runs in the current thread, and otherwise through
+    `call_soon_threadsafe()` on the loop of the waiter; handed over slots
+    are tracked until they arrive, so that a waiter cancelled meanwhile
+    passes its slot on.
+    """
+    __slots__ = ('_mutex', '_granted')
+
+    def __init__(self, limit: int, aging: float = None, weights: Dict = None):
+        super().__init__(limit, aging, weights)
+        self._mutex = threading.RLock()
+        # Futures of waiters whose slot is on its way to their loop
+        self._granted = set()
+
+
+    @property
+    def limit(self) -> int:
+        return self._limit
+
+    @limit.setter
+    def limit(self, value: int):
+        with self._mutex:
+            self._limit = value
+            self._wake()
+
+
+    def _wake(self):
+        # Called with the lock held
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None      # called from a thread without a loop
+        while self._active < self._limit:
+            waiter = self._pop()
+            if waiter is None:
+                break
+            tag, _, _, fut, tenant = waiter
+            loop = fut.get_loop()
+            if loop is not running:
+                try:
+                    loop.call_soon_threadsafe(self._arrive, fut)
+                except RuntimeError:
+                    continue    # the loop is closed
+                self._granted.add(fut)
+            else:
+                fut.set_result(True)
+            self._active += 1
+            self._nwait -= 1
+            if tag > self._vtime:
+                self._vtime = tag
+            self._leave(tenant)
+
+
+    def _arrive(self, fut: asyncio.Future):
+        """
+        A slot handed over from another thread arrives at the loop of the
+        waiter
+        """
+        with self._mutex:
+            self._granted.discard(fut)
+            if not fut.done():
+                fut.set_result(True)
+                return
+        self.release()
+
+
+    async def acquire(self, priority: int = 0, tenant: Hashable = None,
+                      cost: float = 1) -> bool:
+        with self._mutex:
+            if not self.locked():
+                self._active += 1
+                return True
+            fut = asyncio.get_running_loop().create_future()
+            self._push(fut, time.monotonic(), priority, tenant, cost)
+        try:
+            await fut
+        except asyncio.CancelledError:
+            with self._mutex:
+                if fut in self._granted:
+                    pass        # `_arrive()` will pass the slot on
+                elif fut.cancelled():
+                    self._nwait -= 1
+                    self._leave(tenant)
+                else:
+                    # The slot was granted before cancellation: pass it on
+                    self.release()
+            raise
+        return True
+
+
+    def release(self):
+        with self._mutex:
+            self._active -= 1
+            self._wake()
+
+
+class SharedSemaphore:
+    """
+    A semaphore shared by all processes in the host using the same name.
+
+    Slots are kept in a `SharedSlots` table. Within the process, tasks first
+    go through a local `AdjustableSemaphore` (which keeps the priority and
+    fairness order), and then take a shared slot. If there is none, they
+    poll the table with exponential backoff, so that the event loop is never
+    blocked.
+    """
+    __slots__ = ('_local', '_slots')
+
+    # Minimum and maximum polling intervals (seconds)
+    POLL_MIN = 0.001
+    POLL_MAX = 0.05
+
+    def __init__(self, name: str, limit: int, aging: float = None,
+                 weights: Dict = None):
+        """
+          :param name: name of the shared segment
+          :param limit: number of slots, in the host
+        """
+        self._slots = SharedSlots(name, limit)
+        self._local = AdjustableSemaphore(limit, aging, weights)
+
+
+    @property
+    def limit(self) -> int:
+        return self._local.limit
+
+    @limit.setter
+    def limit(self, value: int):
+        # Only the local limit can be adjusted
+        self._local.limit = value
+
+
+    @property
+    def active(self) -> int:
+        return self._local.active
+
+
+    @property
+    def waiting(self) -> int:
+        return self._local.waiting
+
+
+    def locked(self) -> bool:
+        return self._local.locked() or not self._slots.available()
+
+
+    async def acquire(self, priority: int = 0, tenant: Hashable = None,
+                      cost: float = 1) -> bool:
+        await self._local.acquire(priority, tenant, cost)
+        try:
+            poll = self.POLL_MIN
+            while not self._slots.try_acquire(time.monotonic()):
+                await asyncio.sleep(poll)
+                poll = min(2*poll, self.POLL_MAX)
+        except BaseException:
+            self._local.release()
+            raise
+        return True
+
+
+    def release(self):
+        self._slots.release()
+        self._local.release()
+
+
+    async def __aenter__(self):
+        await self.acquire()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.release()
+
+
+class ThreadSemaphore:
+    """
+    A semaphore that can be acquired both by threads (blocking) and by
+    coroutines in any event loop (without blocking the loop), served in
+    arrival order.
+
+    A released slot is handed over directly to the first waiter: a waiting
+    thread is woken through its own lock, and a waiting coroutine through
+    `call_soon_threadsafe()` on its loop.
+    """
+    __slots__ = ('_limit', '_active', '_waiters', '_mutex')
+
+    def __init__(self, limit: int):
+        self._limit = limit
+        self._active = 0
+        # Waiters: locks (threads) or (loop, future) pairs (coroutines)
+        self._waiters = deque()
+        self._mutex = threading.Lock()
+
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+
+    def locked(self) -> bool:
+        return self._active >= self._limit or bool(self._waiters)
+
+
+    def acquire(self, timeout: float = None) -> bool:
+        """
+        Take a slot, blocking the thread until there is one
+          :param timeout: maximum waiting time (seconds)
+          :return: False if the timeout expired
+        """
+        with self._mutex:
+            if self._active < self._limit and not self._waiters:
+                self._active += 1
+                return True
+            waiter = threading.Lock()
+            waiter.acquire()
+            self._waiters.append(waiter)
+        if waiter.acquire(timeout=-1 if timeout is None else timeout):
+            return True
+        with self._mutex:
+            # The slot may have been handed over just after the timeout
+            if waiter not in self._waiters:
+                return True
+            self._waiters.remove(waiter)
+            return False
+
+
+    async def acquire_async(self):
+        """
+        Take a slot, waiting asynchronously until there is one
+        """
+        with self._mutex:
+            if self._active < self._limit and not self._waiters:
+                self._active += 1
+                return True
+            loop = asyncio.get_running_loop()
+            fut = loop.create_future()
+            waiter = (loop, fut)
+            self._waiters.append(waiter)
+        try:
+            return await fut
+        except asyncio.CancelledError:
+            with self._mutex:
+                granted = waiter not in self._waiters
+                if not granted:
+                    self._waiters.remove(waiter)
+            # If the slot was handed over, give it to the next waiter (if the
+            # future is cancelled, `_wake()` will do it)
+            if granted and fut.done() and not fut.cancelled():
+                self.release()
+            raise
+
+
+    def _wake(self, fut: asyncio.Future):
+        # Called in the loop of the waiter
+        if fut.done():
+            self.release()
+        else:
+            fut.set_result(True)
+
+
+    def release(self):
+        with self._mutex:
+            while self._waiters:
+                waiter = self._waiters.popleft()
+                if isinstance(waiter, tuple):
+                    try:
+                        waiter[0].call_soon_threadsafe(self._wake, waiter[1])
+                        return
+                    except RuntimeError:
+                        continue    # the loop is closed
+                waiter.release()
+                return
+            self._active -= 1
+
+
+    def __enter__(self):
+        self.acquire()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
@@ -0,0 +1,264 @@
+"""
+Named shared memory segments, to share throttling state among processes in
+the same host. Access to the segment is serialized with an advisory file lock
+(so this is only available in POSIX systems).
+"""
+
+import os
+import tempfile
+from multiprocessing import shared_memory, resource_tracker
+
+try:
+    import fcntl
+except ImportError:     # not a POSIX system
+    fcntl = None
+
+from .exception import ThrottlerInvArg
+
+
+class SharedSegment:
+    """
+    A named shared memory segment holding an array of doubles, with a
+    reentrant inter-process lock (used as a context manager).
+
+    The segment is created by the first process using the name, and zero
+    initialized. It is not removed when processes exit; use `unlink()` for
+    that.
+    """
+    __slots__ = ('name', 'values', '_shm', '_lockf', '_depth', '_pid')
+
+    def __init__(self, name: str, size: int):
+        """
+          :param name: name of the segment
+          :param size: number of doubles in the segment
+        """
+        if fcntl is None:
+            raise ThrottlerInvArg('shared state is only available in POSIX systems')
+        if not (isinstance(name, str) and name and '/' not in name):
+            raise ThrottlerInvArg('`shared` must be a non-empty name without slashes')
+        self.name = name
+        self._open_lock()
+        with self:
+            try:
+                self._shm = _open(name, 8*size, True)
+            except FileExistsError:
+                self._shm = _open(name, 8*size, False)
+        if self._shm.size < 8*size:
+            self._shm.close()
+            self._lockf.close()
+            raise ThrottlerInvArg(f'shared segment `{name}` has a different configuration')
+        self.values = self._shm.buf[:8*size].cast('d')
+
+
+    @staticmethod
+    def _lockname(name: str) -> str:
+        return os.path.join(tempfile.gettempdir(), f'async_flow_control.{name}.lock')
+
+
+    def _open_lock(self):
+        """
+        Open the lock file. flock() locks belong to the open file, so each
+        process needs its own
+        """
+        self._depth = 0
+        self._pid = os.getpid()
+        self._lockf = open(self._lockname(self.name), 'a+b')
+
+
+    def __enter__(self):
+        if self._pid != os.getpid():
+            # Forked process: the inherited file would share the parent lock
+            self._lockf.close()
+            self._open_lock()
+        if not self._depth:
+            fcntl.flock(self._lockf.fileno(), fcntl.LOCK_EX)
+        self._depth += 1
+        return self
+
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._depth -= 1
+        if not self._depth:
+            fcntl.flock(self._lockf.fileno(), fcntl.LOCK_UN)
+
+
+    def close(self):
+        """
+        Detach from the segment
+        """
+        values = getattr(self, 'values', None)
+        if values is not None:
+            # The memory view must be released before closing the segment
+            values.release()
+            self.values = None
+            self._shm.close()
+        lockf = getattr(self, '_lockf', None)
+        if lockf is not None:
+            lockf.close()
+
+    __del__ = close
+
+
+    @classmethod
+    def unlink(cls, name: str):
+        """
+        Remove a shared segment (processes attached to it can still use it)
+        """
+        shm = shared_memory.SharedMemory(name)
+        shm.close()
+        shm.unlink()
+        try:
+            os.unlink(cls._lockname(name))
+        except FileNotFoundError:
+            pass
+
+
+def _open(name: str, size: int, create: bool) -> shared_memory.SharedMemory:
+    """
+    Open a segment, without registering it in the resource tracker (which
+    would remove it when the process exits)
+    """
+    try:
+        return shared_memory.SharedMemory(name, create, size, track=False)
+    except TypeError:   # Python < 3.13
+        shm = shared_memory.SharedMemory(name, create, size)
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+
+# ----------------------------------------------------------------------
+
+
+def _start_time(pid: int) -> float:
+    """
+    Start time of a process (in clock ticks since boot), to tell apart
+    processes reusing the same PID. Only available in Linux (0 elsewhere)
+    """
+    try:
+        with open(f'/proc/{pid}/stat', 'rb') as f:
+            stat = f.read()
+    except OSError:
+        return 0
+    # The process name can contain spaces: skip up to its closing parenthesis
+    return float(stat[stat.rindex(b')') + 2:].split()[19])
+
+
+def _alive(pid: int, start: float) -> bool:
+    """
+    Check if a process is still alive
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass    # it exists, but belongs to another user
+    return not start or _start_time(pid) == start
+
+
+class SharedSlots:
+    """
+    A table of concurrency slots in a shared memory segment, shared by all
+    processes in the host using the same name. Each slot records the PID (and
+    start time) of the process holding it, so that slots held by processes
+    that died without releasing them can be recovered.
+
+    Layout of the segment: slot limit, number of used slots, and a (PID,
+    start time) pair per slot (0 for free slots).
+    """
+    __slots__ = ('_seg', '_val', '_limit', '_pid', '_start', 'recover_interval',
+                 '_last_recover')
+
+    def __init__(self, name: str, limit: int, recover_interval: float = 1.0):
+        """
+          :param name: name of the shared segment
+          :param limit: number of slots
+          :param recover_interval: minimum time (seconds) between two scans
+            for slots held by dead processes
+        """
+        self._seg = SharedSegment(name, 2 + 2*limit)
+        self._val = self._seg.values
+        self._limit = limit
+        self.recover_interval = recover_interval
+        self._last_recover = 0.0
+        self._pid = self._start = None
+        with self._seg:
+            if not self._val[0]:
+                self._val[0] = limit
+            same = self._val[0] == limit
+        if not same:
+            self.close()
+            raise ThrottlerInvArg(f'shared segment `{name}` has a different concurrency limit')
+
+
+    def _owner(self):
+        # Computed on first use, and after a fork
+        pid = os.getpid()
+        if pid != self._pid:
+            self._pid, self._start = pid, _start_time(pid)
+        return self._pid, self._start
+
+
+    def available(self) -> bool:
+        """
+        Check (without locking) if there seem to be free slots
+        """
+        return self._val[1] < self._limit
+
+
+    def try_acquire(self, now: float) -> bool:
+        """
+        Take a free slot, if there is one
+          :param now: current timestamp, to decide on recovering slots
+        """
+        pid, start = self._owner()
+        val = self._val
+        with self._seg:
+            if val[1] >= self._limit:
+                if now - self._last_recover < self.recover_interval:
+                    return False
+                self._last_recover = now
+                if not self._recover():
+                    return False
+            for n in range(2, 2 + 2*self._limit, 2):
+                if not val[n]:
+                    val[n], val[n + 1] = pid, start
+                    val[1] += 1
+                    return True
+        return False
+
+
+    def _recover(self) -> int:
+        """
+        Free the slots held by dead processes. Must be called with the lock
+        """
+        val = self._val
+        freed = 0
+        for n in range(2, 2 + 2*self._limit, 2):
+            if val[n] and not _alive(int(val[n]), val[n + 1]):
+                val[n] = val[n + 1] = 0
+                freed += 1
+        val[1] -= freed
+        return freed
+
+
+    def release(self):
+        """
+        Release a slot held by this process
+        """
+        pid, start = self._owner()
+        val = self._val
+        with self._seg:
+            for n in range(2, 2 + 2*self._limit, 2):
+                if val[n] == pid and val[n + 1] == start:
+                    val[n] = val[n + 1] = 0
+                    val[1] -= 1
+                    return
+
+
+    def close(self):
+        """
+        Detach from the shared segment
+        """
+        self._val = None
+        self._seg.close()
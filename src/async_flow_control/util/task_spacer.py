@@ -1,10 +1,10 @@
-import asyncio
-import time
-
-from typing import Callable
+from typing import Callable, Union
 
 from .base import BaseAsyncThrottler
+from .clock import Clock, check_clock
 from .exception import ThrottlerInvArg
+from .metrics import ThrottlerMetrics
+from .scheduler import TimerScheduler, get_sleep
 
 
 class TaskSpacer(BaseAsyncThrottler):
@@ -17,24 +17,34 @@ class TaskSpacer(BaseAsyncThrottler):
 
     It will only work with strictly sequential context blocks
     """
-    __slots__ = ('_period', '_align_sleep', '_start_time', '_next_time')
+    __slots__ = ('_period', '_align_sleep', '_start_time', '_next_time', '_sleep',
+                 '_metrics', '_clock')
 
 
     def __init__(self, task_space: float = 1.0, align: bool = False,
-                 logger: Callable = None, log_msg: str = None):
+                 logger: Callable = None, log_msg: str = None,
+                 scheduler: Union[bool, TimerScheduler] = None,
+                 clock: Clock = None):
         """
           :param task_space: time (seconds) that tasks should be spaced
           :param align: align executions to integer multiples of task_space
           :param logger: a callable that will be used to log waiting times
           :param log_msg: logging message to send to the callable
+          :param scheduler: use a timer heap for async waits, either a
+             `TimerScheduler` object or `True` for the event loop shared one
+          :param clock: source of time and synchronous sleeps (e.g. a
+             `VirtualClock`); by default, the system clock
         """
         if not isinstance(task_space, (float, int)) or task_space <= 0:
             raise ThrottlerInvArg("`task_space` must be a positive value")
         self._period = task_space
         self._align_sleep = align
+        self._sleep = get_sleep(scheduler)
+        self._clock = check_clock(clock)
 
         self._start_time = 0.0
         self._next_time = 0.0
+        self._metrics = ThrottlerMetrics()
 
         self._log = logger
         self._log_msg = log_msg or "TaskSpacer: wait %.3f"
@@ -43,7 +53,7 @@ class TaskSpacer(BaseAsyncThrottler):
 
 
     def _start(self):
-        curr_time = time.monotonic()
+        curr_time = self._clock.monotonic()
         diff = self._next_time - curr_time
         return diff
 
@@ -61,8 +71,11 @@ class TaskSpacer(BaseAsyncThrottler):
         if diff > 0.0:
             if self._log:
                 self._log(self._log_msg, diff)
-            time.sleep(diff)
-        self._start_time = time.monotonic()
+            self._clock.sleep(diff)
+            self._metrics.observe(diff)
+        else:
+            self._metrics.grants += 1
+        self._start_time = self._clock.monotonic()
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         self._exit()
@@ -75,8 +88,11 @@ class TaskSpacer(BaseAsyncThrottler):
         if diff > 0.0:
             if self._log:
                 self._log(self._log_msg, diff)
-            await asyncio.sleep(diff)
-        self._start_time = time.monotonic()
+            await self._sleep(diff)
+            self._metrics.observe(diff)
+        else:
+            self._metrics.grants += 1
+        self._start_time = self._clock.monotonic()
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
         self._exit()
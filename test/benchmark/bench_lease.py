@@ -0,0 +1,52 @@
+"""
+Benchmark: round trips to the rate store and per-process overhead of
+RateAsyncThrottler with a leased global quota, for several lease sizes, using
+the local TCP rate store server.
+
+Run as:
+    PYTHONPATH=src python test/benchmark/bench_lease.py [-n PROCESSES] [SIZE ...]
+"""
+
+import argparse
+import asyncio
+import time
+
+from async_flow_control import RateAsyncThrottler
+from async_flow_control.async_throttler.rate_store import RateStoreServer, RemoteRateStore
+from async_flow_control.async_throttler.rate_lease import TokenLease
+
+
+async def run(n: int, size: int):
+    """
+    Grant `n` processes through a leased throttler, and return the number of
+    round trips and the time per process (us)
+    """
+    async with RateStoreServer() as server:
+        store = RemoteRateStore(port=server.port)
+        lease = TokenLease(store, "bench", size=size)
+        thr = RateAsyncThrottler(10**9, lease=lease)
+        start = time.perf_counter()
+        for _ in range(n):
+            async with thr:
+                pass
+        elapsed = time.perf_counter() - start
+        await lease.close()
+        await store.close()
+    return store.requests, elapsed/n*1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("-n", type=int, default=20000, help="processes")
+    parser.add_argument("sizes", type=int, nargs="*", default=[1, 10, 100, 1000],
+                        help="lease sizes")
+    args = parser.parse_args()
+
+    print(f"{'size':>6} {'round trips':>12} {'us/process':>11}")
+    for size in args.sizes:
+        trips, us = asyncio.run(run(args.n, size))
+        print(f"{size:>6} {trips:>12} {us:>11.2f}")
+
+
+if __name__ == "__main__":
+    main()
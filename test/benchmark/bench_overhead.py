@@ -0,0 +1,60 @@
+"""
+Benchmark: per-entry overhead (ns) of uncontended enter/exit of the throttlers
+
+Run as:
+    PYTHONPATH=src python test/benchmark/bench_overhead.py [-n ITERATIONS]
+"""
+
+import argparse
+import asyncio
+import os
+import time
+
+from async_flow_control import (RateAsyncThrottler, ConcurrencyAsyncThrottler,
+                                CompositeAsyncThrottler, TaskSpacer, DummySpacer)
+from async_flow_control.util.shared import SharedSegment
+
+
+SHM_NAME = f"afc_bench_{os.getpid()}"
+
+
+THROTTLERS = {
+    "dummy": lambda: DummySpacer(),
+    "rate": lambda: RateAsyncThrottler(10**9),
+    "rate-reserve": lambda: RateAsyncThrottler(10**9, reserve=True),
+    "rate-shared": lambda: RateAsyncThrottler(10**9, shared=SHM_NAME),
+    "rate-loop-safe": lambda: RateAsyncThrottler(10**9, loop_safe=True),
+    "concurrency": lambda: ConcurrencyAsyncThrottler(1000),
+    "concurrency-timeout": lambda: ConcurrencyAsyncThrottler(1000, timeout=10),
+    "composite": lambda: CompositeAsyncThrottler(rate_limit=10**9, concurrency_limit=1000),
+    "spacer": lambda: TaskSpacer(1e-9),
+}
+
+
+async def run(thr, n: int) -> float:
+    """
+    Enter and exit the throttler `n` times, and return ns per iteration
+    """
+    start = time.perf_counter_ns()
+    for _ in range(n):
+        async with thr:
+            pass
+    return (time.perf_counter_ns() - start) / n
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("-n", type=int, default=100000, help="iterations")
+    parser.add_argument("-r", type=int, default=5, help="repetitions (best is kept)")
+    args = parser.parse_args()
+
+    try:
+        for name, factory in THROTTLERS.items():
+            ns = min(asyncio.run(run(factory(), args.n)) for _ in range(args.r))
+            print(f"{name:>20}: {ns:8.0f} ns")
+    finally:
+        SharedSegment.unlink(SHM_NAME)
+
+
+if __name__ == "__main__":
+    main()
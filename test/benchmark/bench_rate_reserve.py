@@ -0,0 +1,48 @@
+"""
+Benchmark: achieved rate vs. configured rate for RateAsyncThrottler, comparing
+lock mode and reservation mode with many concurrent waiters.
+
+Run as:
+    PYTHONPATH=src python test/benchmark/bench_rate_reserve.py [--rate N] [N ...]
+"""
+
+import argparse
+import asyncio
+import time
+
+from async_flow_control import RateAsyncThrottler
+
+
+async def run(rate: int, waiters: int, reserve: bool) -> float:
+    """
+    Launch `waiters` simultaneous tasks and return the achieved grant rate
+    """
+    thr = RateAsyncThrottler(rate, reserve=reserve)
+    grants = []
+
+    async def task():
+        await thr.wait()
+        grants.append(time.monotonic())
+
+    await asyncio.gather(*[task() for _ in range(waiters)])
+    return (len(grants) - 1) / (grants[-1] - grants[0])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--rate", type=int, default=5000,
+                        help="configured rate limit (per second)")
+    parser.add_argument("waiters", type=int, nargs="*", default=[1000, 10000],
+                        help="number of concurrent waiters")
+    args = parser.parse_args()
+
+    print(f"{'waiters':>8} {'mode':>8} {'target':>8} {'achieved':>9} {'ratio':>6}")
+    for n in args.waiters:
+        for reserve in (False, True):
+            got = asyncio.run(run(args.rate, n, reserve))
+            mode = "reserve" if reserve else "lock"
+            print(f"{n:8} {mode:>8} {args.rate:8} {got:9.1f} {got/args.rate:6.3f}")
+
+
+if __name__ == "__main__":
+    main()
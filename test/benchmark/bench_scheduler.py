@@ -0,0 +1,47 @@
+"""
+Benchmark: park many waiters behind a RateAsyncThrottler in reservation mode,
+comparing plain asyncio sleeps with a TimerScheduler heap.
+
+Run as:
+    PYTHONPATH=src python test/benchmark/bench_scheduler.py [N ...]
+"""
+
+import argparse
+import asyncio
+import time
+import tracemalloc
+
+from async_flow_control import RateAsyncThrottler
+
+
+async def run(waiters: int, scheduler: bool):
+    """
+    Launch `waiters` tasks on a throttler that releases them all within one
+    second, and return total time and peak traced memory
+    """
+    thr = RateAsyncThrottler(waiters, reserve=True, scheduler=scheduler)
+    tracemalloc.start()
+    start = time.perf_counter()
+    await asyncio.gather(*[thr.wait() for _ in range(waiters)])
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("waiters", type=int, nargs="*", default=[10000, 100000],
+                        help="number of concurrent waiters")
+    args = parser.parse_args()
+
+    print(f"{'waiters':>8} {'mode':>10} {'time (s)':>9} {'peak MB':>8}")
+    for n in args.waiters:
+        for scheduler in (False, True):
+            elapsed, peak = asyncio.run(run(n, scheduler))
+            mode = "scheduler" if scheduler else "sleep"
+            print(f"{n:8} {mode:>10} {elapsed:9.3f} {peak/1e6:8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+"""
+Benchmark suite: overhead, throughput, rate accuracy and wake-up jitter of the
+throttlers, decorators and timers, and speed of the offline simulator, with
+results in JSON
+
+Results are a flat mapping from metric names to a value, a unit and the
+direction that is better ("lower" or "higher"), so that two runs (e.g. of two
+releases) can be compared with `--compare`.
+
+Run as:
+    PYTHONPATH=src python test/benchmark/bench_suite.py [-o RESULTS.json] [--compare BASELINE.json]
+"""
+
+import argparse
+import asyncio
+import json
+import platform
+import random
+import sys
+import time
+
+from async_flow_control import (__version__, RateAsyncThrottler,
+                                ConcurrencyAsyncThrottler, TaskSpacer,
+                                DummySpacer, Timer, TaskTimer, simulate)
+from async_flow_control.decorator import throttle, timer_async, task_timer
+
+
+THROTTLERS = {
+    "dummy": lambda: DummySpacer(),
+    "rate": lambda: RateAsyncThrottler(10**9),
+    "concurrency": lambda: ConcurrencyAsyncThrottler(1000),
+    "spacer": lambda: TaskSpacer(1e-9),
+}
+
+SIMULATIONS = {
+    "spacing": {"rate_limit": 25},
+    "burst": {"rate_limit": 25, "burst": 10},
+    "limits": {"rate_limit": 25, "max_queue": 20, "timeout": 1.0},
+    "tiers": {"rate_limit": [(25, 1.0), (200, 10.0)]},
+    "concurrency": {"concurrency_limit": 4},
+    "composite": {"rate_limit": 25, "concurrency_limit": 4, "max_queue": 20},
+}
+
+
+def _noop_decorated():
+    """
+    Decorated no-op coroutine functions
+    """
+    @throttle(rate_limit=10**9)
+    async def throttled():
+        pass
+
+    @timer_async(quiet=True)
+    async def timed():
+        pass
+
+    @task_timer(quiet=True, block_threshold=None)
+    async def task_timed():
+        pass
+
+    return {"throttle": throttled, "timer_async": timed, "task_timer": task_timed}
+
+
+def _percentile(values, p: float) -> float:
+    values = sorted(values)
+    return values[min(int(p*len(values)), len(values) - 1)]
+
+
+# ---------------------------------------------------------------------------
+
+
+async def overhead(n: int) -> dict:
+    """
+    Nanoseconds per uncontended enter/exit or decorated call
+    """
+    results = {}
+    for name, factory in THROTTLERS.items():
+        thr = factory()
+        start = time.perf_counter_ns()
+        for _ in range(n):
+            async with thr:
+                pass
+        results[name] = (time.perf_counter_ns() - start)/n
+
+    for name, func in _noop_decorated().items():
+        start = time.perf_counter_ns()
+        for _ in range(n):
+            await func()
+        results[name] = (time.perf_counter_ns() - start)/n
+
+    t = Timer(quiet=True)
+    start = time.perf_counter_ns()
+    for _ in range(n):
+        with t:
+            pass
+    results["timer"] = (time.perf_counter_ns() - start)/n
+
+    tt = TaskTimer(quiet=True, block_threshold=None)
+
+    async def noop():
+        pass
+
+    start = time.perf_counter_ns()
+    for _ in range(n):
+        await tt.measure(noop())
+    results["task_timer_measure"] = (time.perf_counter_ns() - start)/n
+    return results
+
+
+async def throughput(n: int, tasks: int) -> dict:
+    """
+    Acquisitions per second with `tasks` concurrent tasks sharing `n`
+    acquisitions
+    """
+    results = {}
+    per_task = max(n//tasks, 1)
+    for name, factory in THROTTLERS.items():
+        thr = factory()
+
+        async def worker():
+            for _ in range(per_task):
+                async with thr:
+                    await asyncio.sleep(0)
+
+        start = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(tasks)])
+        results[name] = per_task*tasks/(time.perf_counter() - start)
+    return results
+
+
+async def accuracy(rate: int, n: int) -> dict:
+    """
+    Achieved rate relative to the configured rate, and wake-up jitter
+    (deviation of the interval between grants from the configured one) in
+    microseconds. The rate throttler is used by `n` simultaneous waiters; the
+    task spacer, which only handles sequential blocks, by one task `n` times
+    """
+    results = {}
+    for name in ("rate", "spacer"):
+        grants = []
+        if name == "rate":
+            thr = RateAsyncThrottler(rate)
+
+            async def task():
+                async with thr:
+                    grants.append(time.perf_counter())
+
+            await asyncio.gather(*[task() for _ in range(n)])
+        else:
+            thr = TaskSpacer(1/rate)
+            for _ in range(n):
+                async with thr:
+                    grants.append(time.perf_counter())
+
+        achieved = (len(grants) - 1)/(grants[-1] - grants[0])
+        results[f"{name}.ratio"] = achieved/rate
+        jitter = [abs(b - a - 1/rate)*1e6 for a, b in zip(grants, grants[1:])]
+        for p in (0.5, 0.9, 0.99):
+            results[f"{name}.jitter.p{100*p:g}"] = _percentile(jitter, p)
+    return results
+
+
+def simulation(n: int) -> dict:
+    """
+    Simulated events per second, over a trace of `n` Poisson arrivals (at 20
+    per second) with exponential service times (mean 0.1 s)
+    """
+    rnd = random.Random(1)
+    arrivals, t = [], 0.0
+    for _ in range(n):
+        t += rnd.expovariate(20)
+        arrivals.append(t)
+    durations = [rnd.expovariate(10) for _ in range(n)]
+    results = {}
+    for name, config in SIMULATIONS.items():
+        start = time.perf_counter()
+        simulate(config, arrivals, durations)
+        results[name] = n/(time.perf_counter() - start)
+    return results
+
+
+# ---------------------------------------------------------------------------
+
+
+def run(args) -> dict:
+    results = {}
+
+    def add(prefix: str, values: dict, unit: str, better: str):
+        for name, value in values.items():
+            results[f"{prefix}.{name}"] = {"value": value, "unit": unit, "better": better}
+
+    for _ in range(args.repeat):
+        best = asyncio.run(overhead(args.n))
+        for name, value in best.items():
+            key = f"overhead.{name}"
+            if key not in results or value < results[key]["value"]:
+                add("overhead", {name: value}, "ns", "lower")
+
+    for tasks in args.tasks:
+        add(f"throughput.{tasks}", asyncio.run(throughput(args.n, tasks)),
+            "ops/s", "higher")
+
+    acc = asyncio.run(accuracy(args.rate, args.waiters))
+    for name, value in acc.items():
+        if name.endswith("ratio"):
+            add("accuracy", {name: value}, "ratio", "higher")
+        else:
+            add("accuracy", {name: value}, "us", "lower")
+
+    add("simulation", simulation(args.events), "events/s", "higher")
+
+    return {"meta": {"version": __version__,
+                     "python": platform.python_version(),
+                     "implementation": platform.python_implementation(),
+                     "platform": platform.platform(),
+                     "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                     "args": vars(args)},
+            "results": results}
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> int:
+    """
+    Print the metrics of a run relative to a baseline run, and return the
+    number of regressions beyond the threshold
+    """
+    regressions = 0
+    print(f"{'metric':>36} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, cur in current["results"].items():
+        base = baseline["results"].get(name)
+        if base is None or not base["value"]:
+            continue
+        change = cur["value"]/base["value"] - 1
+        worse = change > threshold if cur["better"] == "lower" else change < -threshold
+        regressions += worse
+        print(f"{name:>36} {base['value']:12.5g} {cur['value']:12.5g} "
+              f"{100*change:+7.1f}%{' !' if worse else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("-n", type=int, default=20000,
+                        help="iterations for overhead and throughput")
+    parser.add_argument("-r", "--repeat", type=int, default=3,
+                        help="repetitions of the overhead measure (best is kept)")
+    parser.add_argument("--tasks", type=int, nargs="+", default=[1, 100, 10000],
+                        help="numbers of concurrent tasks for throughput")
+    parser.add_argument("--rate", type=int, default=200,
+                        help="configured rate for accuracy and jitter")
+    parser.add_argument("--waiters", type=int, default=400,
+                        help="simultaneous waiters for accuracy and jitter")
+    parser.add_argument("--events", type=int, default=200000,
+                        help="trace length for the simulator speed")
+    parser.add_argument("-o", "--output", help="write results to this JSON file")
+    parser.add_argument("--compare", metavar="BASELINE",
+                        help="compare with the results in a JSON file")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="relative change flagged as a regression")
+    args = parser.parse_args()
+
+    results = run(args)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        sys.exit(1 if compare(results, baseline, args.threshold) else 0)
+    if not args.output:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Benchmark: scaling of the thread-safe throttlers with the number of threads.
+For RateThrottler it reports the achieved grant rate vs. the configured rate;
+for ConcurrencyThrottler, the throughput of enter/exit cycles (each holding
+the slot for a short sleep) vs. the ideal throughput.
+
+Run as:
+    PYTHONPATH=src python test/benchmark/bench_threads.py [--rate N] [THREADS ...]
+"""
+
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from async_flow_control import RateThrottler, ConcurrencyThrottler
+
+
+def bench_rate(rate: int, threads: int, n: int) -> float:
+    """
+    Grant `n` processes per thread, and return the achieved rate
+    """
+    thr = RateThrottler(rate)
+    grants = []
+
+    def worker(_):
+        for _ in range(n):
+            thr.wait()
+            grants.append(time.monotonic())
+
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(worker, range(threads)))
+    grants.sort()
+    return (len(grants) - 1) / (grants[-1] - grants[0])
+
+
+def bench_concurrency(limit: int, threads: int, n: int, hold: float) -> float:
+    """
+    Run `n` enter/exit cycles per thread, and return the cycles per second
+    """
+    thr = ConcurrencyThrottler(limit)
+
+    def worker(_):
+        for _ in range(n):
+            with thr:
+                time.sleep(hold)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(worker, range(threads)))
+    return threads*n / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--rate", type=int, default=2000,
+                        help="configured rate limit (per second)")
+    parser.add_argument("--limit", type=int, default=16, help="concurrency limit")
+    parser.add_argument("--hold", type=float, default=0.001,
+                        help="time holding a concurrency slot (seconds)")
+    parser.add_argument("threads", type=int, nargs="*", default=[1, 4, 16, 64],
+                        help="number of threads")
+    args = parser.parse_args()
+
+    print(f"{'threads':>8} {'rate':>9} {'ratio':>6} {'cycles/s':>9} {'ratio':>6}")
+    for threads in args.threads:
+        n = max(args.rate // threads, 10)
+        rate = bench_rate(args.rate, threads, n)
+        cycles = bench_concurrency(args.limit, threads, max(4000 // threads, 10),
+                                   args.hold)
+        ideal = min(threads, args.limit) / args.hold
+        print(f"{threads:>8} {rate:>9.0f} {rate/args.rate:>6.2f}"
+              f" {cycles:>9.0f} {cycles/ideal:>6.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+import pytest
+
+from async_flow_control.util.exception import ThrottlerInvArg
+from async_flow_control.async_throttler.adaptive_limit import (
+    AIMDLimit, GradientLimit, adaptive_limit)
+
+
+def test100_err():
+    with pytest.raises(ThrottlerInvArg) as e:
+        AIMDLimit(5, 2)
+    assert "limits must be positive integers with `min_limit` <= `max_limit`" == str(e.value)
+
+
+def test110_err():
+    with pytest.raises(ThrottlerInvArg) as e:
+        AIMDLimit(backoff=1.5)
+    assert "`backoff` must be between 0 and 1" == str(e.value)
+
+
+def test120_create():
+    limit = adaptive_limit('gradient', 20)
+    assert isinstance(limit, GradientLimit)
+    assert (limit.min_limit, limit.max_limit, limit.limit) == (1, 20, 20)
+    assert adaptive_limit(limit, 10) is limit
+
+
+def test200_aimd():
+    limit = AIMDLimit(1, 10, initial=4, threshold=0.1, backoff=0.5)
+    # Not used: no growth
+    assert limit.update(0.01, 1) == 4
+    # Used: additive increase
+    assert limit.update(0.01, 4) == 5
+    # Slow or dropped: multiplicative decrease
+    assert limit.update(0.2, 5) == 2
+    assert limit.update(0.01, 2, drop=True) == 1
+    assert limit.update(0.2, 1) == 1
+    for _ in range(20):
+        limit.update(0.01, limit.limit)
+    assert limit.limit == 10
+
+
+def test210_gradient():
+    limit = GradientLimit(1, 100, initial=10, window=100)
+    # Stable latency: grows
+    for _ in range(10):
+        limit.update(0.1, limit.limit)
+    assert limit.limit > 15
+    # Latency doubles: shrinks
+    high = limit.limit
+    for _ in range(10):
+        limit.update(0.5, limit.limit)
+    assert limit.limit < high
+    # Drops: shrinks fast
+    low = limit.limit
+    limit.update(0.1, limit.limit, drop=True)
+    assert limit.limit < low
+
+
+def test220_gradient_zero_latency():
+    limit = GradientLimit(1, 10, initial=5)
+    limit.update(0, 5)
+    assert limit.update(0, 5) >= 5
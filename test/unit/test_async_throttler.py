@@ -2,6 +2,7 @@
 from async_flow_control.util.exception import ThrottlerInvArg
 from async_flow_control.util import TaskSpacer, DummySpacer
 from async_flow_control import AsyncThrottler, RateAsyncThrottler, ConcurrencyAsyncThrottler
+from async_flow_control import CompositeAsyncThrottler
 
 import pytest
 
@@ -14,8 +15,8 @@ def test100_err():
 
 def test110_err():
     with pytest.raises(ThrottlerInvArg) as e:
-        AsyncThrottler(rate_limit=10, concurrency_limit=2)
-    assert "rate/concurrency/space are not compatible" == str(e.value)
+        AsyncThrottler(concurrency_limit=2, task_space=1, align=True)
+    assert "align not supported for CompositeThrottler" == str(e.value)
 
 
 def test200_rate():
@@ -36,3 +37,8 @@ def test220_space():
 def test220_dummy():
     at = AsyncThrottler(task_space=2, dummy=True)
     assert isinstance(at, DummySpacer)
+
+
+def test230_composite():
+    at = AsyncThrottler(rate_limit=10, concurrency_limit=2)
+    assert isinstance(at, CompositeAsyncThrottler)
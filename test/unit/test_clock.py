@@ -0,0 +1,161 @@
+import asyncio
+import time
+
+import pytest
+
+from async_flow_control.util.exception import ThrottlerInvArg, ThrottlerTimeout
+from async_flow_control import (VirtualClock, RateAsyncThrottler,
+                                ConcurrencyAsyncThrottler, CompositeAsyncThrottler,
+                                KeyedThrottler, TaskSpacer, RateThrottler, Timer)
+
+
+def test100_err():
+    with pytest.raises(ThrottlerInvArg) as e:
+        RateAsyncThrottler(10, clock=time.monotonic)
+    assert "`clock` must be a Clock object" == str(e.value)
+    with pytest.raises(ThrottlerInvArg):
+        RateAsyncThrottler(10, shared="afc_test_clock", clock=VirtualClock())
+    with pytest.raises(ThrottlerInvArg):
+        VirtualClock().advance(-1)
+
+
+def test110_loop():
+    """
+    The loop jumps to the next timer
+    """
+    clock = VirtualClock()
+
+    async def main():
+        await asyncio.sleep(3600)
+        await asyncio.gather(*[asyncio.sleep(i) for i in range(10)])
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(asyncio.sleep(10), 0.5)
+        return asyncio.get_running_loop().time()
+
+    start = time.monotonic()
+    assert clock.run(main()) == 3609.5
+    assert clock.monotonic() == 3609.5
+    assert time.monotonic() - start < 0.5
+
+
+def test200_rate():
+    """
+    An hour of throttled traffic, reproducible
+    """
+    def simulate():
+        clock = VirtualClock()
+        rt = RateAsyncThrottler(10, clock=clock)
+        grants = []
+
+        async def task(n):
+            for _ in range(n):
+                async with rt:
+                    grants.append(clock.monotonic())
+
+        async def main():
+            await asyncio.gather(*[task(3600) for _ in range(10)])
+
+        clock.run(main())
+        return grants
+
+    start = time.monotonic()
+    grants = simulate()
+    assert time.monotonic() - start < 5
+    assert len(grants) == 36000
+    assert grants[-1] == pytest.approx(3599.9)
+    assert simulate() == grants
+
+
+def test210_rate_pause():
+    clock = VirtualClock(100)
+    rt = RateAsyncThrottler(2, clock=clock)
+
+    async def main():
+        await rt.wait()
+        rt.feedback('throttled', retry_after=10)
+        await rt.wait()
+        return clock.monotonic()
+
+    # Pending grants are pushed back by the pause
+    assert clock.run(main()) == 110.5
+
+
+def test220_concurrency():
+    clock = VirtualClock()
+    ct = ConcurrencyAsyncThrottler(2, queue_timeout=5, clock=clock)
+
+    async def task(t):
+        async with ct:
+            await asyncio.sleep(t)
+
+    async def main():
+        r = await asyncio.gather(task(10), task(4), task(1), task(1),
+                                 return_exceptions=True)
+        return r, clock.monotonic()
+
+    r, end = clock.run(main())
+    assert r[:3] == [None, None, None]
+    assert isinstance(r[3], ThrottlerTimeout)
+    assert end == 10
+    assert ct.snapshot()['wait']['sum'] == 4
+
+
+def test230_composite():
+    clock = VirtualClock()
+    ct = CompositeAsyncThrottler(rate_limit=2, concurrency_limit=1, clock=clock)
+    starts = []
+
+    async def task():
+        async with ct:
+            starts.append(clock.monotonic())
+            await asyncio.sleep(1)
+
+    async def main():
+        await asyncio.gather(*[task() for _ in range(3)])
+
+    clock.run(main())
+    assert starts == [0, 1, 2]
+
+
+def test240_keyed_ttl():
+    clock = VirtualClock()
+    kt = KeyedThrottler(ttl=10, rate_limit=1, clock=clock)
+
+    async def main():
+        thr = kt.get('a')
+        async with kt('a'):
+            pass
+        await asyncio.sleep(20)
+        kt.get('b')
+        return thr
+
+    thr = clock.run(main())
+    assert 'a' not in kt._live
+    assert thr._now == clock.monotonic
+
+
+def test300_sync():
+    """
+    Synchronous sleeps advance the clock
+    """
+    clock = VirtualClock()
+    ts = TaskSpacer(2, clock=clock)
+    for _ in range(3):
+        with ts:
+            pass
+    assert clock.monotonic() == 4
+
+    rt = RateThrottler(4, clock=clock)
+    for _ in range(5):
+        rt.wait()
+    assert clock.monotonic() == 5
+
+
+def test310_timer():
+    clock = VirtualClock()
+    t = Timer("unit", quiet=True, clock=clock)
+    for d in (1, 2, 3):
+        with t:
+            clock.advance(d)
+    assert t.stats.mean == 2
+    assert t.stats.max == 3
@@ -0,0 +1,92 @@
+import asyncio
+import multiprocessing
+import os
+import sys
+import time
+
+import pytest
+
+from async_flow_control.util.exception import ThrottlerInvArg
+from async_flow_control.util.shared import SharedSegment, SharedSlots
+from async_flow_control import ConcurrencyAsyncThrottler
+
+
+pytestmark = pytest.mark.skipif(sys.platform == 'win32',
+                                reason='shared state needs POSIX')
+
+
+@pytest.fixture
+def name():
+    name = f'afc_test_conc_{os.getpid()}'
+    yield name
+    SharedSegment.unlink(name)
+
+
+def test100_err(name):
+    ConcurrencyAsyncThrottler(3, shared=name)
+    with pytest.raises(ThrottlerInvArg) as e:
+        ConcurrencyAsyncThrottler(2, shared=name)
+    assert f"shared segment `{name}` has a different concurrency limit" == str(e.value)
+    with pytest.raises(ThrottlerInvArg) as e:
+        ConcurrencyAsyncThrottler(4, shared=name)
+    assert f"shared segment `{name}` has a different configuration" == str(e.value)
+
+
+def test110_slots(name):
+    slots = SharedSlots(name, 2)
+    assert slots.try_acquire(0)
+    assert slots.try_acquire(0)
+    assert not slots.try_acquire(0)
+    slots.release()
+    assert slots.available()
+    assert slots.try_acquire(0)
+
+
+@pytest.mark.asyncio
+async def test200_shared(name):
+    """
+    Two throttlers using the same segment share the slots
+    """
+    ct1 = ConcurrencyAsyncThrottler(2, shared=name)
+    ct2 = ConcurrencyAsyncThrottler(2, shared=name)
+
+    async def task(ct):
+        async with ct:
+            await asyncio.sleep(0.1)
+
+    start = time.monotonic()
+    await asyncio.gather(task(ct1), task(ct1), task(ct2), task(ct2))
+    elapsed = time.monotonic() - start
+    assert 0.2 < elapsed < 0.25
+
+
+@pytest.mark.asyncio
+async def test210_shared_timeout(name):
+    ct1 = ConcurrencyAsyncThrottler(1, shared=name)
+    ct2 = ConcurrencyAsyncThrottler(1, shared=name, queue_timeout=0.05)
+    async with ct1:
+        with pytest.raises(Exception) as e:
+            async with ct2:
+                pass
+        assert str(e.value) == "queue timeout exceeded: 0.05"
+    # The local slot was released
+    assert not ct2._sem.active
+
+
+def crash(name):
+    slots = SharedSlots(name, 1)
+    slots.try_acquire(time.monotonic())
+    os._exit(0)
+
+
+def test300_recover(name):
+    """
+    Slots held by dead processes are recovered
+    """
+    slots = SharedSlots(name, 1, recover_interval=0)
+    ctx = multiprocessing.get_context('fork')
+    p = ctx.Process(target=crash, args=(name,))
+    p.start()
+    p.join()
+    assert not slots.available()
+    assert slots.try_acquire(time.monotonic())
@@ -5,6 +5,9 @@ import pytest
 import logging
 
 from async_flow_control import AsyncThrottler
+from async_flow_control.util.exception import ThrottlerInvArg
+from async_flow_control.util.logger import (RateSampledLogger, ProbabilisticLogger,
+                                            SummaryLogger)
 
 from test_aux.logger_mock import LoggerMock
 from test_aux.service_mock import ServiceMock
@@ -147,3 +150,74 @@ def test410_space_sync_log():
 
     assert log.msg == ['SYNC', 'SYNC', 'SYNC']
     assert pytest.approx(log.wait, abs=0.001) == [0.45, 0.45, 0.45]
+
+
+# ---------------------------------------------------------------------------
+
+
+class Records(list):
+
+    def __call__(self, msg, *args):
+        self.append(msg % args)
+
+
+def test500_rate_sampled():
+    log = LoggerMock()
+    sampled = RateSampledLogger(log, rate=20)
+    for _ in range(10):
+        sampled("wait %.3f", 0.1)
+    assert log.wait == [0.1]
+    time.sleep(0.06)
+    sampled("wait %.3f", 0.2)
+    assert log.wait == [0.1, 0.2]
+
+
+def test510_probabilistic():
+    log = LoggerMock()
+    sampled = ProbabilisticLogger(log, probability=0.1)
+    for _ in range(10000):
+        sampled("wait %.3f", 0.1)
+    assert 800 < len(log.wait) < 1200
+    with pytest.raises(ThrottlerInvArg):
+        ProbabilisticLogger(log, probability=0)
+
+
+def test520_summary():
+    rec = Records()
+    summary = SummaryLogger(rec, interval=0.05, msg="%d waits, mean %.2f, max %.2f, p99 %.2f")
+    for n in range(100):
+        summary("wait %.3f", n/100)
+    assert rec == []
+    time.sleep(0.06)
+    summary("wait %.3f", 1.0)
+    assert rec == ["101 waits, mean 0.50, max 1.00, p99 0.99"]
+    summary.flush()
+    assert rec == ["101 waits, mean 0.50, max 1.00, p99 0.99"]
+
+
+def test530_summary_sampling():
+    rec = Records()
+    summary = SummaryLogger(rec, interval=10, max_samples=100,
+                            msg="%d %.3f %.3f %.3f")
+    for n in range(1000):
+        summary("wait %.3f", n/1000)
+    summary.flush()
+    count, mean, top, p99 = rec[0].split()
+    assert count == "1000"
+    assert float(mean) == pytest.approx(0.4995, abs=0.001)
+    assert top == "0.999"
+    assert 0.9 < float(p99) <= 0.999
+
+
+@pytest.mark.asyncio
+async def test540_throttler_summary():
+    """
+    A throttler using a summary logger
+    """
+    rec = Records()
+    rt = AsyncThrottler(rate_limit=100, logger=SummaryLogger(rec, interval=0.02))
+    for _ in range(5):
+        async with rt:
+            pass
+    assert len(rec) == 1
+    assert rec[0].startswith("wait summary: ")
@@ -0,0 +1,114 @@
+import asyncio
+
+import pytest
+
+from async_flow_control.util.exception import QueueSizeExceeded, ThrottlerTimeout
+from async_flow_control.util.metrics import ThrottlerMetrics, prometheus_text
+from async_flow_control import (RateAsyncThrottler, ConcurrencyAsyncThrottler,
+                                CompositeAsyncThrottler, TaskSpacer,
+                                DummySpacer, RateThrottler, ConcurrencyThrottler)
+
+
+def test100_histogram():
+    m = ThrottlerMetrics()
+    m.grants += 2
+    m.observe(0.003)
+    m.observe(20)
+    snap = m.snapshot()
+    assert snap['grants'] == 4
+    buckets = dict(snap['wait']['buckets'])
+    assert buckets[0.001] == 2
+    assert buckets[0.005] == 3
+    assert buckets[10.0] == 3
+    assert buckets[float('inf')] == 4
+    assert snap['wait']['count'] == 4
+    assert snap['wait']['sum'] == pytest.approx(20.003)
+
+
+@pytest.mark.asyncio
+async def test200_rate():
+    rt = RateAsyncThrottler(20, max_queue=1)
+    await rt.wait()
+    waiters = []
+    for _ in range(2):
+        waiters.append(asyncio.ensure_future(rt.wait()))
+        await asyncio.sleep(0)
+    snap = rt.snapshot()
+    assert snap['queue'] == 2
+    assert snap['in_flight'] is None
+    with pytest.raises(QueueSizeExceeded):
+        await rt.wait()
+    await asyncio.gather(*waiters)
+    snap = rt.snapshot()
+    assert snap['grants'] == 3
+    assert snap['rejections'] == {'QueueSizeExceeded': 1, 'WaitTimeExceeded': 0,
+                                  'ThrottlerTimeout': 0}
+    buckets = dict(snap['wait']['buckets'])
+    assert buckets[0.001] == 1
+    assert buckets[0.025] == 1
+    assert buckets[0.25] == 3
+
+
+@pytest.mark.asyncio
+async def test210_concurrency():
+    ct = ConcurrencyAsyncThrottler(1, timeout=0.01)
+    async with ct:
+        snap = ct.snapshot()
+        assert snap['in_flight'] == 1
+        assert snap['queue'] == 0
+        with pytest.raises(ThrottlerTimeout):
+            async with ct:
+                pass
+    snap = ct.snapshot()
+    assert snap['grants'] == 1
+    assert snap['rejections']['ThrottlerTimeout'] == 1
+    assert snap['in_flight'] == 0
+
+
+@pytest.mark.asyncio
+async def test215_concurrency_run():
+    """
+    Timeouts of the `run()` deadline are recorded
+    """
+    ct = ConcurrencyAsyncThrottler(1, timeout=0.01)
+    for _ in range(3):
+        with pytest.raises(ThrottlerTimeout):
+            await ct.run(asyncio.sleep(0.1))
+    assert ct.snapshot()['rejections']['ThrottlerTimeout'] == 3
+    async with ct:
+        with pytest.raises(ThrottlerTimeout):
+            await ct.run(asyncio.sleep(0))
+    assert ct.snapshot()['rejections']['ThrottlerTimeout'] == 4
+
+
+@pytest.mark.asyncio
+async def test220_others():
+    throttlers = [CompositeAsyncThrottler(rate_limit=100, concurrency_limit=2),
+                  TaskSpacer(0.01), DummySpacer(), RateThrottler(100),
+                  ConcurrencyThrottler(2)]
+    for thr in throttlers:
+        for _ in range(3):
+            async with thr:
+                pass
+        snap = thr.snapshot()
+        assert snap['grants'] == 3, type(thr).__name__
+        assert snap['wait']['count'] == 3
+
+
+@pytest.mark.asyncio
+async def test300_prometheus():
+    rt = RateAsyncThrottler(100)
+    ct = ConcurrencyAsyncThrottler(2)
+    await rt.wait()
+    async with ct:
+        text = prometheus_text({'api': rt, 'db "main"': ct})
+    lines = text.splitlines()
+    assert '# TYPE throttler_grants_total counter' in lines
+    assert 'throttler_grants_total{throttler="api"} 1' in lines
+    assert 'throttler_rejections_total{throttler="api",reason="QueueSizeExceeded"} 0' in lines
+    assert 'throttler_queue{throttler="api"} 0' in lines
+    assert 'throttler_in_flight{throttler="db \\"main\\""} 1' in lines
+    assert not any(line.startswith('throttler_in_flight{throttler="api"') for line in lines)
+    assert 'throttler_wait_seconds_bucket{throttler="api",le="0.001"} 1' in lines
+    assert 'throttler_wait_seconds_bucket{throttler="api",le="+Inf"} 1' in lines
+    assert 'throttler_wait_seconds_count{throttler="api"} 1' in lines
@@ -0,0 +1,214 @@
+import asyncio
+import time
+
+import pytest
+
+from async_flow_control.util.exception import ThrottlerInvArg
+from async_flow_control.async_throttler.rate_algorithm import (
+    rate_algorithm, SpacingAlgorithm, FixedWindowAlgorithm,
+    SlidingWindowAlgorithm, SlidingLogAlgorithm)
+from async_flow_control import RateAsyncThrottler
+
+from test_aux.service_mock import ServiceMock
+
+
+def grants(algo, arrivals, cost=1):
+    """
+    Reserve grants for a list of arrival times
+    """
+    return [algo.reserve(t, cost) for t in arrivals]
+
+
+# ----------------------------------------------------------------------
+
+def test100_err():
+    with pytest.raises(ThrottlerInvArg) as e:
+        RateAsyncThrottler(10, algorithm="leaky")
+    assert str(e.value).startswith("`algorithm` must be one of: spacing")
+
+
+def test110_err():
+    with pytest.raises(ThrottlerInvArg) as e:
+        rate_algorithm("fixed_window", 10, 1.0, burst=2)
+    assert "`burst` is only supported by the spacing algorithm" == str(e.value)
+
+
+def test200_spacing():
+    a = SpacingAlgorithm(4, 1.0)
+    assert grants(a, [10]*4) == [10, 10.25, 10.5, 10.75]
+
+
+def test210_spacing_burst():
+    a = SpacingAlgorithm(4, 1.0, burst=2)
+    assert grants(a, [10]*5) == [10, 10, 10, 10.25, 10.5]
+    # After an idle period, burst capacity is recovered
+    assert grants(a, [20]*4) == [20, 20, 20, 20.25]
+
+
+def test220_spacing_cost():
+    a = SpacingAlgorithm(4, 1.0)
+    assert grants(a, [10]*3, cost=2) == [10, 10.5, 11.0]
+
+
+def test230_spacing_burst_cost():
+    """
+    Burst grants do not give away reserved slots again
+    """
+    a = SpacingAlgorithm(10, 1.0, burst=1)
+    ts = [a.reserve(0, cost) for cost in (1, 2, 1, 1)]
+    assert ts == pytest.approx([0, 0.1, 0.3, 0.4])
+    a = SpacingAlgorithm(10, 1.0, burst=2)
+    ts = [a.reserve(0, cost) for cost in (2, 1, 1, 1)]
+    assert ts == pytest.approx([0, 0, 0.2, 0.3])
+
+
+def test300_fixed():
+    a = FixedWindowAlgorithm(3, 1.0)
+    assert grants(a, [10]*7) == [10, 10, 10, 11, 11, 11, 12]
+    # Windows keep aligned to the first grant
+    assert grants(a, [15.5]*4) == [15.5, 15.5, 15.5, 16]
+
+
+def test310_fixed_cost():
+    a = FixedWindowAlgorithm(3, 1.0)
+    assert grants(a, [10]*3, cost=2) == [10, 11, 12]
+    # Costs over the limit are clamped
+    assert grants(a, [20]*2, cost=5) == [20, 21]
+
+
+def test400_sliding():
+    a = SlidingWindowAlgorithm(4, 1.0)
+    assert grants(a, [10]*4) == [10, 10, 10, 10]
+    # 4 units in the previous window: the estimate goes below 4 only
+    # after a quarter of the next window
+    assert grants(a, [10.5, 10.5]) == [11.25, 11.5]
+
+
+def test500_log():
+    a = SlidingLogAlgorithm(3, 1.0)
+    assert grants(a, [10, 10.2, 10.4, 10.5, 10.6, 11.5]) == [
+        10, 10.2, 10.4, 11, 11.2, 11.5]
+    # The ring buffer is bounded
+    assert len(a._log) == 3
+
+
+def test510_log_cost():
+    a = SlidingLogAlgorithm(4, 1.0)
+    assert grants(a, [10, 10.1, 10.2], cost=2) == [10, 10.1, 11]
+
+
+# ----------------------------------------------------------------------
+
+
+@pytest.mark.asyncio
+async def test600_throttler_fixed():
+    rt = RateAsyncThrottler(5, period=0.5, algorithm="fixed_window")
+    s = ServiceMock(rt, service_time=0.01)
+    start = time.monotonic()
+    got = await asyncio.gather(*[s(i) for i in range(12)])
+    elapsed = time.monotonic() - start
+
+    assert list(range(12)) == got
+
+    # Two full windows, and the last tasks start at the third one
+    exp_min = 2*0.5 + 0.01
+    assert elapsed > exp_min
+    assert elapsed < exp_min + 0.03
+
+
+@pytest.mark.asyncio
+async def test610_throttler_log_reserve():
+    rt = RateAsyncThrottler(5, period=0.5, algorithm="sliding_log", reserve=True)
+    s = ServiceMock(rt, service_time=0.01)
+    start = time.monotonic()
+    got = await asyncio.gather(*[s(i) for i in range(10)])
+    elapsed = time.monotonic() - start
+
+    assert list(range(10)) == got
+
+    exp_min = 0.5 + 0.01
+    assert elapsed > exp_min
+    assert elapsed < exp_min + 0.03
+
+
+# ----------------------------------------------------------------------
+
+
+def test700_tiers_err():
+    with pytest.raises(ThrottlerInvArg) as e:
+        RateAsyncThrottler([(10, 1), (100, -1)])
+    assert "rate tiers must be (positive integer, positive float) pairs" == str(e.value)
+
+
+def test710_tiers():
+    a = rate_algorithm("sliding_log", [(2, 1.0), (3, 10.0)], 1.0)
+    assert grants(a, [0, 0, 0, 0]) == [0, 0, 1, 10]
+    # The last grant was determined by the second tier
+    assert a.binding_tier == (3, 10.0)
+
+
+def test720_tiers_no_binding():
+    a = rate_algorithm("fixed_window", [(2, 1.0), (3, 10.0)], 1.0)
+    grants(a, [0])
+    assert a.binding_tier is None
+
+
+@pytest.mark.asyncio
+async def test730_throttler_tiers():
+    rt = RateAsyncThrottler([(10, 0.1), (4, 1.0)], algorithm="sliding_log",
+                            reserve=True)
+    start = time.monotonic()
+    got = []
+    for _ in range(5):
+        await rt.wait()
+        got.append(time.monotonic() - start)
+    elapsed = time.monotonic() - start
+
+    # 4 tasks are allowed at once, the fifth one must wait for a full second
+    assert got[3] < 0.01
+    assert elapsed > 1.0
+    assert elapsed < 1.02
+    assert rt.binding_tier == (4, 1.0)
+
+
+# ----------------------------------------------------------------------
+
+
+@pytest.mark.parametrize('name', ['spacing', 'fixed_window', 'sliding_window',
+                                  'sliding_log'])
+def test800_shift(name):
+    """
+    Shifting the state delays pending grants by the same amount
+    """
+    a1 = rate_algorithm(name, 2, 1.0)
+    a2 = rate_algorithm(name, 2, 1.0)
+    g1 = grants(a1, [0, 0, 0, 0])
+    grants(a2, [0, 0])
+    a2.shift(5)
+    assert grants(a2, [0, 0]) == [g + 5 for g in g1[2:]]
+
+
+@pytest.mark.parametrize('name', ['spacing', 'fixed_window', 'sliding_log'])
+def test810_rate_factor(name):
+    algo = rate_algorithm(name, 2, 1.0)
+    algo.set_rate_factor(0.5)
+    assert grants(algo, [0, 0, 0, 0])[-1] == pytest.approx(
+        {'spacing': 3, 'fixed_window': 2, 'sliding_log': 2}[name])
+
+
+def test820_tiers_factor():
+    algo = rate_algorithm('spacing', [(2, 1.0), (10, 10.0)], None)
+    algo.set_rate_factor(0.5)
+    # The second tier is the binding one, at one unit every 2 seconds
+    assert grants(algo, [0, 0, 0]) == [0, 2, 4]
+    assert algo.binding_tier == (10, 10.0)
+
+
+@pytest.mark.parametrize('name', ['spacing', 'fixed_window', 'sliding_window',
+                                  'sliding_log'])
+def test830_settled(name):
+    algo = rate_algorithm(name, 2, 1.0)
+    assert algo.settled(0)
+    grants(algo, [10, 10])
+    assert not algo.settled(10.5)
+    assert algo.settled(13)
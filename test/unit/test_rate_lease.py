@@ -0,0 +1,118 @@
+import asyncio
+import time
+
+import pytest
+
+from async_flow_control.util.exception import ThrottlerInvArg, ThrottlerException
+from async_flow_control.async_throttler.rate_store import (LocalRateStore,
+                                                           RateStoreServer,
+                                                           RemoteRateStore)
+from async_flow_control.async_throttler.rate_lease import TokenLease
+from async_flow_control import RateAsyncThrottler
+
+
+def test100_err():
+    with pytest.raises(ThrottlerInvArg) as e:
+        TokenLease(None, 'k')
+    assert "`store` must be a RateStore object" == str(e.value)
+    with pytest.raises(ThrottlerInvArg) as e:
+        TokenLease(LocalRateStore(), 'k', size=0)
+    assert "`size` must be a positive integer" == str(e.value)
+    with pytest.raises(ThrottlerInvArg) as e:
+        RateAsyncThrottler(10, lease=LocalRateStore())
+    assert "`lease` must be a TokenLease object" == str(e.value)
+
+
+def test110_store():
+    store = LocalRateStore()
+    # The bucket starts full
+    assert store.lease_now('k', 4, 0.1, 5) == (4, 0.0)
+    assert store.lease_now('k', 4, 0.1, 5) == (1, 0.0)
+    granted, retry = store.lease_now('k', 4, 0.1, 5)
+    assert granted == 0
+    assert 0.09 < retry <= 0.1
+    store.release_now('k', 3)
+    assert store.lease_now('k', 4, 0.1, 5) == (3, 0.0)
+    assert store.requests == 5
+
+
+@pytest.mark.asyncio
+async def test200_lease():
+    """
+    Round trips to the store depend on the lease size
+    """
+    store = LocalRateStore()
+    rt = RateAsyncThrottler(1000, lease=TokenLease(store, 'k', size=10))
+    for _ in range(50):
+        async with rt:
+            pass
+    assert store.requests == 5
+    assert rt._lease.tokens == 0
+
+
+@pytest.mark.asyncio
+async def test210_global_rate():
+    """
+    Two throttlers leasing from the same store share the rate
+    """
+    store = LocalRateStore()
+    rt1 = RateAsyncThrottler(20, lease=TokenLease(store, 'k', size=2))
+    rt2 = RateAsyncThrottler(20, lease=TokenLease(store, 'k', size=2))
+    start = time.monotonic()
+    await asyncio.gather(*[rt.wait() for rt in (rt1, rt2)*4])
+    elapsed = time.monotonic() - start
+    # The global bucket starts with 2 tokens, the other 6 come at the rate
+    assert 6*0.05 - 0.01 < elapsed < 6*0.05 + 0.03
+
+
+@pytest.mark.asyncio
+async def test220_return():
+    """
+    Unused tokens are returned when the lease expires, or when it is closed
+    """
+    store = LocalRateStore()
+    lease = TokenLease(store, 'k', size=10, ttl=0.05)
+    rt = RateAsyncThrottler(1000, lease=lease)
+    await rt.wait()
+    assert lease.tokens == 9
+    await asyncio.sleep(0.08)
+    assert lease.tokens == 0
+    assert store.requests == 2
+
+    await rt.wait()
+    assert lease.tokens == 9
+    await lease.close()
+    assert lease.tokens == 0
+    assert store.requests == 4
+
+
+@pytest.mark.asyncio
+async def test300_remote():
+    """
+    Lease through the TCP server
+    """
+    async with RateStoreServer() as server:
+        store = RemoteRateStore(port=server.port)
+        lease = TokenLease(store, 'k', size=5)
+        # The burst makes the store bucket hold all the tokens needed, so
+        # that leases are never cut short by the refill timing
+        rt = RateAsyncThrottler(1000, burst=20, lease=lease)
+        for _ in range(20):
+            await rt.wait()
+        await lease.close()
+        await store.close()
+    # All leased tokens were used: nothing to return
+    assert store.requests == 4
+    assert server.store.requests == 4
+
+
+@pytest.mark.asyncio
+async def test310_remote_error():
+    async with RateStoreServer() as server:
+        store = RemoteRateStore(port=server.port)
+        with pytest.raises(ThrottlerException) as e:
+            await store._request({'op': 'unknown'})
+        assert "rate store error: unknown operation: unknown" == str(e.value)
+        # The connection is still usable
+        assert await store.lease('k', 2, 0.1, 5) == (2, 0.0)
+        await store.close()
@@ -0,0 +1,137 @@
+import asyncio
+import gc
+import time
+import weakref
+
+import pytest
+
+from async_flow_control.util.exception import ThrottlerInvArg
+from async_flow_control.util.scheduler import TimerScheduler, shared_sleep, _SHARED
+from async_flow_control import RateAsyncThrottler, TaskSpacer
+
+from test_aux.service_mock import ServiceMock
+
+
+# ----------------------------------------------------------------------
+
+def test100_err():
+    with pytest.raises(ThrottlerInvArg) as e:
+        RateAsyncThrottler(10, scheduler="yes")
+    assert "`scheduler` must be a boolean or a TimerScheduler" == str(e.value)
+
+
+@pytest.mark.asyncio
+async def test200_sleep():
+    sched = TimerScheduler()
+    done = []
+
+    async def sleeper(n, delay):
+        await sched.sleep(delay)
+        done.append(n)
+
+    start = time.monotonic()
+    await asyncio.gather(*[sleeper(n, 0.05*(5-n)) for n in range(5)])
+    elapsed = time.monotonic() - start
+
+    # Released in deadline order, and the heap is empty at the end
+    assert done == [4, 3, 2, 1, 0]
+    assert len(sched) == 0
+    assert 0.25 < elapsed < 0.30
+
+
+@pytest.mark.asyncio
+async def test210_batch():
+    sched = TimerScheduler()
+    futs = [sched.sleep(0.1) for _ in range(1000)]
+    # A single timer handle covers all the waiters
+    assert len(sched) == 1000
+    await asyncio.sleep(0.11)
+    assert all(f.done() for f in futs)
+    assert len(sched) == 0
+
+
+@pytest.mark.asyncio
+async def test220_cancel():
+    sched = TimerScheduler()
+
+    async def sleeper(delay):
+        await sched.sleep(delay)
+
+    task = asyncio.create_task(sleeper(0.05))
+    other = sched.sleep(0.1)
+    await asyncio.sleep(0)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    await other
+    assert len(sched) == 0
+
+
+@pytest.mark.asyncio
+async def test230_shared():
+    assert TimerScheduler.get() is TimerScheduler.get()
+    assert TimerScheduler.get() is not TimerScheduler()
+
+
+def test240_shared_gc():
+    """
+    The shared scheduler does not keep its event loop alive
+    """
+    async def main():
+        await shared_sleep(0.01)
+
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(main())
+    assert loop in _SHARED
+    loop.close()
+    ref = weakref.ref(loop)
+    del loop
+    gc.collect()
+    assert ref() is None
+
+
+# ----------------------------------------------------------------------
+
+
+@pytest.mark.asyncio
+async def test300_rate():
+    rt = RateAsyncThrottler(5, reserve=True, scheduler=True)
+    s = ServiceMock(rt, service_time=0.05)
+    start = time.monotonic()
+    got = await asyncio.gather(*[s(i) for i in range(10)])
+    elapsed = time.monotonic() - start
+
+    assert [0, 1, 2, 3, 4, 5, 6, 7, 8, 9] == got
+
+    exp_min = 0.20*9 + 0.05
+    assert elapsed > exp_min
+    assert elapsed < exp_min + 0.05
+
+
+@pytest.mark.asyncio
+async def test310_rate_lock():
+    rt = RateAsyncThrottler(5, scheduler=TimerScheduler())
+    s = ServiceMock(rt, service_time=0.05)
+    start = time.monotonic()
+    got = await asyncio.gather(*[s(i) for i in range(5)])
+    elapsed = time.monotonic() - start
+
+    assert [0, 1, 2, 3, 4] == got
+
+    exp_min = 0.20*4 + 0.05
+    assert elapsed > exp_min
+    assert elapsed < exp_min + 0.05
+
+
+@pytest.mark.asyncio
+async def test320_spacer():
+    ts = TaskSpacer(0.2, scheduler=True)
+    s = ServiceMock(ts, service_time=0.05)
+    start = time.monotonic()
+    for i in range(5):
+        await s(i)
+    elapsed = time.monotonic() - start
+
+    exp_min = 0.20*4 + 0.05
+    assert elapsed > exp_min
+    assert elapsed < exp_min + 0.02
@@ -0,0 +1,212 @@
+import asyncio
+
+import pytest
+
+from async_flow_control.util.semaphore import AdjustableSemaphore
+from async_flow_control import VirtualClock
+
+
+async def holders(sem, order, items):
+    """
+    Queue waiters with (name, priority) items, behind a taken semaphore
+    """
+    async def waiter(name, priority):
+        await sem.acquire(priority)
+        order.append(name)
+        sem.release()
+    tasks = [asyncio.create_task(waiter(n, p)) for n, p in items]
+    await asyncio.sleep(0)
+    return tasks
+
+
+@pytest.mark.asyncio
+async def test100_semaphore():
+    sem = AdjustableSemaphore(1)
+    await sem.acquire()
+    assert sem.locked()
+    waiter = asyncio.create_task(sem.acquire())
+    await asyncio.sleep(0)
+    assert sem.waiting == 1
+    # Increasing the limit wakes up the waiter
+    sem.limit = 2
+    await waiter
+    assert (sem.active, sem.waiting) == (2, 0)
+
+
+@pytest.mark.asyncio
+async def test110_semaphore_decrease():
+    sem = AdjustableSemaphore(2)
+    await sem.acquire()
+    await sem.acquire()
+    sem.limit = 1
+    waiter = asyncio.create_task(sem.acquire())
+    sem.release()
+    await asyncio.sleep(0)
+    assert not waiter.done()
+    sem.release()
+    await waiter
+    assert sem.active == 1
+
+
+@pytest.mark.asyncio
+async def test120_semaphore_cancel():
+    sem = AdjustableSemaphore(1)
+    await sem.acquire()
+    w1 = asyncio.create_task(sem.acquire())
+    w2 = asyncio.create_task(sem.acquire())
+    await asyncio.sleep(0)
+    w1.cancel()
+    await asyncio.sleep(0)
+    assert sem.waiting == 1
+    sem.release()
+    await w2
+    assert (sem.active, sem.waiting) == (1, 0)
+
+
+# ----------------------------------------------------------------------
+
+
+@pytest.mark.asyncio
+async def test200_priority():
+    sem = AdjustableSemaphore(1)
+    await sem.acquire()
+    order = []
+    tasks = await holders(sem, order, [('a', 1), ('b', 0), ('c', 1), ('d', 0)])
+    sem.release()
+    await asyncio.gather(*tasks)
+    assert order == ['b', 'd', 'a', 'c']
+
+
+def test210_aging():
+    clock = VirtualClock()
+    sem = AdjustableSemaphore(1, aging=0.05)
+    order = []
+
+    async def main():
+        await sem.acquire()
+        tasks = await holders(sem, order, [('old', 1)])
+        await asyncio.sleep(0.1)
+        # The old low-priority waiter goes before new high-priority ones, but
+        # not before those arriving less than `aging` seconds later
+        tasks += await holders(sem, order, [('new', 0)])
+        await asyncio.sleep(0.1)
+        tasks += await holders(sem, order, [('newer', 1), ('high', -4)])
+        sem.release()
+        await asyncio.gather(*tasks)
+
+    clock.run(main())
+    assert order == ['high', 'old', 'new', 'newer']
+
+
+def test220_aging_boundary():
+    """
+    Low-priority waiters do not go ahead of high-priority ones arriving just
+    after them
+    """
+    clock = VirtualClock()
+    sem = AdjustableSemaphore(1, aging=60)
+    order = []
+
+    async def main():
+        await sem.acquire()
+        await asyncio.sleep(59.99)
+        tasks = await holders(sem, order, [(f'bg{i}', 1) for i in range(3)])
+        await asyncio.sleep(0.02)
+        tasks += await holders(sem, order, [('interactive', 0)])
+        sem.release()
+        await asyncio.gather(*tasks)
+
+    clock.run(main())
+    assert order == ['interactive', 'bg0', 'bg1', 'bg2']
+
+
+# ----------------------------------------------------------------------
+
+
+async def tenants(sem, order, items):
+    """
+    Queue waiters with (name, tenant) items, behind a taken semaphore
+    """
+    async def waiter(name, tenant):
+        await sem.acquire(tenant=tenant)
+        order.append(name)
+        sem.release()
+    tasks = [asyncio.create_task(waiter(n, t)) for n, t in items]
+    await asyncio.sleep(0)
+    return tasks
+
+
+@pytest.mark.asyncio
+async def test300_fair():
+    sem = AdjustableSemaphore(1)
+    await sem.acquire()
+    order = []
+    tasks = await tenants(sem, order, [(f'a{i}', 'a') for i in range(4)] +
+                          [('b0', 'b'), ('b1', 'b'), ('x0', None)])
+    sem.release()
+    await asyncio.gather(*tasks)
+    assert order == ['a0', 'b0', 'x0', 'a1', 'b1', 'a2', 'a3']
+    # Idle tenants are not kept
+    assert sem._tenants == {}
+
+
+@pytest.mark.asyncio
+async def test310_fair_weights():
+    sem = AdjustableSemaphore(1, weights={'a': 2})
+    await sem.acquire()
+    order = []
+    tasks = await tenants(sem, order, [(f'a{i}', 'a') for i in range(4)] +
+                          [(f'b{i}', 'b') for i in range(2)])
+    sem.release()
+    await asyncio.gather(*tasks)
+    assert order == ['a0', 'a1', 'b0', 'a2', 'a3', 'b1']
+
+
+@pytest.mark.asyncio
+async def test320_fair_late():
+    """
+    A tenant arriving later does not get credit for the time it was idle
+    """
+    sem = AdjustableSemaphore(1)
+    await sem.acquire()
+    order = []
+
+    async def waiter(name, tenant):
+        await sem.acquire(tenant=tenant)
+        order.append(name)
+
+    tasks = [asyncio.create_task(waiter(f'a{i}', 'a')) for i in range(4)]
+    await asyncio.sleep(0)
+    for _ in range(2):
+        sem.release()
+        await asyncio.sleep(0)
+    assert order == ['a0', 'a1']
+    tasks += [asyncio.create_task(waiter(f'b{i}', 'b')) for i in range(2)]
+    await asyncio.sleep(0)
+    for _ in range(4):
+        sem.release()
+        await asyncio.sleep(0)
+    await asyncio.gather(*tasks)
+    assert order == ['a0', 'a1', 'a2', 'b0', 'a3', 'b1']
+
+
+def test330_fair_aging():
+    """
+    With aging, waiters with the same priority are still served by fair
+    queuing
+    """
+    clock = VirtualClock()
+    sem = AdjustableSemaphore(1, aging=1)
+    order = []
+
+    async def main():
+        await sem.acquire()
+        tasks = await holders(sem, order, [('low', 1)])
+        await asyncio.sleep(0.5)
+        tasks += await tenants(sem, order, [(f'a{i}', 'a') for i in range(4)] +
+                               [(f'b{i}', 'b') for i in range(4)])
+        sem.release()
+        await asyncio.gather(*tasks)
+
+    clock.run(main())
+    assert order == ['a0', 'b0', 'a1', 'b1', 'a2', 'b2', 'a3', 'b3', 'low']
@@ -0,0 +1,129 @@
+import asyncio
+import random
+
+import pytest
+
+from async_flow_control.util.exception import ThrottlerInvArg, LimitExceeded, ThrottlerTimeout
+from async_flow_control import AsyncThrottler, VirtualClock, simulate
+
+
+def trace(n: int, seed: int = 1, rate: float = 20, service: float = 0.1):
+    """
+    Poisson arrivals, with exponential service durations
+    """
+    rnd = random.Random(seed)
+    arrivals, t = [], 100.0
+    for _ in range(n):
+        t += rnd.expovariate(rate)
+        arrivals.append(t)
+    durations = [rnd.expovariate(1/service) for _ in range(n)]
+    return arrivals, durations
+
+
+def replay(config: dict, arrivals, durations):
+    """
+    Run the trace through a real throttler, in virtual time, and return the
+    grant times (None for rejections) and the rejection reasons
+    """
+    clock = VirtualClock(arrivals[0])
+    thr = AsyncThrottler(clock=clock, **config)
+    grants = [None]*len(arrivals)
+    reasons = {}
+
+    async def process(i):
+        await asyncio.sleep(arrivals[i] - clock.monotonic())
+        try:
+            async with thr:
+                grants[i] = clock.monotonic()
+                await asyncio.sleep(durations[i])
+        except (LimitExceeded, ThrottlerTimeout) as e:
+            name = type(e).__name__
+            reasons[name] = reasons.get(name, 0) + 1
+
+    async def main():
+        await asyncio.gather(*[process(i) for i in range(len(arrivals))])
+
+    clock.run(main())
+    return grants, reasons
+
+
+def check(config: dict, n: int = 1000, **kwargs):
+    arrivals, durations = trace(n, **kwargs)
+    result = simulate(config, arrivals, durations)
+    grants, reasons = replay(config, arrivals, durations)
+    for g, exp in zip(result.grants, grants):
+        if exp is None:
+            assert g != g
+        else:
+            assert g == pytest.approx(exp, abs=1e-6)
+    assert {k: v for k, v in result.rejections.items() if v} == reasons
+    return result
+
+
+# ---------------------------------------------------------------------------
+
+
+def test100_err():
+    with pytest.raises(ThrottlerInvArg):
+        simulate({'rate_limit': 10, 'foo': 1}, [1, 2])
+    with pytest.raises(ThrottlerInvArg):
+        simulate({}, [1, 2])
+    with pytest.raises(ThrottlerInvArg):
+        simulate({'concurrency_limit': 2}, [1, 2])
+    with pytest.raises(ThrottlerInvArg):
+        simulate({'rate_limit': 10}, [2, 1])
+    with pytest.raises(ThrottlerInvArg):
+        simulate({'rate_limit': -1}, [1, 2])
+
+
+def test110_spacing():
+    r = simulate({'rate_limit': 2}, [10, 10, 10, 12, 20], costs=[1, 2, 1, 1, 1])
+    assert list(r.grants) == [10, 10.5, 11.5, 12, 20]
+    assert list(r.delays) == [0, 0.5, 1.5, 0, 0]
+    s = r.summary(quantiles=(0.5,))
+    assert s['count'] == s['granted'] == 5
+    assert s['delay']['max'] == 1.5
+    assert s['delay']['quantiles'] == {0.5: 0}
+
+
+def test200_rate():
+    r = check({'rate_limit': 15})
+    assert r.summary()['delay']['max'] > 0.1
+
+
+def test210_rate_limits():
+    r = check({'rate_limit': 10, 'burst': 5, 'max_queue': 4})
+    assert r.rejections['QueueSizeExceeded'] > 0
+    check({'rate_limit': 10, 'max_wait': 0.3})
+
+
+def test220_rate_algorithms():
+    check({'rate_limit': 15, 'algorithm': 'sliding_log'})
+    check({'rate_limit': [(15, 1.0), (100, 10.0)]})
+
+
+def test300_concurrency():
+    check({'concurrency_limit': 2})
+    r = check({'concurrency_limit': 2, 'timeout': 0.2})
+    assert r.rejections['ThrottlerTimeout'] > 0
+
+
+def test310_composite():
+    check({'rate_limit': 15, 'concurrency_limit': 2, 'max_queue': 5})
+    check({'rate_limit': 30, 'concurrency_limit': 3, 'timeout': 0.3,
+           'task_space': 0.04})
+
+
+def test400_vectorized():
+    """
+    The vectorized computation gives the same grants as the scan
+    """
+    np = pytest.importorskip("numpy")
+    arrivals, _ = trace(10000)
+    costs = np.random.default_rng(1).integers(1, 4, len(arrivals))
+    fast = simulate({'rate_limit': 30}, arrivals, costs=costs)
+    scan = simulate({'rate_limit': 30, 'max_queue': 10**9}, arrivals, costs=costs)
+    assert np.allclose(fast.grants, scan.grants)
+    fs, ss = fast.summary(), scan.summary()
+    assert fs['granted'] == ss['granted'] == len(arrivals)
+    assert fs['delay']['max'] == pytest.approx(ss['delay']['max'])
@@ -0,0 +1,162 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from async_flow_control.util.exception import ThrottlerInvArg, ThrottlerTimeout, QueueSizeExceeded
+from async_flow_control.util.semaphore import ThreadSemaphore
+from async_flow_control import RateThrottler, ConcurrencyThrottler
+
+
+def test100_err():
+    with pytest.raises(ThrottlerInvArg) as e:
+        RateThrottler(0)
+    assert "`rate_limit` must be a positive integer" == str(e.value)
+    with pytest.raises(ThrottlerInvArg) as e:
+        ConcurrencyThrottler(2, timeout=-1)
+    assert "`timeout` must be a positive value" == str(e.value)
+
+
+def test110_semaphore():
+    sem = ThreadSemaphore(1)
+    assert sem.acquire()
+    assert sem.locked()
+    assert not sem.acquire(timeout=0.01)
+    assert sem.waiting == 0
+    sem.release()
+    assert not sem.locked()
+
+
+@pytest.mark.asyncio
+async def test120_semaphore_cancel():
+    """
+    A cancelled coroutine waiter does not keep the slot
+    """
+    sem = ThreadSemaphore(1)
+    await sem.acquire_async()
+    task = asyncio.ensure_future(sem.acquire_async())
+    await asyncio.sleep(0.01)
+    assert sem.waiting == 1
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert sem.waiting == 0
+    sem.release()
+    assert sem.active == 0
+
+
+# -------------------------------------------------------------------------
+
+
+def test200_rate_threads():
+    """
+    Threads share the rate
+    """
+    thr = RateThrottler(50)
+    start = time.monotonic()
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(lambda _: thr.wait(), range(16)))
+    elapsed = time.monotonic() - start
+    assert 15*0.02 - 0.01 < elapsed < 15*0.02 + 0.05
+
+
+def test210_rate_queue():
+    thr = RateThrottler(10, max_queue=1)
+    with ThreadPoolExecutor(4) as pool:
+        futures = [pool.submit(thr.wait) for _ in range(4)]
+        errors = [f.exception() for f in futures]
+    # One immediate, two in the queue (as in RateAsyncThrottler)
+    assert sum(isinstance(e, QueueSizeExceeded) for e in errors) == 1
+
+
+@pytest.mark.asyncio
+async def test220_rate_mixed():
+    """
+    Threads and coroutines share the same throttler
+    """
+    thr = RateThrottler(50)
+    loop = asyncio.get_running_loop()
+    start = time.monotonic()
+
+    async def coro():
+        async with thr:
+            pass
+
+    threads = [loop.run_in_executor(None, thr.wait) for _ in range(5)]
+    await asyncio.gather(*threads, *[coro() for _ in range(5)])
+    elapsed = time.monotonic() - start
+    assert 9*0.02 - 0.01 < elapsed < 9*0.02 + 0.05
+
+
+# -------------------------------------------------------------------------
+
+
+def test300_concurrency_threads():
+    thr = ConcurrencyThrottler(3)
+    active = []
+    lock = threading.Lock()
+    current = 0
+
+    def task(_):
+        nonlocal current
+        with thr:
+            with lock:
+                current += 1
+                active.append(current)
+            time.sleep(0.02)
+            with lock:
+                current -= 1
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(task, range(9)))
+    elapsed = time.monotonic() - start
+    assert max(active) == 3
+    assert 3*0.02 < elapsed < 3*0.02 + 0.04
+    assert thr.active == 0
+
+
+def test310_concurrency_timeout():
+    thr = ConcurrencyThrottler(1, timeout=0.02)
+    thr.acquire()
+    with pytest.raises(ThrottlerTimeout) as e:
+        thr.acquire()
+    assert "queue timeout exceeded: 0.02" == str(e.value)
+    thr.release()
+
+
+@pytest.mark.asyncio
+async def test320_concurrency_mixed():
+    """
+    Threads and coroutines wait in the same queue
+    """
+    thr = ConcurrencyThrottler(2)
+    loop = asyncio.get_running_loop()
+
+    def blocking():
+        with thr:
+            time.sleep(0.02)
+
+    async def coro():
+        async with thr:
+            await asyncio.sleep(0.02)
+
+    start = time.monotonic()
+    threads = [loop.run_in_executor(None, blocking) for _ in range(3)]
+    await asyncio.gather(*threads, *[coro() for _ in range(3)])
+    elapsed = time.monotonic() - start
+    assert 3*0.02 < elapsed < 3*0.02 + 0.04
+    assert thr.active == 0
+
+
+@pytest.mark.asyncio
+async def test330_concurrency_async_timeout():
+    thr = ConcurrencyThrottler(1, timeout=0.02)
+    await thr.acquire_async()
+    with pytest.raises(ThrottlerTimeout) as e:
+        await thr.acquire_async()
+    assert "queue timeout exceeded: 0.02" == str(e.value)
+    thr.release()
+    assert thr.active == 0
@@ -0,0 +1,147 @@
+import asyncio
+import time
+
+import pytest
+
+from async_flow_control.util.exception import ThrottlerInvArg
+from async_flow_control import CompositeAsyncThrottler
+
+from test_aux.service_mock import ServiceMock
+
+
+# ----------------------------------------------------------------------
+
+def test100_err():
+    with pytest.raises(ThrottlerInvArg) as e:
+        CompositeAsyncThrottler(concurrency_limit=-1, rate_limit=10)
+    assert "`concurrency_limit` must be a positive integer" == str(e.value)
+
+
+def test110_err():
+    with pytest.raises(ThrottlerInvArg) as e:
+        CompositeAsyncThrottler(concurrency_limit=2, task_space=1, burst=3)
+    assert "period/burst need a `rate_limit`" == str(e.value)
+
+
+@pytest.mark.asyncio
+async def test200_rate():
+    # Concurrency is not binding: the rate is
+    rt = CompositeAsyncThrottler(rate_limit=5, concurrency_limit=10)
+    s = ServiceMock(rt, service_time=0.05)
+    start = time.monotonic()
+    got = await asyncio.gather(*[s(i) for i in range(10)])
+    elapsed = time.monotonic() - start
+
+    assert list(range(10)) == got
+
+    exp_min = 0.20*9 + 0.05
+    assert elapsed > exp_min
+    assert elapsed < exp_min + 0.05
+
+
+@pytest.mark.asyncio
+async def test210_concurrency():
+    # Rate is not binding: the concurrency is
+    rt = CompositeAsyncThrottler(rate_limit=1000, concurrency_limit=2)
+    s = ServiceMock(rt, service_time=0.1)
+    start = time.monotonic()
+    got = await asyncio.gather(*[s(i) for i in range(6)])
+    elapsed = time.monotonic() - start
+
+    assert list(range(6)) == got
+
+    exp_min = 3*0.1
+    assert elapsed > exp_min
+    assert elapsed < exp_min + 0.05
+
+
+@pytest.mark.asyncio
+async def test220_both():
+    rt = CompositeAsyncThrottler(rate_limit=10, concurrency_limit=2)
+    s = ServiceMock(rt, service_time=0.25)
+    start = time.monotonic()
+    got = await asyncio.gather(*[s(i) for i in range(4)])
+    elapsed = time.monotonic() - start
+
+    assert list(range(4)) == got
+
+    # Starts at 0, 0.1 (rate), 0.25 & 0.35 (concurrency)
+    exp_min = 0.35 + 0.25
+    assert elapsed > exp_min
+    assert elapsed < exp_min + 0.05
+
+
+@pytest.mark.asyncio
+async def test230_space():
+    rt = CompositeAsyncThrottler(concurrency_limit=3, task_space=0.1)
+    s = ServiceMock(rt, service_time=0.05)
+    start = time.monotonic()
+    got = await asyncio.gather(*[s(i) for i in range(5)])
+    elapsed = time.monotonic() - start
+
+    assert list(range(5)) == got
+
+    exp_min = 4*0.1 + 0.05
+    assert elapsed > exp_min
+    assert elapsed < exp_min + 0.05
+
+
+@pytest.mark.asyncio
+async def test300_timeout():
+    rt = CompositeAsyncThrottler(rate_limit=10, concurrency_limit=2, timeout=0.15)
+    s = ServiceMock(rt, service_time=0.3)
+    got = await asyncio.gather(*[s(i) for i in range(4)])
+
+    assert [0, 1, 'ThrottlerTimeout', 'ThrottlerTimeout'] == got
+    assert rt._active == 0
+
+
+@pytest.mark.asyncio
+async def test310_max_queue():
+    rt = CompositeAsyncThrottler(rate_limit=10, concurrency_limit=5, max_queue=2)
+    s = ServiceMock(rt, service_time=0.01)
+    got = await asyncio.gather(*[s(i) for i in range(5)])
+
+    assert [0, 1, 2, 3, 'QueueSizeExceeded'] == got
+
+
+@pytest.mark.asyncio
+async def test320_cancel():
+    rt = CompositeAsyncThrottler(rate_limit=10, concurrency_limit=1)
+    s = ServiceMock(rt, service_time=0.1)
+    tasks = [asyncio.create_task(s(i)) for i in range(3)]
+    await asyncio.sleep(0.05)
+    tasks[1].cancel()
+    got = await asyncio.gather(*tasks, return_exceptions=True)
+
+    assert got[0] == 0 and got[2] == 2
+    assert isinstance(got[1], asyncio.CancelledError)
+    assert rt._active == 0
+
+
+@pytest.mark.asyncio
+async def test325_cancel_timeout():
+    """
+    A waiter cancelled just after its queue timeout does not release a slot
+    it was never granted
+    """
+    rt = CompositeAsyncThrottler(concurrency_limit=1, timeout=10)
+    await rt.acquire()
+    task = asyncio.create_task(rt.acquire())
+    await asyncio.sleep(0)
+    fut = rt._waiters[0][0]
+    rt._expire(fut)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert rt._active == 1
+
+
+@pytest.mark.asyncio
+async def test330_exception():
+    rt = CompositeAsyncThrottler(rate_limit=100, concurrency_limit=1)
+    s = ServiceMock(rt, service_time=0.01)
+    with pytest.raises(ValueError):
+        await s(0, exc=ValueError())
+    # The slot was released
+    assert await s(1) == 1
@@ -5,6 +5,7 @@ import pytest
 
 from async_flow_control.util.exception import ThrottlerInvArg, ThrottlerTimeout
 from async_flow_control import ConcurrencyAsyncThrottler
+from async_flow_control.async_throttler.adaptive_limit import AIMDLimit
 
 from test_aux.service_mock import ServiceMock
 
@@ -158,3 +159,179 @@ async def test320_run_timeout():
         await rt.run(do_nothing(0, wait=0.3))
 
     assert str(e.value) == "timeout exceeded: 0.2"
+
+
+@pytest.mark.asyncio
+async def test400_fast_path():
+    rt = ConcurrencyAsyncThrottler(2, timeout=1)
+    flag = []
+    asyncio.get_running_loop().call_soon(flag.append, 1)
+    # An uncontended acquisition does not suspend the task
+    async with rt:
+        pass
+    assert flag == []
+
+
+# ----------------------------------------------------------------------
+
+
+def test500_timeout_err():
+    with pytest.raises(ThrottlerInvArg) as e:
+        ConcurrencyAsyncThrottler(2, timeout=1, exec_timeout=1)
+    assert "`timeout` cannot be combined with `queue_timeout` or `exec_timeout`" == str(e.value)
+
+
+@pytest.mark.asyncio
+async def test510_queue_timeout():
+    rt = ConcurrencyAsyncThrottler(2, queue_timeout=0.15)
+    s = ServiceMock(rt, service_time=0.3)
+    got = await asyncio.gather(*[s(i) for i in range(4)])
+    assert [0, 1, 'ThrottlerTimeout', 'ThrottlerTimeout'] == got
+
+
+@pytest.mark.asyncio
+async def test520_exec_timeout():
+    rt = ConcurrencyAsyncThrottler(2, exec_timeout=0.1)
+    s = ServiceMock(rt, service_time=0.05)
+    start = time.monotonic()
+    got = await asyncio.gather(s(0), s(1, wait=0.3), s(2), s(3, wait=0.3))
+    elapsed = time.monotonic() - start
+
+    assert [0, 'ThrottlerTimeout', 2, 'ThrottlerTimeout'] == got
+    assert elapsed < 0.25
+    # All slots were released
+    assert not rt._sem.locked()
+    assert not rt._deadlines
+
+
+@pytest.mark.asyncio
+async def test525_exec_timeout_nested():
+    """
+    A task entering the throttler twice keeps one deadline per entry
+    """
+    rt = ConcurrencyAsyncThrottler(2, exec_timeout=0.1)
+    async with rt:
+        async with rt:
+            await asyncio.sleep(0.01)
+        assert len(rt._deadlines[asyncio.current_task()]) == 1
+    assert not rt._deadlines
+    # The outer deadline was cancelled: it does not fire after leaving
+    await asyncio.sleep(0.15)
+    # And the outer deadline still applies after the inner block
+    with pytest.raises(ThrottlerTimeout):
+        async with rt:
+            async with rt:
+                pass
+            await asyncio.sleep(0.3)
+    assert not rt._sem.locked()
+
+
+@pytest.mark.asyncio
+async def test530_run_exec_timeout():
+    rt = ConcurrencyAsyncThrottler(2, exec_timeout=0.1)
+    with pytest.raises(ThrottlerTimeout) as e:
+        await rt.run(do_nothing(0, wait=0.3))
+    assert str(e.value) == "execution timeout exceeded: 0.1"
+    assert await rt.run(do_nothing(1, wait=0.05)) == 1
+
+
+@pytest.mark.asyncio
+async def test540_run_queue_timeout():
+    rt = ConcurrencyAsyncThrottler(1, queue_timeout=0.1)
+    got = await asyncio.gather(rt.run(do_nothing(0, wait=0.2)),
+                               rt.run(do_nothing(1, wait=0.2)),
+                               return_exceptions=True)
+    assert got[0] == 0
+    assert isinstance(got[1], ThrottlerTimeout)
+    assert str(got[1]) == "queue timeout exceeded: 0.1"
+
+
+@pytest.mark.asyncio
+async def test550_no_extra_tasks():
+    rt = ConcurrencyAsyncThrottler(1, timeout=1)
+    tasks = [asyncio.create_task(rt.run(do_nothing(i, wait=0.05))) for i in range(3)]
+    await asyncio.sleep(0.01)
+    # Only the tasks we created (plus the test task) exist
+    assert len(asyncio.all_tasks()) == 4
+    assert await asyncio.gather(*tasks) == [0, 1, 2]
+
+
+def test600_adaptive_err():
+    with pytest.raises(ThrottlerInvArg) as e:
+        ConcurrencyAsyncThrottler(10, adaptive='unknown')
+    assert str(e.value).startswith("`adaptive` must be one of: aimd, gradient")
+
+
+@pytest.mark.asyncio
+async def test610_adaptive_aimd():
+    """
+    Slow tasks reduce the limit, fast tasks make it grow again
+    """
+    limit = AIMDLimit(1, 8, threshold=0.05, backoff=0.5)
+    rt = ConcurrencyAsyncThrottler(8, adaptive=limit)
+    assert rt.limit == 8
+    await asyncio.gather(*(rt.run(do_nothing(i, wait=0.1)) for i in range(8)))
+    assert rt.limit == 1
+    # Sequential tasks make it grow only while they use half of the limit
+    for n in range(3):
+        async with rt:
+            await do_nothing(n, wait=0.01)
+    assert rt.limit == 3
+
+
+@pytest.mark.asyncio
+async def test620_adaptive_exec_timeout():
+    """
+    Execution timeouts count as drops
+    """
+    rt = ConcurrencyAsyncThrottler(4, exec_timeout=0.05, adaptive='aimd')
+    s = ServiceMock(rt, service_time=0.01)
+    got = await asyncio.gather(s(0, wait=0.2), s(1, wait=0.2))
+    assert ['ThrottlerTimeout', 'ThrottlerTimeout'] == got
+    assert rt.limit == 3
+    assert not rt._starts
+
+
+@pytest.mark.asyncio
+async def test630_adaptive_concurrency():
+    """
+    A reduced limit is enforced on waiting tasks
+    """
+    rt = ConcurrencyAsyncThrottler(4, adaptive='aimd')
+    rt._sem.limit = 2
+    start = time.monotonic()
+    await asyncio.gather(*(rt.run(do_nothing(i, wait=0.1)) for i in range(4)))
+    elapsed = time.monotonic() - start
+    assert 0.2 < elapsed < 0.25
+
+
+# ----------------------------------------------------------------------
+
+
+@pytest.mark.asyncio
+async def test700_priority():
+    rt = ConcurrencyAsyncThrottler(1)
+    order = []
+
+    async def task(name, priority):
+        async with rt(priority=priority):
+            order.append(name)
+            await asyncio.sleep(0.01)
+
+    await asyncio.gather(task('first', 5), task('low', 5), task('bg', 9),
+                         task('high', 0))
+    assert order == ['first', 'high', 'low', 'bg']
+
+
+@pytest.mark.asyncio
+async def test710_run_priority():
+    rt = ConcurrencyAsyncThrottler(1, timeout=1, aging=10)
+    order = []
+
+    async def task(name):
+        order.append(name)
+        await asyncio.sleep(0.01)
+
+    await asyncio.gather(rt.run(task('a'), priority=1), rt.run(task('b'), priority=1),
+                         rt.run(task('c'), priority=0))
+    assert order == ['a', 'c', 'b']
@@ -0,0 +1,138 @@
+import asyncio
+import time
+
+import pytest
+
+from async_flow_control.util.exception import ThrottlerInvArg
+from async_flow_control import (KeyedThrottler, RateAsyncThrottler,
+                                ConcurrencyAsyncThrottler)
+
+
+def test100_err():
+    with pytest.raises(ThrottlerInvArg) as e:
+        KeyedThrottler(max_keys=0, rate_limit=10)
+    assert "`max_keys` must be a positive integer" == str(e.value)
+
+
+def test110_err():
+    with pytest.raises(ThrottlerInvArg) as e:
+        KeyedThrottler(rate_limit=-10)
+    assert "`rate_limit` must be a positive integer" == str(e.value)
+
+
+def test200_create():
+    thr = KeyedThrottler(rate_limit=10)
+    a = thr.get('a')
+    assert isinstance(a, RateAsyncThrottler)
+    assert thr.get('a') is a
+    assert thr.get('b') is not a
+    assert len(thr) == 2
+
+
+@pytest.mark.asyncio
+async def test210_keys():
+    """
+    Each key has its own rate
+    """
+    thr = KeyedThrottler(rate_limit=10)
+    start = time.monotonic()
+    for _ in range(2):
+        for key in ('a', 'b', 'c'):
+            async with thr(key):
+                pass
+    elapsed = time.monotonic() - start
+    assert 0.1 < elapsed < 0.12
+
+
+@pytest.mark.asyncio
+async def test300_lru_settled():
+    """
+    Settled throttlers are simply dropped
+    """
+    thr = KeyedThrottler(max_keys=2, rate_limit=100)
+    for key in ('a', 'b'):
+        async with thr(key):
+            pass
+    await asyncio.sleep(0.02)
+    for key in ('c', 'd'):
+        async with thr(key):
+            pass
+    assert thr.stats()['live'] == 2
+    assert len(thr) == 2
+
+
+@pytest.mark.asyncio
+async def test310_lru_compact():
+    """
+    Unsettled throttlers are stored compactly, and their state is restored
+    """
+    thr = KeyedThrottler(max_keys=2, rate_limit=10)
+    for key in ('a', 'b', 'c', 'd'):
+        async with thr(key):
+            pass
+    st = thr.stats()
+    assert (st['keys'], st['live'], st['compact']) == (4, 2, 2)
+
+    # 'a' must wait for its next slot
+    start = time.monotonic()
+    async with thr('a'):
+        pass
+    elapsed = time.monotonic() - start
+    assert 0.09 < elapsed < 0.11
+
+    # Once settled, compact entries are dropped
+    await asyncio.sleep(0.1)
+    thr.get('e')
+    assert thr.stats()['compact'] <= 1
+
+
+@pytest.mark.asyncio
+async def test315_lru_compact_burst():
+    """
+    Fractional burst credit is restored as it was
+    """
+    thr = KeyedThrottler(max_keys=1, rate_limit=10, burst=2)
+    for _ in range(2):
+        async with thr('a', cost=0.5):
+            pass
+    assert thr.get('a')._algo._burst == 1.5
+    thr.get('b')
+    assert thr.stats()['compact'] == 1
+    assert thr.get('a')._algo._burst == 1.5
+
+
+@pytest.mark.asyncio
+async def test320_busy():
+    """
+    Busy throttlers are not evicted
+    """
+    thr = KeyedThrottler(max_keys=1, concurrency_limit=1)
+    async with thr('a'):
+        b = thr.get('b')
+        assert isinstance(b, ConcurrencyAsyncThrottler)
+        assert thr.stats()['live'] == 2
+    thr.get('c')
+    assert thr.stats()['live'] == 1
+
+
+@pytest.mark.asyncio
+async def test330_ttl():
+    thr = KeyedThrottler(ttl=0.05, concurrency_limit=1)
+    thr.get('a')
+    await asyncio.sleep(0.06)
+    thr.get('b')
+    assert len(thr) == 1
+
+
+@pytest.mark.asyncio
+async def test400_memory():
+    thr = KeyedThrottler(max_keys=100, rate_limit=10, burst=5)
+    small = thr.stats()['memory']
+    for n in range(1000):
+        async with thr(n):
+            pass
+    st = thr.stats()
+    assert (st['live'], st['compact']) == (100, 900)
+    # Compact entries are much smaller than throttler objects
+    per_live = thr._thr_size
+    assert st['memory'] - small < 100*per_live + 900*per_live/4
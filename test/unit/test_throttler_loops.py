@@ -0,0 +1,156 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from async_flow_control.util.exception import ThrottlerInvArg
+from async_flow_control.util.semaphore import LoopSafeSemaphore
+from async_flow_control.async_throttler.rate_algorithm import LockedAlgorithm
+from async_flow_control import RateAsyncThrottler, TimerScheduler, Clock
+
+
+def run_loops(n: int, coro_factory) -> list:
+    """
+    Run a coroutine in `n` event loops, each one in its own thread, and
+    return their results
+    """
+    results = [None]*n
+
+    def worker(idx):
+        results[idx] = asyncio.run(coro_factory(idx))
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def test100_err():
+    with pytest.raises(ThrottlerInvArg) as e:
+        RateAsyncThrottler(10, loop_safe=True, scheduler=TimerScheduler())
+    assert "`loop_safe` cannot be combined with `lease` or a TimerScheduler object" == str(e.value)
+
+
+def test110_semaphore():
+    """
+    The semaphore hands over slots to waiters in other loops
+    """
+    sem = LoopSafeSemaphore(2)
+    lock = threading.Lock()
+    current = 0
+    peak = 0
+
+    async def task(_):
+        nonlocal current, peak
+        for _ in range(5):
+            await sem.acquire()
+            with lock:
+                current += 1
+                peak = max(peak, current)
+            await asyncio.sleep(0.005)
+            with lock:
+                current -= 1
+            sem.release()
+
+    run_loops(4, task)
+    assert peak == 2
+    assert sem.active == 0
+    assert sem.waiting == 0
+
+
+@pytest.mark.parametrize('reserve', [False, True])
+def test200_rate(reserve):
+    """
+    Coroutines in several loops share the rate
+    """
+    thr = RateAsyncThrottler(50, loop_safe=True, reserve=reserve)
+
+    async def task(_):
+        grants = []
+        for _ in range(4):
+            await asyncio.gather(*[thr.wait() for _ in range(2)])
+            grants.append(time.monotonic())
+        return grants
+
+    start = time.monotonic()
+    results = run_loops(3, task)
+    elapsed = max(max(r) for r in results) - start
+    # 24 grants at 50/s
+    assert 23*0.02 - 0.01 < elapsed < 23*0.02 + 0.05
+
+
+def test210_rate_priority():
+    """
+    Waiters in several loops are served by priority
+    """
+    thr = RateAsyncThrottler(20, loop_safe=True)
+    order = []
+    priorities = [0, 3, 1, 2]
+
+    async def task(idx):
+        if idx:
+            await asyncio.sleep(0.01)
+        else:
+            # Take the first slot, and hold the lock for the second one
+            await thr.wait()
+        await thr.wait(priority=priorities[idx])
+        order.append(priorities[idx])
+
+    run_loops(4, task)
+    assert order == [0, 1, 2, 3]
+
+
+def test220_rate_fast_path():
+    """
+    The fast path in one thread and a waiter in another one do not take the
+    same slot
+    """
+    reading = threading.Event()
+    computed = threading.Event()
+    granted = threading.Event()
+
+    class SlowClock(Clock):
+        """
+        The fast path thread reads the time only after the waiter has
+        computed its slot (or after a while, if it can't)
+        """
+        def monotonic(self):
+            if threading.current_thread().name == 'fast':
+                reading.set()
+                computed.wait(0.2)
+            return time.monotonic()
+
+    class PausedAlgorithm(LockedAlgorithm):
+        """
+        The waiter commits its slot only after the fast path has finished
+        """
+        def next_grant(self, now, cost=1):
+            ts = super().next_grant(now, cost)
+            computed.set()
+            granted.wait(0.2)
+            return ts
+
+    thr = RateAsyncThrottler(10, loop_safe=True, clock=SlowClock())
+    thr._algo = PausedAlgorithm(thr._algo.algo)
+    result = {}
+
+    def fast():
+        result['fast'] = (thr._grant_now(1), time.monotonic())
+        granted.set()
+
+    async def waiter():
+        # The fast path thread has already checked the queue
+        reading.wait()
+        await thr._wait_lock(1)
+        return time.monotonic()
+
+    t = threading.Thread(target=fast, name='fast')
+    t.start()
+    result['waiter'] = asyncio.run(waiter())
+    t.join()
+    assert result['fast'][0]
+    assert result['waiter'] - result['fast'][1] > 0.09
+    assert thr._algo.algo._burst == 0
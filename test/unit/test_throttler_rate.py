@@ -5,6 +5,7 @@ import pytest
 
 from async_flow_control.util.exception import ThrottlerInvArg
 from async_flow_control import RateAsyncThrottler
+from async_flow_control.async_throttler.rate_feedback import RateFeedback
 
 from test_aux.service_mock import ServiceMock
 
@@ -168,3 +169,313 @@ async def test410_task_limit():
     # This will add 4 tasks to the queue, total waiting time 0.25*5 = 1.00
     got = await asyncio.gather(*[s(i) for i in range(5)])
     assert [0, 1, 2, 3, "WaitTimeExceeded"] == got
+
+
+# ----------------------------------------------------------------------
+
+
+@pytest.mark.asyncio
+async def test500_reserve():
+    rt = RateAsyncThrottler(5, reserve=True)
+    s = ServiceMock(rt, service_time=0.05)
+    start = time.monotonic()
+    got = await asyncio.gather(*[s(i) for i in range(10)])
+    elapsed = time.monotonic() - start
+
+    assert [0, 1, 2, 3, 4, 5, 6, 7, 8, 9] == got
+
+    exp_min = 0.20*9 + 0.05
+    assert elapsed > exp_min
+    assert elapsed < exp_min + 0.05
+
+
+@pytest.mark.asyncio
+async def test510_reserve_sequential():
+    rt = RateAsyncThrottler(4, reserve=True)
+    start = time.monotonic()
+    for n in range(4):
+        async with rt:
+            await do_nothing()
+    elapsed = time.monotonic() - start
+
+    exp_time = 3*0.25 + 0.1
+    assert elapsed > exp_time
+    assert elapsed < exp_time + 0.1
+
+
+@pytest.mark.asyncio
+async def test520_reserve_burst_recover():
+    T = 0.20
+    rt = RateAsyncThrottler(int(1/T), burst=3, reserve=True)
+    s = ServiceMock(rt, service_time=0.05)
+
+    start = time.monotonic()
+    await asyncio.gather(*[s(i) for i in range(10)])
+    elapsed = time.monotonic() - start
+
+    exp_min = T*6 + 0.05
+    assert elapsed > exp_min
+    assert elapsed < exp_min + 0.05
+
+    await asyncio.sleep(3*T)
+
+    start = time.monotonic()
+    await asyncio.gather(*[s(i) for i in range(4)])
+    elapsed = time.monotonic() - start
+
+    exp_min = T + 0.05
+    assert elapsed > exp_min
+    assert elapsed < exp_min + 0.05
+
+
+@pytest.mark.asyncio
+async def test530_reserve_limit():
+    rt = RateAsyncThrottler(5, max_queue=4, reserve=True)
+    s = ServiceMock(rt, service_time=0.05)
+
+    got = await asyncio.gather(*[s(i) for i in range(5)])
+    assert [0, 1, 2, 3, 4] == got
+
+    got = await asyncio.gather(*[s(i) for i in range(6)])
+    assert [0, 1, 2, 3, 4, "QueueSizeExceeded"] == got
+
+
+@pytest.mark.asyncio
+async def test540_reserve_limit():
+    rt = RateAsyncThrottler(4, max_wait=0.99, reserve=True)
+    s = ServiceMock(rt, service_time=0.05)
+
+    got = await asyncio.gather(*[s(i) for i in range(4)])
+    assert [0, 1, 2, 3] == got
+
+    got = await asyncio.gather(*[s(i) for i in range(5)])
+    assert [0, 1, 2, 3, "WaitTimeExceeded"] == got
+
+
+@pytest.mark.asyncio
+async def test550_reserve_cancel():
+    rt = RateAsyncThrottler(10, reserve=True)
+    tasks = [asyncio.create_task(rt.wait()) for _ in range(5)]
+    await asyncio.sleep(0.05)
+    for t in tasks[1:]:
+        t.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    # The queue is clean after the cancellations
+    assert rt._queue == 0
+
+
+# ----------------------------------------------------------------------
+
+
+def test600_cost_err():
+    rt = RateAsyncThrottler(10)
+    with pytest.raises(ThrottlerInvArg) as e:
+        asyncio.run(rt.wait(cost=-1))
+    assert "`cost` must be a positive number" == str(e.value)
+
+
+@pytest.mark.asyncio
+async def test610_cost():
+    rt = RateAsyncThrottler(10)
+    start = time.monotonic()
+    await rt.acquire(cost=5)
+    await rt.acquire(cost=1)
+    await rt.acquire(cost=1)
+    elapsed = time.monotonic() - start
+
+    # The first call consumes 5 slots, the second one 1
+    exp_time = 0.6
+    assert elapsed > exp_time
+    assert elapsed < exp_time + 0.02
+
+
+@pytest.mark.asyncio
+async def test620_cost_context():
+    rt = RateAsyncThrottler(10, reserve=True)
+    start = time.monotonic()
+    for n in range(4):
+        async with rt(cost=2) as t:
+            assert t is rt
+    elapsed = time.monotonic() - start
+
+    exp_time = 3*0.2
+    assert elapsed > exp_time
+    assert elapsed < exp_time + 0.02
+
+
+@pytest.mark.asyncio
+async def test630_cost_fractional():
+    rt = RateAsyncThrottler(4)
+    s = ServiceMock(rt(cost=0.5), service_time=0.01)
+    start = time.monotonic()
+    got = await asyncio.gather(*[s(i) for i in range(5)])
+    elapsed = time.monotonic() - start
+
+    assert [0, 1, 2, 3, 4] == got
+
+    exp_min = 4*0.125 + 0.01
+    assert elapsed > exp_min
+    assert elapsed < exp_min + 0.02
+
+
+@pytest.mark.asyncio
+async def test640_cost_burst():
+    rt = RateAsyncThrottler(10, burst=3)
+    s = ServiceMock(rt(cost=2), service_time=0.01)
+    start = time.monotonic()
+    got = await asyncio.gather(*[s(i) for i in range(3)])
+    elapsed = time.monotonic() - start
+
+    assert [0, 1, 2] == got
+
+    # The second task takes 2 units of burst; the third one must wait
+    exp_min = 0.2 + 0.01
+    assert elapsed > exp_min
+    assert elapsed < exp_min + 0.02
+
+
+# ----------------------------------------------------------------------
+
+
+@pytest.mark.asyncio
+async def test700_fast_path():
+    rt = RateAsyncThrottler(10**9)
+    flag = []
+    asyncio.get_running_loop().call_soon(flag.append, 1)
+    # An uncontended acquisition does not suspend the task
+    async with rt:
+        pass
+    await rt.wait()
+    assert flag == []
+
+
+# ----------------------------------------------------------------------
+
+
+def test800_feedback_err():
+    rt = RateAsyncThrottler(10)
+    with pytest.raises(ThrottlerInvArg) as e:
+        rt.feedback('unknown')
+    assert "`outcome` must be one of: success, throttled, error" == str(e.value)
+    with pytest.raises(ThrottlerInvArg) as e:
+        RateFeedback(decrease=2)
+    assert "`decrease` must be between 0 and 1" == str(e.value)
+
+
+def test810_feedback_factor():
+    fb = RateFeedback(decrease=0.5, error_decrease=0.8, probe=0.1, cooldown=1)
+    assert fb.update('throttled', 10.0, 0.1) == 0.5
+    # Within the cooldown: ignored
+    assert fb.update('throttled', 10.5, 0.1) == 0.5
+    assert fb.update('error', 11.0, 0.1) == 0.4
+    # One second of successes (at the configured rate) adds 10%
+    for _ in range(10):
+        fb.update('success', 12.0, 0.1)
+    assert fb.factor == pytest.approx(0.5)
+    for _ in range(100):
+        fb.update('success', 12.0, 0.1)
+    assert fb.factor == 1.0
+
+
+@pytest.mark.asyncio
+async def test820_feedback_rate():
+    rt = RateAsyncThrottler(20)
+    rt.feedback('throttled')
+    assert rt.rate_factor == 0.5
+    s = ServiceMock(rt, service_time=0.01)
+    start = time.monotonic()
+    await asyncio.gather(*[s(i) for i in range(5)])
+    elapsed = time.monotonic() - start
+
+    # Spacing is now 0.1 seconds
+    exp_time = 4*0.1 + 0.01
+    assert elapsed > exp_time
+    assert elapsed < exp_time + 0.02
+
+
+@pytest.mark.parametrize('reserve', [False, True])
+@pytest.mark.asyncio
+async def test830_pause(reserve):
+    rt = RateAsyncThrottler(10, reserve=reserve)
+    s = ServiceMock(rt, service_time=0.01)
+    start = time.monotonic()
+    tasks = [asyncio.create_task(s(i)) for i in range(3)]
+    await asyncio.sleep(0.05)
+    # The first task went through; the rest are pushed back
+    rt.pause_until(time.monotonic() + 0.2)
+    assert await asyncio.gather(*tasks) == [0, 1, 2]
+    elapsed = time.monotonic() - start
+
+    exp_time = 2*0.1 + 0.2 + 0.01
+    assert elapsed > exp_time
+    assert elapsed < exp_time + 0.03
+
+
+@pytest.mark.asyncio
+async def test840_retry_after():
+    rt = RateAsyncThrottler(100)
+    rt.feedback('throttled', retry_after=0.1)
+    # Repeating the same pause does not extend it
+    rt.pause_until(rt._paused)
+    start = time.monotonic()
+    async with rt:
+        pass
+    elapsed = time.monotonic() - start
+    assert 0.1 - 0.01 < elapsed < 0.12
+
+
+# ----------------------------------------------------------------------
+
+
+@pytest.mark.asyncio
+async def test900_priority():
+    rt = RateAsyncThrottler(20)
+    order = []
+
+    async def task(name, priority):
+        async with rt(priority=priority):
+            order.append(name)
+
+    await asyncio.gather(task('first', 1), task('wait', 1), task('low', 1),
+                         task('high', 0))
+    # The second task is already holding the lock when the others arrive
+    assert order == ['first', 'wait', 'high', 'low']
+
+
+@pytest.mark.asyncio
+async def test910_priority_reserve():
+    rt = RateAsyncThrottler(20, reserve=True)
+    with pytest.raises(ThrottlerInvArg) as e:
+        await rt.wait(priority=1)
+    assert "`priority` is not supported in reservation mode" == str(e.value)
+
+
+@pytest.mark.asyncio
+async def test920_tenants():
+    rt = RateAsyncThrottler(50, weights={'vip': 2})
+    order = []
+
+    async def task(name, tenant):
+        async with rt(tenant=tenant):
+            order.append(name)
+
+    start = time.monotonic()
+    noisy = [task(f'n{i}', 'noisy') for i in range(6)]
+    await asyncio.gather(*noisy, task('q0', 'quiet'), task('q1', 'quiet'),
+                         task('v0', 'vip'), task('v1', 'vip'))
+    elapsed = time.monotonic() - start
+
+    # The total rate is kept
+    assert 9*0.02 < elapsed < 9*0.02 + 0.03
+    # The first two tasks got there before the rest queued. Then the vip
+    # tenant gets two slots for each one of the others
+    assert order == ['n0', 'n1', 'v0', 'n2', 'q0', 'v1', 'n3', 'q1', 'n4', 'n5']
+
+
+@pytest.mark.asyncio
+async def test930_tenant_reserve():
+    rt = RateAsyncThrottler(20, reserve=True)
+    with pytest.raises(ThrottlerInvArg) as e:
+        await rt.wait(tenant='a')
+    assert "`tenant` is not supported in reservation mode" == str(e.value)
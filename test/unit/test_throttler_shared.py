@@ -0,0 +1,107 @@
+import asyncio
+import multiprocessing
+import os
+import sys
+import time
+
+import pytest
+
+from async_flow_control.util.exception import ThrottlerInvArg
+from async_flow_control.util.shared import SharedSegment
+from async_flow_control import RateAsyncThrottler
+
+
+pytestmark = pytest.mark.skipif(sys.platform == 'win32',
+                                reason='shared state needs POSIX')
+
+
+@pytest.fixture
+def name():
+    name = f'afc_test_{os.getpid()}'
+    yield name
+    SharedSegment.unlink(name)
+
+
+def test100_err(name):
+    RateAsyncThrottler(10, shared=name)
+    with pytest.raises(ThrottlerInvArg) as e:
+        RateAsyncThrottler(20, shared=name)
+    assert f"shared segment `{name}` has a different rate configuration" == str(e.value)
+
+
+def test110_err():
+    with pytest.raises(ThrottlerInvArg) as e:
+        RateAsyncThrottler(10, shared='afc_unused', algorithm='fixed_window')
+    assert "`shared` is only supported by the spacing algorithm with a single rate" == str(e.value)
+
+
+@pytest.mark.asyncio
+async def test200_shared(name):
+    """
+    Two throttlers using the same segment share the rate
+    """
+    rt1 = RateAsyncThrottler(20, shared=name)
+    rt2 = RateAsyncThrottler(20, shared=name)
+    start = time.monotonic()
+    await asyncio.gather(*[rt.wait() for rt in (rt1, rt2, rt1, rt2)])
+    elapsed = time.monotonic() - start
+    assert 3*0.05 < elapsed < 3*0.05 + 0.02
+
+
+@pytest.mark.asyncio
+async def test210_shared_burst(name):
+    rt1 = RateAsyncThrottler(20, burst=2, shared=name)
+    rt2 = RateAsyncThrottler(20, burst=2, shared=name)
+    start = time.monotonic()
+    for rt in (rt1, rt2, rt1, rt2):
+        await rt.wait()
+    elapsed = time.monotonic() - start
+    # The first three are immediate (one in its slot, two from burst)
+    assert 0.05 < elapsed < 0.05 + 0.02
+
+
+def worker(name, n, queue):
+    async def run():
+        rt = RateAsyncThrottler(20, shared=name)
+        for _ in range(n):
+            await rt.wait()
+    asyncio.run(run())
+    queue.put(time.monotonic())
+
+
+def test300_processes(name):
+    """
+    Several processes share the rate
+    """
+    RateAsyncThrottler(20, shared=name)
+    ctx = multiprocessing.get_context('fork')
+    queue = ctx.Queue()
+    start = time.monotonic()
+    procs = [ctx.Process(target=worker, args=(name, 4, queue)) for _ in range(3)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+    end = max(queue.get() for _ in procs)
+    assert end - start > 11*0.05
+
+
+def test310_fork(name):
+    """
+    A forked process does not share the lock of its parent
+    """
+    seg = SharedSegment(name, 4)
+    ctx = multiprocessing.get_context('fork')
+    queue = ctx.Queue()
+
+    def child(queue):
+        start = time.monotonic()
+        with seg:
+            queue.put(time.monotonic() - start)
+
+    with seg:
+        proc = ctx.Process(target=child, args=(queue,))
+        proc.start()
+        time.sleep(0.2)
+    proc.join()
+    assert queue.get() >= 0.15
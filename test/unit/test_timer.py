@@ -1,9 +1,15 @@
 
 import re
 import time
+import random
 import asyncio
+import statistics
 
-from async_flow_control.timer import Timer
+from async_flow_control.timer import Timer, TaskTimer
+from async_flow_control.timer.stats import StreamingStats
+from async_flow_control.decorator import timer_async, task_timer
+
+from async_flow_control.util.exception import ThrottlerInvArg
 
 import pytest
 
@@ -79,3 +85,157 @@ async def test300_verbose():
     ]
     for exp, got in zip(expected, d.data):
         assert re.match(exp, got)
+
+
+# ---------------------------------------------------------------------------
+
+
+def test400_stats():
+    """
+    Streaming statistics compared with exact ones
+    """
+    rnd = random.Random(1)
+    values = [rnd.expovariate(10) for _ in range(20000)]
+    s = StreamingStats()
+    for v in values:
+        s.add(v)
+    assert s.count == 20000
+    assert s.mean == pytest.approx(statistics.mean(values))
+    assert s.variance == pytest.approx(statistics.variance(values))
+    assert s.min == min(values)
+    assert s.max == max(values)
+    values.sort()
+    for p, est in s.quantiles().items():
+        exact = values[int(p*len(values))]
+        assert est == pytest.approx(exact, rel=0.05)
+
+
+def test410_stats_few():
+    s = StreamingStats((0.5,))
+    assert s.quantiles() == {0.5: None}
+    for v in (3, 1, 2):
+        s.add(v)
+    assert s.quantiles() == {0.5: 2}
+    assert s.variance == 1.0
+
+
+@pytest.mark.asyncio
+async def test500_quiet():
+    d = PrintDestination()
+    t = Timer("unit", quiet=True, print_func=d)
+    for _ in range(3):
+        with t:
+            await asyncio.sleep(0.01)
+    assert d.data == []
+    assert t.stats.count == 3
+    assert 0.01 <= t.stats.min <= t.stats.max < 0.02
+    line = t.report()
+    assert d.data == [line]
+    assert re.match(r"unit \| count: 3, mean: 0\.01\d+ s, stdev: [\d.]+ s, "
+                    r"min: [\d.]+ s, max: [\d.]+ s, p50: [\d.]+ s, p95: [\d.]+ s, "
+                    r"p99: [\d.]+ s$", line)
+
+
+def test510_report_interval():
+    d = PrintDestination()
+    t = Timer("unit", quiet=True, report_interval=0.05, print_func=d)
+    for _ in range(4):
+        with t:
+            time.sleep(0.02)
+    assert len(d.data) == 1
+    assert d.data[0].startswith("unit | count: 3,")
+
+
+@pytest.mark.asyncio
+async def test520_decorator_concurrent():
+    """
+    Concurrent calls of a decorated coroutine are measured separately
+    """
+    @timer_async("unit", quiet=True)
+    async def f(t):
+        await asyncio.sleep(t)
+
+    await asyncio.gather(f(0.05), f(0.01))
+    stats = f.timer.stats
+    assert stats.count == 2
+    assert 0.01 <= stats.min < 0.02
+    assert 0.05 <= stats.max < 0.06
+
+
+# ---------------------------------------------------------------------------
+
+
+@pytest.mark.asyncio
+async def test600_task_timer():
+    """
+    On-loop time is separated from suspended time
+    """
+    d = PrintDestination()
+
+    @task_timer("unit", print_func=d, block_threshold=0.03)
+    async def f():
+        time.sleep(0.02)          # on loop
+        await asyncio.sleep(0.05)  # suspended
+        time.sleep(0.04)          # on loop, blocking
+        return 3
+
+    assert await f() == 3
+    t = f.timer
+    assert t.steps == 2
+    assert t.blocking == 1
+    assert 0.06 <= t.on_loop.max < 0.07
+    assert 0.05 <= t.suspended.max < 0.06
+    assert t.wall.max == pytest.approx(t.on_loop.max + t.suspended.max)
+    assert re.match(r"unit \| step blocked the loop: 0.04\d s$", d.data[0])
+    assert re.match(r"unit \| elapsed: 0.11\d s, on loop: 0.06\d s, "
+                    r"suspended: 0.05\d s$", d.data[1])
+
+
+@pytest.mark.asyncio
+async def test610_task_timer_concurrent():
+    """
+    Time spent by other tasks is suspended time
+    """
+    t = TaskTimer("unit", quiet=True, block_threshold=None)
+
+    async def busy():
+        await asyncio.sleep(0)
+        time.sleep(0.05)
+
+    async def idle():
+        await asyncio.sleep(0.01)
+
+    await asyncio.gather(t.measure(idle()), busy())
+    assert t.wall.count == 1
+    assert t.on_loop.max < 0.005
+    assert t.suspended.max >= 0.05
+
+
+@pytest.mark.asyncio
+async def test620_task_timer_errors():
+    t = TaskTimer("unit", quiet=True)
+
+    async def fail():
+        await asyncio.sleep(0)
+        raise ValueError("x")
+
+    with pytest.raises(ValueError):
+        await t.measure(fail())
+
+    task = asyncio.ensure_future(t.measure(asyncio.sleep(1)))
+    await asyncio.sleep(0.01)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert t.wall.count == 2
+
+    d = PrintDestination()
+    t.print = d
+    line = t.report()
+    assert line.startswith("unit | count: 2, steps: 4, blocking: 0 | on loop: mean: ")
+    assert " | suspended: mean: " in line
+
+
+def test630_task_timer_args():
+    with pytest.raises(ThrottlerInvArg):
+        TaskTimer(block_threshold=0)